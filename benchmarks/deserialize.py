@@ -0,0 +1,72 @@
+"""Compare the per-class deserialize plan against the previous strptime based
+field-by-field decoding.
+
+Run with ``python -m benchmarks.deserialize``
+"""
+
+import argparse
+import datetime
+import time
+from typing import Any, Dict
+
+import ujson
+
+from benchmarks.models import Crewman, make_crewman
+from odetam.serialization import DETA_TYPES
+
+
+def legacy_decode(cls, data: Dict[str, Any]) -> Dict[str, Any]:
+    """BaseDetaModel._deserialize as it was before deserialize plans, minus the
+    final parse_obj"""
+    as_dict: Dict[str, Any] = {}
+    for field_name, field in cls.__fields__.items():
+        if field_name not in data:
+            continue
+        elif data.get(field_name) is None:
+            as_dict[field_name] = None
+        elif field.type_ in DETA_TYPES:
+            as_dict[field_name] = data[field_name]
+        elif field.type_ == datetime.datetime:
+            as_dict[field_name] = datetime.datetime.fromtimestamp(data[field_name])
+        elif field.type_ == datetime.date:
+            as_dict[field_name] = datetime.datetime.strptime(
+                str(data[field_name]), "%Y%m%d"
+            ).date()
+        elif field.type_ == datetime.time:
+            as_dict[field_name] = datetime.datetime.strptime(
+                str(data[field_name]), "%H%M%S%f"
+            ).time()
+        else:
+            value = data.get(field_name)
+            try:
+                as_dict[field_name] = ujson.loads(value)
+            except (TypeError, ValueError):
+                as_dict[field_name] = value
+    return as_dict
+
+
+def records_per_second(func, records, runs: int = 3) -> float:
+    best = 0.0
+    for _ in range(runs):
+        start = time.perf_counter()
+        for record in records:
+            func(record)
+        best = max(best, len(records) / (time.perf_counter() - start))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--records", type=int, default=20_000)
+    args = parser.parse_args()
+
+    records = [make_crewman(i)._serialize() for i in range(args.records)]
+    before = records_per_second(lambda record: legacy_decode(Crewman, record), records)
+    after = records_per_second(Crewman._decode, records)
+    print(f"{len(Crewman.__fields__)} fields (including key), {args.records} records")
+    print(f"before: {before:12,.0f} records/sec")
+    print(f"after:  {after:12,.0f} records/sec ({after / before:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""A local stand-in for Deta Base with a configurable delay on every request, so
+benchmarks can run offline while still paying for round trips."""
+
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Union
+
+from deta.base import FetchResponse
+
+Query = Union[Dict[str, Any], List[Dict[str, Any]], None]
+
+
+def _condition_matches(record: Dict[str, Any], condition: str, expected: Any) -> bool:
+    field, _, operator = condition.partition("?")
+    value = record.get(field)
+    if not operator:
+        return value == expected
+    if value is None:
+        return operator == "ne" or operator == "not_contains"
+    if operator == "ne":
+        return value != expected
+    if operator == "lt":
+        return value < expected
+    if operator == "gt":
+        return value > expected
+    if operator == "lte":
+        return value <= expected
+    if operator == "gte":
+        return value >= expected
+    if operator == "r":
+        return expected[0] <= value <= expected[1]
+    if operator == "pfx":
+        return str(value).startswith(expected)
+    if operator == "contains":
+        return expected in value
+    if operator == "not_contains":
+        return expected not in value
+    raise ValueError(f"Unsupported condition {condition}")
+
+
+def matches(record: Dict[str, Any], query: Query) -> bool:
+    if not query:
+        return True
+    if isinstance(query, list):
+        return any(matches(record, branch) for branch in query)
+    return all(
+        _condition_matches(record, condition, expected)
+        for condition, expected in query.items()
+    )
+
+
+class FakeBase:
+    def __init__(
+        self,
+        items: Optional[List[Dict[str, Any]]] = None,
+        latency: float = 0.0,
+        page_size: int = 1000,
+    ):
+        self.latency = latency
+        self.page_size = page_size
+        self.requests = 0
+        self.items: Dict[str, Dict[str, Any]] = {}
+        self._next_key = 0
+        for item in items or []:
+            self._store(item)
+
+    def _store(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        item = dict(item)
+        if not item.get("key"):
+            self._next_key += 1
+            item["key"] = f"{self._next_key:012d}"
+        self.items[item["key"]] = item
+        return item
+
+    def _wait(self):
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _fetch(self, query: Query, limit: int, last: Optional[str]) -> FetchResponse:
+        limit = min(limit, self.page_size)
+        page = []
+        for key in sorted(self.items):
+            if last is not None and key <= last:
+                continue
+            if matches(self.items[key], query):
+                page.append(self.items[key])
+                if len(page) == limit + 1:
+                    break
+        if len(page) > limit:
+            page = page[:limit]
+            return FetchResponse(count=len(page), last=page[-1]["key"], items=page)
+        return FetchResponse(count=len(page), last=None, items=page)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        self._wait()
+        return self.items.get(key)
+
+    def put(self, data: Dict[str, Any], key: Optional[str] = None) -> Dict[str, Any]:
+        self._wait()
+        if key:
+            data = {**data, "key": key}
+        return self._store(data)
+
+    def put_many(self, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+        assert len(items) <= 25, "We can't put more than 25 items at a time."
+        self._wait()
+        return {"processed": {"items": [self._store(item) for item in items]}}
+
+    def delete(self, key: str) -> None:
+        self._wait()
+        self.items.pop(key, None)
+
+    def fetch(
+        self, query: Query = None, limit: int = 1000, last: Optional[str] = None
+    ) -> FetchResponse:
+        self._wait()
+        return self._fetch(query, limit, last)
+
+
+class AsyncFakeBase(FakeBase):
+    async def _await(self):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        await self._await()
+        return self.items.get(key)
+
+    async def put(
+        self, data: Dict[str, Any], key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        await self._await()
+        if key:
+            data = {**data, "key": key}
+        return self._store(data)
+
+    async def put_many(self, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+        assert len(items) <= 25, "We can't put more than 25 items at a time."
+        await self._await()
+        return {"processed": {"items": [self._store(item) for item in items]}}
+
+    async def delete(self, key: str) -> None:
+        await self._await()
+        self.items.pop(key, None)
+
+    async def fetch(
+        self, query: Query = None, *, limit: int = 1000, last: Optional[str] = None
+    ) -> FetchResponse:
+        await self._await()
+        return self._fetch(query, limit, last)
+
+    async def close(self):
+        pass
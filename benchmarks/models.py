@@ -0,0 +1,83 @@
+"""Models and record generators shared by the benchmarks."""
+
+import datetime
+import ipaddress
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel
+
+from odetam import DetaModel
+from odetam.async_model import AsyncDetaModel
+
+
+class Address(BaseModel):
+    street: str
+    city: str
+    postcode: str
+
+
+class CrewmanFields(BaseModel):
+    """20 fields mixing every kind of conversion odetam does"""
+
+    name: str
+    rank: str
+    email: str
+    age: int
+    height: float
+    active: bool
+    nickname: Optional[str]
+    joined: datetime.date
+    birthday: datetime.date
+    shift_start: datetime.time
+    shift_end: datetime.time
+    updated: datetime.datetime
+    last_login: datetime.datetime
+    ships: List[str]
+    scores: List[int]
+    tags: List[str]
+    extra: Dict[str, Any]
+    address: Address
+    previous_addresses: List[Address]
+    ip: ipaddress.IPv4Address
+
+
+class Crewman(CrewmanFields, DetaModel):
+    class Config:
+        table_name = "benchmark_crewman"
+
+
+class AsyncCrewman(CrewmanFields, AsyncDetaModel):
+    class Config:
+        table_name = "benchmark_async_crewman"
+
+
+def make_crewman(i: int) -> Crewman:
+    return Crewman(
+        name=f"Crewman {i}",
+        rank="Ensign",
+        email=f"crewman{i}@starfleet.example",
+        age=20 + i % 40,
+        height=1.5 + (i % 50) / 100,
+        active=i % 2 == 0,
+        nickname=None if i % 3 else f"nick{i}",
+        joined=datetime.date(2250 + i % 100, 1 + i % 12, 1 + i % 28),
+        birthday=datetime.date(2220 + i % 30, 1 + i % 12, 1 + i % 28),
+        shift_start=datetime.time(10 + i % 12, i % 60, i % 60, i % 1000),
+        shift_end=datetime.time(12 + i % 12, i % 60, i % 60),
+        updated=datetime.datetime(2021, 8, 1, 20, 26, 51, i % 1000),
+        last_login=datetime.datetime(2021, 9, 1, 8, 0, i % 60),
+        ships=["Enterprise", "Defiant", f"Runabout {i}"],
+        scores=[i, i + 1, i + 2],
+        tags=["command", "science"],
+        extra={"notes": "none", "level": i % 10},
+        address={
+            "street": f"{i} Main St",
+            "city": "San Francisco",
+            "postcode": "94016",
+        },
+        previous_addresses=[
+            {"street": "1 Academy Way", "city": "San Francisco", "postcode": "94016"}
+        ],
+        ip=f"10.0.{i % 255}.{i % 254 + 1}",
+        key=f"key{i:08d}",
+    )
@@ -0,0 +1,78 @@
+"""Compare running an OR query as a single paginated fetch against fetching each
+condition separately and concurrently (query(..., parallel_or=True)).
+
+Run with ``python -m benchmarks.or_query``
+"""
+
+import argparse
+import asyncio
+import time
+
+from benchmarks.fake_base import AsyncFakeBase, FakeBase
+from benchmarks.models import AsyncCrewman, Crewman, make_crewman
+
+RANKS = ["Ensign", "Lieutenant", "Commander", "Captain"]
+
+
+def balanced_query(model):
+    """Conditions that each match about the same number of records"""
+    return (
+        (model.rank == "Ensign")
+        | (model.rank == "Lieutenant")
+        | (model.rank == "Commander")
+        | (model.rank == "Captain")
+    )
+
+
+def skewed_query(model):
+    """Conditions with very different selectivity"""
+    return (
+        (model.rank == "Ensign")
+        | (model.name == "Crewman 5")
+        | (model.age == 21)
+        | model.name.prefix("Crewman 99")
+    )
+
+
+def run(model, base, query, parallel_or):
+    model._db = base
+    start = time.perf_counter()
+    if issubclass(model, AsyncCrewman):
+        results = asyncio.run(model.query(query, parallel_or=parallel_or))
+    else:
+        model._new_db = lambda: base
+        results = model.query(query, parallel_or=parallel_or)
+    return time.perf_counter() - start, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--records", type=int, default=4000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--page-size", type=int, default=100)
+    args = parser.parse_args()
+
+    records = []
+    for i in range(args.records):
+        record = make_crewman(i)._serialize()
+        record["rank"] = RANKS[i % len(RANKS)]
+        records.append(record)
+
+    print(
+        f"{args.records} records, {args.latency * 1000:.0f}ms latency, "
+        f"{args.page_size} records per page"
+    )
+    for name, make_query in (("balanced", balanced_query), ("skewed", skewed_query)):
+        for model, base_class in ((Crewman, FakeBase), (AsyncCrewman, AsyncFakeBase)):
+            for parallel_or in (False, True):
+                base = base_class(records, args.latency, args.page_size)
+                elapsed, results = run(model, base, make_query(model), parallel_or)
+                print(
+                    f"{name:8} {model.__name__:12} parallel_or={parallel_or!s:5} "
+                    f"{len(results):5} results {base.requests:3} requests "
+                    f"{elapsed:7.3f}s"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Compare the per-class serialize plan against the previous field-by-field
+implementation.
+
+Run with ``python -m benchmarks.serialize``
+"""
+
+import argparse
+import datetime
+import time
+from typing import Any, Dict
+
+import ujson
+
+from benchmarks.models import Crewman, make_crewman
+from odetam.serialization import DETA_TYPES
+
+
+def legacy_serialize(self) -> Dict[str, Any]:
+    """BaseDetaModel._serialize as it was before serialize plans"""
+    as_dict: Dict[str, Any] = {}
+    for field_name, field in self.__class__.__fields__.items():
+        if field_name == "key" and not self.key:
+            continue
+        elif getattr(self, field_name, None) is None:
+            as_dict[field_name] = None
+        elif field.type_ in DETA_TYPES:
+            as_dict[field_name] = getattr(self, field_name)
+        elif field.type_ == datetime.datetime:
+            as_dict[field_name] = getattr(self, field_name).timestamp()
+        elif field.type_ == datetime.date:
+            as_dict[field_name] = int(getattr(self, field_name).strftime("%Y%m%d"))
+        elif field.type_ == datetime.time:
+            as_dict[field_name] = int(getattr(self, field_name).strftime("%H%M%S%f"))
+        else:
+            as_dict[field_name] = ujson.loads(self.json(include={field_name}))[
+                field_name
+            ]
+    return as_dict
+
+
+def records_per_second(func, records) -> float:
+    start = time.perf_counter()
+    for record in records:
+        func(record)
+    return len(records) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--records", type=int, default=20_000)
+    args = parser.parse_args()
+
+    records = [make_crewman(i) for i in range(args.records)]
+    for record in records[:100]:
+        assert legacy_serialize(record) == record._serialize()
+
+    before = records_per_second(legacy_serialize, records)
+    after = records_per_second(Crewman._serialize, records)
+    print(f"{len(Crewman.__fields__)} fields (including key), {args.records} records")
+    print(f"before: {before:12,.0f} records/sec")
+    print(f"after:  {after:12,.0f} records/sec ({after / before:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""Run every benchmark at several dataset sizes against the local fake base, and
+report records/sec, p50 and p99 time per run and peak memory. Results can be
+saved as JSON and compared with the results of another commit.
+
+Run with ``python -m benchmarks.suite``, for example::
+
+    python -m benchmarks.suite --output before.json
+    git checkout my-branch
+    python -m benchmarks.suite --output after.json --compare before.json
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from benchmarks.fake_base import AsyncFakeBase, FakeBase
+from benchmarks.models import AsyncCrewman, Crewman, make_crewman
+from benchmarks.or_query import RANKS, balanced_query
+
+# builds the function to time, sync or async, for a dataset size and latency
+Setup = Callable[[int, float, int], Callable[[], Any]]
+
+
+class Result(NamedTuple):
+    case: str
+    size: int
+    # records returned by one run
+    records: int
+    runs: int
+    records_per_second: float
+    p50: float
+    p99: float
+    # bytes, peak allocated by python during one run
+    peak_memory: int
+
+
+def percentile(samples: Sequence[float], fraction: float) -> float:
+    """Nearest rank percentile"""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(fraction * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def make_records(size: int) -> List[Dict[str, Any]]:
+    """Serialized crewmen, with ranks spread evenly for the OR queries"""
+    records = []
+    for i in range(size):
+        record = make_crewman(i)._serialize()
+        record["rank"] = RANKS[i % len(RANKS)]
+        records.append(record)
+    return records
+
+
+def _serialize(size: int, latency: float, page_size: int) -> Callable[[], Any]:
+    crewmen = [make_crewman(i) for i in range(size)]
+    return lambda: [crewman._serialize() for crewman in crewmen]
+
+
+def _deserialize(size: int, latency: float, page_size: int) -> Callable[[], Any]:
+    records = make_records(size)
+    return lambda: [Crewman._deserialize(record) for record in records]
+
+
+def _sync_base(size: int, latency: float, page_size: int) -> FakeBase:
+    base = FakeBase(make_records(size), latency, page_size)
+    Crewman._db = base
+    Crewman._new_db = lambda: base
+    return base
+
+
+def _async_base(size: int, latency: float, page_size: int) -> AsyncFakeBase:
+    base = AsyncFakeBase(make_records(size), latency, page_size)
+    AsyncCrewman._db = base
+    return base
+
+
+def _get_all(size: int, latency: float, page_size: int) -> Callable[[], Any]:
+    _sync_base(size, latency, page_size)
+    return Crewman.get_all
+
+
+def _query_and(size: int, latency: float, page_size: int) -> Callable[[], Any]:
+    _sync_base(size, latency, page_size)
+    return lambda: Crewman.query((Crewman.age >= 30) & (Crewman.active == True))
+
+
+def _query_or(size: int, latency: float, page_size: int) -> Callable[[], Any]:
+    _sync_base(size, latency, page_size)
+    return lambda: Crewman.query(balanced_query(Crewman))
+
+
+def _put_many(size: int, latency: float, page_size: int) -> Callable[[], Any]:
+    _sync_base(0, latency, page_size)
+    crewmen = [make_crewman(i) for i in range(size)]
+    return lambda: Crewman.put_many(crewmen)
+
+
+def _async_get_all(size: int, latency: float, page_size: int) -> Callable[[], Any]:
+    _async_base(size, latency, page_size)
+    return AsyncCrewman.get_all
+
+
+def _async_query_and(size: int, latency: float, page_size: int) -> Callable[[], Any]:
+    _async_base(size, latency, page_size)
+    query = (AsyncCrewman.age >= 30) & (AsyncCrewman.active == True)
+    return lambda: AsyncCrewman.query(query)
+
+
+def _async_query_or(size: int, latency: float, page_size: int) -> Callable[[], Any]:
+    _async_base(size, latency, page_size)
+    return lambda: AsyncCrewman.query(balanced_query(AsyncCrewman))
+
+
+def _async_put_many(size: int, latency: float, page_size: int) -> Callable[[], Any]:
+    _async_base(0, latency, page_size)
+    crewmen = [AsyncCrewman._deserialize(record) for record in make_records(size)]
+    return lambda: AsyncCrewman.put_many(crewmen)
+
+
+CASES: Dict[str, Setup] = {
+    "serialize": _serialize,
+    "deserialize": _deserialize,
+    "get_all": _get_all,
+    "query_and": _query_and,
+    "query_or": _query_or,
+    "put_many": _put_many,
+    "async_get_all": _async_get_all,
+    "async_query_and": _async_query_and,
+    "async_query_or": _async_query_or,
+    "async_put_many": _async_put_many,
+}
+
+
+def _time_runs(run: Callable[[], Any], runs: int) -> Tuple[List[float], Any]:
+    """Time every run, running async cases in one event loop"""
+
+    async def _time_async() -> Tuple[List[float], Any]:
+        samples = []
+        result = None
+        for _ in range(runs):
+            start = time.perf_counter()
+            result = await run()
+            samples.append(time.perf_counter() - start)
+        return samples, result
+
+    start = time.perf_counter()
+    result = run()
+    if asyncio.iscoroutine(result):
+        # the first call only created the coroutine, it has not run yet
+        result.close()
+        return asyncio.run(_time_async())
+    samples = [time.perf_counter() - start]
+    for _ in range(runs - 1):
+        start = time.perf_counter()
+        result = run()
+        samples.append(time.perf_counter() - start)
+    return samples, result
+
+
+def _peak_memory(run: Callable[[], Any]) -> int:
+    """Peak memory of a single run, measured apart from the timed runs since
+    tracemalloc slows everything down"""
+    tracemalloc.start()
+    try:
+        result = run()
+        if asyncio.iscoroutine(result):
+            asyncio.run(result)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_case(case: str, size: int, latency: float, page_size: int, runs: int) -> Result:
+    run = CASES[case](size, latency, page_size)
+    samples, result = _time_runs(run, runs)
+    records = len(result)
+    p50 = percentile(samples, 0.5)
+    return Result(
+        case=case,
+        size=size,
+        records=records,
+        runs=runs,
+        records_per_second=records / p50 if p50 else 0.0,
+        p50=p50,
+        p99=percentile(samples, 0.99),
+        peak_memory=_peak_memory(run),
+    )
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: List[Result], baseline: Dict[str, Any], threshold: float) -> int:
+    """Print the change in records/sec since the baseline, returning how many
+    cases got slower by more than threshold"""
+    before = {
+        (result["case"], result["size"]): result for result in baseline["results"]
+    }
+    print(f"\ncompared with {baseline['meta'].get('commit') or 'baseline'}")
+    regressions = 0
+    for result in results:
+        old = before.get((result.case, result.size))
+        if old is None or not old["records_per_second"]:
+            continue
+        change = result.records_per_second / old["records_per_second"] - 1
+        flag = ""
+        if change < -threshold:
+            regressions += 1
+            flag = "  REGRESSION"
+        print(f"{result.case:16} {result.size:>7} {change:+8.1%}{flag}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--sizes", default="100,1000,10000", help="dataset sizes, comma separated"
+    )
+    parser.add_argument(
+        "--cases",
+        default=",".join(CASES),
+        help=f"cases to run, comma separated, from {', '.join(CASES)}",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="seconds added to every request"
+    )
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--runs", type=int, default=10, help="timed runs per case")
+    parser.add_argument("--output", help="save the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="slowdown reported as a regression when comparing, 0.1 is 10%%",
+    )
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    cases = args.cases.split(",")
+    for case in cases:
+        if case not in CASES:
+            parser.error(f"unknown case {case}")
+
+    print(
+        f"{args.latency * 1000:.1f}ms latency, {args.page_size} records per page, "
+        f"{args.runs} runs"
+    )
+    print(
+        f"{'case':16} {'size':>7} {'records/sec':>13} {'p50 ms':>9} {'p99 ms':>9} "
+        f"{'peak MiB':>9}"
+    )
+    results = []
+    for case in cases:
+        for size in sizes:
+            result = run_case(case, size, args.latency, args.page_size, args.runs)
+            results.append(result)
+            print(
+                f"{result.case:16} {result.size:>7} "
+                f"{result.records_per_second:13,.0f} {result.p50 * 1000:9.2f} "
+                f"{result.p99 * 1000:9.2f} {result.peak_memory / 2**20:9.2f}"
+            )
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(
+                {
+                    "meta": {
+                        "commit": _git_commit(),
+                        "created": datetime.datetime.now().isoformat(),
+                        "python": platform.python_version(),
+                        "latency": args.latency,
+                        "page_size": args.page_size,
+                        "runs": args.runs,
+                    },
+                    "results": [result._asdict() for result in results],
+                },
+                output,
+                indent=2,
+            )
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            return 1 if compare(results, json.load(baseline), args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
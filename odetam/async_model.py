@@ -1,21 +1,60 @@
-from typing import Any, Dict, List, Optional, Type, TypeVar, Union
+import asyncio
+import time
+from contextlib import asynccontextmanager, suppress
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
 
-from deta import AsyncBase, Deta
+from deta import AsyncBase
 from deta.base import FetchResponse
 
+from odetam import batch as batches
+from odetam import instrumentation, registry, retry, session
 from odetam.exceptions import DetaError, InvalidKey, ItemNotFound
-from odetam.model import BaseDetaModel, DetaModelMetaClass, handle_db_property
+from odetam.field import DetaField, DetaUpdate
+from odetam.instrumentation import Trip
+from odetam.model import (
+    BaseDetaModel,
+    DeleteResult,
+    DetaModelMetaClass,
+    _snapshot,
+    handle_db_property,
+)
+from odetam.optimizer import NO_MATCHES
 from odetam.query import DetaQuery, DetaQueryList, DetaQueryStatement
 
 
 class AsyncDetaModelMetaClass(DetaModelMetaClass):
     @property
     def __db__(cls):
+        if cls._db is not None:
+            return cls._db
+        backend = getattr(cls.Config, "backend", None)
+        if backend is not None:
+            cls._db = registry.get_backend_base(
+                backend,
+                cls.__db_name__,
+                asynchronous=True,
+                model=cls,
+                indexes=getattr(cls.Config, "indexes", None),
+            )
+            return cls._db
         if getattr(cls.Config, "deta_key", None) is not None:
-            deta = Deta(cls.Config.deta_key)
-            return handle_db_property(cls, deta.AsyncBase)
-
-        return handle_db_property(cls, AsyncBase)
+            base_class = registry.get_deta(cls.Config.deta_key).AsyncBase
+        else:
+            base_class = AsyncBase
+        return handle_db_property(
+            cls, lambda name: session.attach(base_class(name)), asynchronous=True
+        )
 
 
 T = TypeVar("T", bound="AsyncDetaModel")
@@ -23,10 +62,12 @@ T = TypeVar("T", bound="AsyncDetaModel")
 
 class AsyncDetaModel(BaseDetaModel, metaclass=AsyncDetaModelMetaClass):
     @classmethod
-    async def get(cls: Type[T], key: str) -> T:
+    async def get(cls: Type[T], key: str, trusted: Optional[bool] = None) -> T:
         """
         Get a single instance
         :param key: Deta database key
+        :param trusted: skip validation of the record, defaults to
+            Config.trusted_reads
         :return: object found in database serialized into its pydantic object
 
         :raises ItemNotFound: No matching item was found
@@ -34,87 +75,635 @@ class AsyncDetaModel(BaseDetaModel, metaclass=AsyncDetaModelMetaClass):
         if key is None:
             raise InvalidKey("key cannot be None")
 
-        item: Dict[str, Any] = await cls.__db__.get(key)
-        return cls._return_item_or_raise(item)
+        cache = cls.__cache__
+        trip = None
+        if cache is None:
+            trip = instrumentation.start(cls, "get")
+            item: Optional[Dict[str, Any]] = await cls._call("get", key, trip=trip)
+        else:
+            item = cache.get(key)
+            if item is None:
+                generation = cache.generation
+                trip = instrumentation.start(cls, "get")
+                item = await cls._call("get", key, trip=trip)
+                cls._cache_record(key, item, generation)
+        try:
+            return cls._return_item_or_raise(item, trusted=trusted, trip=trip)
+        finally:
+            instrumentation.emit(trip)
 
     @classmethod
-    async def get_or_none(cls: Type[T], key: str) -> Optional[T]:
+    async def get_or_none(
+        cls: Type[T], key: str, trusted: Optional[bool] = None
+    ) -> Optional[T]:
         """Try to get item by key or return None if item not found"""
         try:
-            return await cls.get(key)
+            return await cls.get(key, trusted=trusted)
         except ItemNotFound:
             return None
 
     @classmethod
-    async def get_all(cls: Type[T]) -> List[T]:
-        """Get all the records from the database"""
-        response: FetchResponse = await cls.__db__.fetch()
-        records: List[Dict[str, Any]] = response.items
-        while response.last:
-            response = await cls.__db__.fetch(last=response.last)
-            records += response.items
+    async def get_many(
+        cls: Type[T],
+        keys: List[str],
+        trusted: Optional[bool] = None,
+        max_concurrency: Optional[int] = None,
+    ) -> List[Optional[T]]:
+        """Get several instances by key concurrently
+
+        :param keys: Deta database keys
+        :param trusted: skip validation of the records, defaults to
+            Config.trusted_reads
+        :param max_concurrency: most requests to have in flight at once, defaults
+            to Config.max_concurrency or 8
+        :return: the objects in the same order as keys, with None for any key that
+            was not found
+        """
+        unique_keys = cls._unique_keys(keys)
+        semaphore = asyncio.Semaphore(cls._max_concurrency(max_concurrency))
+
+        async def _get(key: str) -> Optional[Dict[str, Any]]:
+            async with semaphore:
+                return await cls._call("get", key)
+
+        items = await asyncio.gather(*(_get(key) for key in unique_keys))
+        trip = instrumentation.start(cls, "decode")
+        try:
+            found = {
+                key: cls._item_or_none(item, trusted=trusted, trip=trip)
+                for key, item in zip(unique_keys, items)
+            }
+        finally:
+            if trip is not None:
+                trip.items = sum(item is not None for item in items)
+            instrumentation.emit(trip)
+        return [found[key] for key in keys]
+
+    @classmethod
+    async def _fetch_pages_in_order(
+        cls,
+        query: Union[Dict[str, Any], List[Any], None] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[FetchResponse]:
+        """Fetch one page at a time, following the last key until the end, or until
+        limit items have been fetched"""
+        async for response, trip in cls._fetch_page_trips_in_order(query, limit):
+            instrumentation.emit(trip)
+            yield response
+
+    @classmethod
+    async def _fetch_page_trips_in_order(
+        cls,
+        query: Union[Dict[str, Any], List[Any], None] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[Tuple[FetchResponse, Optional[Trip]]]:
+        """Like _fetch_pages_in_order, with the trip of every page, for the caller
+        to emit once it has decoded the page"""
+        if query is NO_MATCHES:
+            return
+        args = () if query is None else (query,)
+        last = None
+        remaining = limit
+        page = 0
+        while True:
+            trip = instrumentation.start(cls, "fetch", query, page)
+            page += 1
+            # a failed page is retried from the same last key
+            response: FetchResponse = await cls._call(
+                "fetch", *args, trip=trip, **cls._fetch_kwargs(last, remaining)
+            )
+            yield response, trip
+            last = response.last
+            if remaining is not None:
+                remaining -= len(response.items)
+                if remaining <= 0:
+                    return
+            if not last:
+                return
+
+    @classmethod
+    async def _fetch_pages(
+        cls,
+        query: Union[Dict[str, Any], List[Any], None] = None,
+        prefetch: int = 1,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[FetchResponse]:
+        """Fetch one page at a time, following the last key until the end, or until
+        limit items have been fetched.
+
+        :param prefetch: how many pages may be fetched ahead of the one being
+            consumed, in a background task. 0 fetches each page only when it is
+            needed.
+        """
+        pages = cls._fetch_page_trips(query, prefetch=prefetch, limit=limit)
+        try:
+            async for response, trip in pages:
+                instrumentation.emit(trip)
+                yield response
+        finally:
+            await pages.aclose()
+
+    @classmethod
+    async def _fetch_page_trips(
+        cls,
+        query: Union[Dict[str, Any], List[Any], None] = None,
+        prefetch: int = 1,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[Tuple[FetchResponse, Optional[Trip]]]:
+        """Like _fetch_pages, with the trip of every page, for the caller to emit
+        once it has decoded the page"""
+        if prefetch < 1:
+            async for page in cls._fetch_page_trips_in_order(query, limit=limit):
+                yield page
+            return
+
+        pages: asyncio.Queue = asyncio.Queue()
+        slots = asyncio.Semaphore(prefetch)
+
+        async def _fetch_ahead():
+            in_order = cls._fetch_page_trips_in_order(query, limit=limit)
+            try:
+                while True:
+                    await slots.acquire()
+                    try:
+                        page = await in_order.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    pages.put_nowait((page, None))
+                pages.put_nowait((None, None))
+            except asyncio.CancelledError:
+                raise
+            except BaseException as error:
+                pages.put_nowait((None, error))
+
+        fetcher = asyncio.ensure_future(_fetch_ahead())
+        try:
+            while True:
+                page, error = await pages.get()
+                if error is not None:
+                    raise error
+                if page is None:
+                    break
+                slots.release()
+                yield page
+        finally:
+            fetcher.cancel()
+            with suppress(asyncio.CancelledError):
+                await fetcher
+
+    @classmethod
+    async def _aiter_models(
+        cls: Type[T],
+        query: Union[Dict[str, Any], List[Any], None],
+        trusted: Optional[bool],
+        fields: Optional[Sequence[str]],
+        prefetch: int,
+        limit: Optional[int],
+    ) -> AsyncIterator[T]:
+        model = cls._model_for_fields(fields)
+        pages = cls._fetch_page_trips(query, prefetch=prefetch, limit=limit)
+        try:
+            async for response, trip in pages:
+                try:
+                    for record in response.items[:limit]:
+                        yield model._deserialize(record, trusted=trusted, trip=trip)
+                finally:
+                    instrumentation.emit(trip)
+                if limit is not None:
+                    limit -= len(response.items)
+        finally:
+            # make sure the background fetch is cancelled as soon as we are closed
+            await pages.aclose()
+
+    @classmethod
+    def aiter_all(
+        cls: Type[T],
+        trusted: Optional[bool] = None,
+        prefetch: int = 1,
+        limit: Optional[int] = None,
+        fields: Optional[Sequence[str]] = None,
+    ) -> AsyncIterator[T]:
+        """Iterate over all the records in the database. The next page is fetched
+        in the background while the current one is being consumed.
+
+        :param prefetch: number of pages to fetch ahead of the current one
+        :param limit: stop after this many records
+        :param fields: only decode these fields (and key), returning partial
+            models that only have those fields
+        """
+        return cls._aiter_models(None, trusted, fields, prefetch, limit)
+
+    @classmethod
+    def aiter_query(
+        cls: Type[T],
+        query_statement: Union[DetaQuery, DetaQueryStatement, DetaQueryList],
+        trusted: Optional[bool] = None,
+        prefetch: int = 1,
+        limit: Optional[int] = None,
+        fields: Optional[Sequence[str]] = None,
+    ) -> AsyncIterator[T]:
+        """Iterate over items matching the query. The next page is fetched in the
+        background while the current one is being consumed.
+
+        :param prefetch: number of pages to fetch ahead of the current one
+        :param limit: stop after this many records
+        :param fields: only decode these fields (and key), returning partial
+            models that only have those fields
+        """
+        return cls._aiter_models(
+            cls._as_query(query_statement), trusted, fields, prefetch, limit
+        )
+
+    @classmethod
+    async def get_all(
+        cls: Type[T],
+        trusted: Optional[bool] = None,
+        limit: Optional[int] = None,
+        fields: Optional[Sequence[str]] = None,
+    ) -> List[T]:
+        """Get all the records from the database
 
-        return [cls._deserialize(record) for record in records]
+        :param limit: stop after this many records
+        :param fields: only decode these fields (and key), returning partial
+            models that only have those fields
+        """
+        return [
+            record
+            async for record in cls.aiter_all(
+                trusted=trusted, limit=limit, fields=fields
+            )
+        ]
 
     @classmethod
     async def query(
-        cls: Type[T], query_statement: Union[DetaQuery, DetaQueryStatement, DetaQueryList]
+        cls: Type[T],
+        query_statement: Union[DetaQuery, DetaQueryStatement, DetaQueryList],
+        trusted: Optional[bool] = None,
+        parallel_or: bool = False,
+        max_concurrency: Optional[int] = None,
+        limit: Optional[int] = None,
+        fields: Optional[Sequence[str]] = None,
     ) -> List[T]:
-        """Get items from database based on the query."""
-        response: FetchResponse = await cls.__db__.fetch(query_statement.as_query())
-        records: List[Dict[str, Any]] = response.items
-        while response.last:
-            response = await cls.__db__.fetch(
-                query_statement.as_query(), last=response.last
+        """Get items from database based on the query.
+
+        :param parallel_or: run each condition of an OR query as its own fetch,
+            concurrently, and merge the results. Useful for large ORs or ORs whose
+            conditions match very different numbers of items.
+        :param max_concurrency: most conditions to fetch at once for parallel_or,
+            defaults to Config.max_concurrency or 8
+        :param limit: stop fetching once this many items have been found
+        :param fields: only decode these fields (and key), returning partial
+            models that only have those fields
+
+        With Config.query_cache_size set, the records found are cached by the
+        canonical form of the query until the next write through this model.
+        """
+        model = cls._model_for_fields(fields)
+        query_statement = cls._optimize(query_statement)
+        if query_statement is None:
+            return []
+        cache = cls.__query_cache__
+        if cache is None:
+            records = await cls._query_records(
+                query_statement, parallel_or, max_concurrency, limit
             )
-            records += response.items
+        else:
+            cache_key = cls._query_cache_key(query_statement, limit)
+            records = cache.get(cache_key)
+            if records is None:
+                records = await cls._query_records(
+                    query_statement, parallel_or, max_concurrency, limit
+                )
+                cache.set(cache_key, records)
+        return model._deserialize_records(records, trusted=trusted)
+
+    @classmethod
+    async def _query_records(
+        cls,
+        query_statement: Union[DetaQuery, DetaQueryStatement, DetaQueryList],
+        parallel_or: bool,
+        max_concurrency: Optional[int],
+        limit: Optional[int],
+    ) -> List[Dict[str, Any]]:
+        """The raw records matching the query, in Deta's order"""
+        if not (parallel_or and isinstance(query_statement, DetaQueryList)):
+            records = []
+            pages = cls._fetch_pages(query_statement.as_query(), limit=limit)
+            try:
+                async for response in pages:
+                    records.extend(response.items)
+            finally:
+                await pages.aclose()
+            return records[:limit]
 
-        return [cls._deserialize(item) for item in records]
+        semaphore = asyncio.Semaphore(cls._max_concurrency(max_concurrency))
+
+        async def _fetch_branch(query: Dict[str, Any]) -> List[Dict[str, Any]]:
+            async with semaphore:
+                return [
+                    record
+                    async for response in cls._fetch_pages_in_order(query, limit=limit)
+                    for record in response.items
+                ]
+
+        branches = await asyncio.gather(
+            *(_fetch_branch(query) for query in query_statement.as_query())
+        )
+        return cls._merge_branches(branches, limit=limit)
+
+    @classmethod
+    async def query_first(
+        cls: Type[T],
+        query_statement: Union[DetaQuery, DetaQueryStatement, DetaQueryList],
+        trusted: Optional[bool] = None,
+    ) -> Optional[T]:
+        """Get the first item matching the query, or None if nothing matches. Only
+        fetches until a match is found."""
+        items = await cls.query(query_statement, trusted=trusted, limit=1)
+        return items[0] if items else None
+
+    @classmethod
+    async def query_exists(
+        cls, query_statement: Union[DetaQuery, DetaQueryStatement, DetaQueryList]
+    ) -> bool:
+        """Check whether anything matches the query, without building any models"""
+        async for response in cls._fetch_pages_in_order(
+            cls._as_query(query_statement), limit=1
+        ):
+            if response.items:
+                return True
+        return False
+
+    @classmethod
+    async def query_count(
+        cls,
+        query_statement: Union[
+            DetaQuery, DetaQueryStatement, DetaQueryList, None
+        ] = None,
+    ) -> int:
+        """Count the items matching the query, or all items with no query. Uses the
+        count reported by Deta for each page, nothing is deserialized."""
+        query = None if query_statement is None else cls._as_query(query_statement)
+        total = 0
+        async for response in cls._fetch_pages_in_order(query):
+            total += response.count
+        return total
 
     @classmethod
     async def delete_key(cls, key: str) -> None:
         """Delete an item based on the key"""
-        await cls.__db__.delete(key)
+        batch = batches.current_batch(asynchronous=True)
+        if batch is not None:
+            batch.delete(cls, key)
+            return
+        try:
+            await cls._call("delete", key)
+        finally:
+            cls._invalidate([key])
 
     @classmethod
-    async def put_many(cls: Type[T], items: List[T]) -> List[T]:
-        """Put multiple instances at once
+    async def delete_many(
+        cls, keys: List[str], max_concurrency: Optional[int] = None
+    ) -> DeleteResult:
+        """Delete several items by key concurrently
+
+        :param keys: Deta database keys
+        :param max_concurrency: most requests to have in flight at once, defaults
+            to Config.max_concurrency or 8
+        :return: how many keys were deleted and which ones failed
+        """
+        unique_keys = cls._unique_keys(keys)
+        semaphore = asyncio.Semaphore(cls._max_concurrency(max_concurrency))
+
+        async def _delete(key: str) -> bool:
+            async with semaphore:
+                try:
+                    await cls._call("delete", key)
+                except Exception:
+                    return False
+            return True
+
+        results = await asyncio.gather(*(_delete(key) for key in unique_keys))
+        # a failed delete may still have gone through
+        cls._invalidate(unique_keys)
+        return DeleteResult(
+            deleted=sum(results),
+            failed=[key for key, deleted in zip(unique_keys, results) if not deleted],
+        )
+
+    @classmethod
+    async def delete_where(
+        cls,
+        query_statement: Union[DetaQuery, DetaQueryStatement, DetaQueryList],
+        max_concurrency: Optional[int] = None,
+    ) -> DeleteResult:
+        """Delete every item matching the query. Matches are fetched page by page
+        and deleted by key, without being turned into models. The next page is
+        fetched while the current one is being deleted.
+
+        :param max_concurrency: most delete requests to have in flight at once,
+            defaults to Config.max_concurrency or 8
+        :return: how many keys were deleted and which ones failed
+        """
+        deleted = 0
+        failed: List[str] = []
+        pages = cls._fetch_pages(cls._as_query(query_statement))
+        try:
+            async for response in pages:
+                result = await cls.delete_many(
+                    [item["key"] for item in response.items],
+                    max_concurrency=max_concurrency,
+                )
+                deleted += result.deleted
+                failed.extend(result.failed)
+        finally:
+            await pages.aclose()
+        return DeleteResult(deleted=deleted, failed=failed)
+
+    @classmethod
+    async def put_many(
+        cls: Type[T],
+        items: List[T],
+        trusted: Optional[bool] = None,
+        max_concurrency: Optional[int] = None,
+    ) -> List[T]:
+        """Put multiple instances at once. Items are sent in batches of 25, several
+        batches at a time.
 
         :param items: List of pydantic objects to put in the database
-        :returns: List of items successfully added, serialized with pydantic
+        :param trusted: skip validation of the returned records, defaults to
+            Config.trusted_reads
+        :param max_concurrency: most batches to have in flight at once, defaults
+            to Config.max_concurrency or 8
+        :returns: List of items successfully added, serialized with pydantic, in
+            the same order as the input
         """
-        records = []
-        processed: List[Dict[str, Any]] = []
-        for item in items:
-            exclude = set()
-            if item.key is None:
-                exclude = {"key"}
-            # noinspection PyProtectedMember
-            records.append(item._serialize(exclude=exclude))
-            if len(records) == 25:
-                result = await cls.__db__.put_many(records)
-                processed.extend(result["processed"]["items"])
-                records = []
-        if records:
-            result = await cls.__db__.put_many(records)
-            processed.extend(result["processed"]["items"])
-
-        return [cls._deserialize(record) for record in processed]
+        return cls._deserialize_records(
+            [
+                record
+                for processed in await cls._put_records(
+                    items, max_concurrency=max_concurrency
+                )
+                for record in processed
+            ],
+            trusted=trusted,
+        )
+
+    @classmethod
+    async def _put_records(
+        cls, items: List[T], max_concurrency: Optional[int] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """Put items in batches of 25, returning the records Deta processed for
+        each batch"""
+        semaphore = asyncio.Semaphore(cls._max_concurrency(max_concurrency))
+
+        async def _put_batch(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+            async with semaphore:
+                result = await cls._call(
+                    "put_many",
+                    records,
+                    idempotent=all("key" in record for record in records),
+                )
+            return result["processed"]["items"]
+
+        try:
+            return await asyncio.gather(
+                *(_put_batch(records) for records in cls._serialize_batches(items))
+            )
+        finally:
+            cls._invalidate(item.key for item in items)
+
+    @classmethod
+    @asynccontextmanager
+    async def batching(
+        cls, max_concurrency: Optional[int] = None
+    ) -> AsyncIterator[batches.Batch]:
+        """Hold back save() and delete() of every async model until the end of the
+        block, then put the saved items with put_many, 25 at a time, and delete
+        the deleted keys with delete_many. Keys for new items are set when the
+        batch is sent. Nothing is sent if the block raises, a batch inside
+        another one is sent with the outer one.
+
+        :param max_concurrency: most requests in flight at once for each model,
+            defaults to each model's Config.max_concurrency or 8
+        """
+        batch, token = batches.start(asynchronous=True)
+        if token is None:
+            yield batch
+            return
+        try:
+            yield batch
+        finally:
+            batches.finish(batch, token)
+
+        failed: List[str] = []
+        for model, items, keys in batch.operations():
+            if items:
+                model._assign_keys(
+                    items,
+                    await model._put_records(items, max_concurrency=max_concurrency),
+                )
+            if keys:
+                result = await model.delete_many(keys, max_concurrency=max_concurrency)
+                failed.extend(result.failed)
+        cls._raise_failed_deletes(failed)
+
+    @classmethod
+    async def _call(
+        cls,
+        method: str,
+        *args: Any,
+        idempotent: bool = True,
+        trip: Optional[Trip] = None,
+        **kwargs: Any,
+    ) -> Any:
+        """Send one request to Deta through the shared handle. Every request goes
+        through here to be rate limited (Config.rate_limit), retried
+        (Config.retry) and reported to instrumentation listeners.
+
+        :param idempotent: whether the request can be sent twice with the same
+            effect, otherwise it is only retried when Deta turned it away
+        :param trip: the trip to time the request in, the caller emits it once
+            the response is decoded. Without one, the request is reported as soon
+            as it is done.
+        """
+        owned = trip is None
+        if owned:
+            trip = instrumentation.start(cls, method)
+        if trip is None:
+            return await retry.call_async(
+                getattr(cls.__db__, method),
+                *args,
+                policy=cls.__retry__,
+                limiter=cls._limiter(),
+                idempotent=idempotent,
+                **kwargs,
+            )
+
+        started = time.perf_counter()
+        try:
+            result = await retry.call_async(
+                getattr(cls.__db__, method),
+                *args,
+                policy=cls.__retry__,
+                limiter=cls._limiter(),
+                idempotent=idempotent,
+                **kwargs,
+            )
+        except BaseException as error:
+            trip.network += time.perf_counter() - started
+            trip.error = error
+            instrumentation.emit(trip)
+            raise
+        trip.network += time.perf_counter() - started
+        trip.items = instrumentation.item_count(method, args, result)
+        if owned:
+            instrumentation.emit(trip)
+        return result
 
     @classmethod
     async def _db_put(cls, data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        return await cls.__db__.put(data)
+        return await cls._call("put", data, idempotent="key" in data)
 
-    async def save(self) -> None:
+    async def save(self, partial: Optional[bool] = None) -> None:
         """Saves the record to the database. Behaves as upsert, will create
-        if not present. Database key will then be set on the object."""
+        if not present. Database key will then be set on the object. Inside a
+        batching() block the save is sent, and the key set, when the block ends.
+
+        :param partial: only send the fields changed since the item was loaded or
+            last saved, with an update, defaults to Config.partial_updates. Items
+            that were never loaded or saved are always put whole, as are items
+            saved in a batch. Raises DetaError if the model does not track
+            changes.
+        """
         # exclude = set()
         # if self.key is None:
         #     exclude.add("key")
         # # this is dumb, but it ensures everything is in a json-serializable form
         # data = ujson.loads(self.json(exclude=exclude))
-        saved = await self._db_put(self._serialize())
+        batch = batches.current_batch(asynchronous=True)
+        if batch is not None:
+            batch.save(self)
+            return
+        if self._is_partial(partial):
+            await self._update(self._changes())
+            return
+        data = self._serialize()
+        try:
+            saved = await self._db_put(data)
+        finally:
+            self._invalidate([self.key])
         self.key = saved["key"]
+        self._remember({**data, "key": self.key})
+
+    async def _update(self, changes: Dict[str, Any]) -> None:
+        if not changes:
+            return
+        try:
+            await self._call("update", changes, self.key)
+        finally:
+            self._invalidate([self.key])
+        self._stored.update(_snapshot(changes))  # type: ignore
 
     async def delete(self) -> None:
         """Delete the open object from the database. The object will still exist in
@@ -124,3 +713,73 @@ class AsyncDetaModel(BaseDetaModel, metaclass=AsyncDetaModelMetaClass):
             raise DetaError("Item does not have key for deletion.")
         await self.delete_key(self.key)
         self.key = None
+
+    @classmethod
+    async def _send_update(cls, key: str, update: DetaUpdate) -> None:
+        db = cls.__db__
+        try:
+            await cls._call(
+                "update",
+                cls._update_data(db, update),
+                key,
+                # repeating an increment, append or prepend would repeat its effect
+                idempotent=update.operation == "trim",
+            )
+        finally:
+            cls._invalidate([key])
+
+    @classmethod
+    async def increment(
+        cls, key: str, field: Union[str, DetaField], value: Union[int, float] = 1
+    ) -> None:
+        """Add value to a number field of the item with this key, in one request
+        and without reading it first. Use a negative value to decrement."""
+        await cls._send_update(key, cls._deta_field(field).increment(value))
+
+    @classmethod
+    async def append_by_key(
+        cls, key: str, field: Union[str, DetaField], value: Any
+    ) -> None:
+        """Add an item, or a list of items, to the end of a list field of the item
+        with this key, without reading it first"""
+        await cls._send_update(key, cls._deta_field(field).append(value))
+
+    @classmethod
+    async def prepend_by_key(
+        cls, key: str, field: Union[str, DetaField], value: Any
+    ) -> None:
+        """Add an item, or a list of items, to the start of a list field of the
+        item with this key, without reading it first"""
+        await cls._send_update(key, cls._deta_field(field).prepend(value))
+
+    @classmethod
+    async def trim_by_key(cls, key: str, field: Union[str, DetaField]) -> None:
+        """Remove an optional field from the item with this key"""
+        await cls._send_update(key, cls._deta_field(field).trim())
+
+    async def increment_field(
+        self, field: Union[str, DetaField], value: Union[int, float] = 1
+    ) -> None:
+        """Increment a number field in the database and on this instance"""
+        update = self._deta_field(field).increment(value)
+        await self._send_update(self._require_key("update"), update)
+        self._apply_update(update, value)
+
+    async def append_to(self, field: Union[str, DetaField], value: Any) -> None:
+        """Append to a list field in the database and on this instance"""
+        update = self._deta_field(field).append(value)
+        await self._send_update(self._require_key("update"), update)
+        self._apply_update(update, value)
+
+    async def prepend_to(self, field: Union[str, DetaField], value: Any) -> None:
+        """Prepend to a list field in the database and on this instance"""
+        update = self._deta_field(field).prepend(value)
+        await self._send_update(self._require_key("update"), update)
+        self._apply_update(update, value)
+
+    async def trim_field(self, field: Union[str, DetaField]) -> None:
+        """Remove an optional field in the database, and reset it to its default
+        on this instance"""
+        update = self._deta_field(field).trim()
+        await self._send_update(self._require_key("update"), update)
+        self._apply_update(update, None)
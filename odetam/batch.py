@@ -0,0 +1,74 @@
+from contextvars import ContextVar, Token
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Type
+
+if TYPE_CHECKING:
+    from odetam.model import BaseDetaModel
+
+# sync and async batches are kept apart, so neither captures the other's models
+_current: Dict[bool, ContextVar[Optional["Batch"]]] = {
+    False: ContextVar("odetam_batch", default=None),
+    True: ContextVar("odetam_async_batch", default=None),
+}
+
+
+class Batch:
+    """Saves and deletes held back until the end of a batching() block, to be sent
+    with as few requests as possible.
+
+    Only the last operation on each key is kept: saving an item after deleting its
+    key cancels the delete, deleting a key cancels the save of an item with that
+    key. An item saved more than once is put once, as it is when the batch is
+    flushed.
+    """
+
+    def __init__(self, asynchronous: bool):
+        self.asynchronous = asynchronous
+        # by model, the items to put by id and the keys to delete
+        self._saves: Dict[Type["BaseDetaModel"], Dict[int, "BaseDetaModel"]] = {}
+        self._deletes: Dict[Type["BaseDetaModel"], Dict[str, None]] = {}
+
+    def save(self, item: "BaseDetaModel") -> None:
+        model = type(item)
+        if item.key:
+            self._deletes.get(model, {}).pop(item.key, None)
+        self._saves.setdefault(model, {})[id(item)] = item
+
+    def delete(self, model: Type["BaseDetaModel"], key: str) -> None:
+        saves = self._saves.get(model, {})
+        for item_id, item in list(saves.items()):
+            if item.key == key:
+                del saves[item_id]
+        self._deletes.setdefault(model, {})[key] = None
+
+    def operations(
+        self,
+    ) -> List[Tuple[Type["BaseDetaModel"], List["BaseDetaModel"], List[str]]]:
+        """For every model, the items to put and the keys to delete"""
+        models = list(dict.fromkeys([*self._saves, *self._deletes]))
+        return [
+            (
+                model,
+                list(self._saves.get(model, {}).values()),
+                list(self._deletes.get(model, {})),
+            )
+            for model in models
+        ]
+
+
+def current_batch(asynchronous: bool) -> Optional[Batch]:
+    """The batch open in this context for sync or async models, if any"""
+    return _current[asynchronous].get()
+
+
+def start(asynchronous: bool) -> Tuple[Batch, Optional[Token]]:
+    """Open a batch in this context. A batch opened inside another one joins it,
+    and gets no token, only the outermost batch is flushed."""
+    batch = _current[asynchronous].get()
+    if batch is not None:
+        return batch, None
+    batch = Batch(asynchronous)
+    return batch, _current[asynchronous].set(batch)
+
+
+def finish(batch: Batch, token: Token) -> None:
+    _current[batch.asynchronous].reset(token)
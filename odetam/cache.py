@@ -0,0 +1,92 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterable, NamedTuple, Optional, Tuple
+
+
+class CacheInfo(NamedTuple):
+    """Statistics for a model's record cache"""
+
+    hits: int
+    misses: int
+    size: int
+    max_size: int
+    ttl: Optional[float]
+
+
+class RecordCache:
+    """Size bounded, least recently used cache of raw Deta records, with an
+    optional time to live. Safe to share between threads.
+
+    Records (or lists of records) are stored as they came back from Deta, so
+    instances are still built (and validated) on every read, and a copy is handed
+    out so nothing can change the cached record.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # bumped on every invalidation, so records fetched before a write can be
+        # recognised and dropped
+        self.generation = 0
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._records: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Any:
+        """The cached record for key, or None if it is missing or expired"""
+        with self._lock:
+            entry = self._records.get(key)
+            if entry is not None and self.ttl is not None:
+                if self._clock() - entry[0] >= self.ttl:
+                    del self._records[key]
+                    entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._records.move_to_end(key)
+            self.hits += 1
+        return copy.deepcopy(entry[1])
+
+    def set(self, key: Hashable, record: Any, generation: Optional[int] = None) -> None:
+        """Cache a record. If generation is given and there has been a write since
+        it was taken, the record may already be stale and is not cached."""
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._records[key] = (self._clock(), copy.deepcopy(record))
+            self._records.move_to_end(key)
+            while len(self._records) > self.max_size:
+                self._records.popitem(last=False)
+
+    def invalidate(self, keys: Iterable[Optional[Hashable]]) -> None:
+        with self._lock:
+            self.generation += 1
+            for key in keys:
+                if key is not None:
+                    self._records.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._records.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(
+                hits=self.hits,
+                misses=self.misses,
+                size=len(self._records),
+                max_size=self.max_size,
+                ttl=self.ttl,
+            )
@@ -12,3 +12,17 @@ class InvalidDetaQuery(DetaError):
 
 class InvalidKey(DetaError):
     pass
+
+
+class ItemExists(DetaError, Exception):
+    """An insert found an item with the same key. Deta answers 409 Conflict, local
+    backends raise this with the same status."""
+
+    status = 409
+
+
+class KeyNotFound(ItemNotFound, Exception):
+    """An update found no item with its key. Deta answers 404 Not Found, local
+    backends raise this with the same status."""
+
+    status = 404
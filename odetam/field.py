@@ -1,12 +1,13 @@
 import datetime
-from typing import Any, Dict, List, Union
+from typing import Any, Dict, List, NamedTuple, Union
 
 import ujson
 from pydantic import BaseModel
-from pydantic.fields import ModelField
+from pydantic.fields import SHAPE_LIST, SHAPE_SINGLETON, ModelField
 
 from odetam.exceptions import InvalidDetaQuery
 from odetam.query import DetaQuery
+from odetam.serialization import serialize_date, serialize_datetime, serialize_time
 
 NON_STR_TYPES = [
     Dict[str, Any],
@@ -28,14 +29,23 @@ def _handle_datetimes(
     possible_datetime: Union[datetime.datetime, datetime.date, datetime.time, Any]
 ) -> Any:
     if isinstance(possible_datetime, datetime.datetime):
-        return possible_datetime.timestamp()
+        return serialize_datetime(possible_datetime)
     elif isinstance(possible_datetime, datetime.date):
-        return int(possible_datetime.strftime("%Y%m%d"))
+        return serialize_date(possible_datetime)
     elif isinstance(possible_datetime, datetime.time):
-        return int(possible_datetime.strftime("%H%M%S%f"))
+        return serialize_time(possible_datetime)
     return possible_datetime
 
 
+class DetaUpdate(NamedTuple):
+    """An atomic update of one field, done by Deta with one of its update utilities
+    (increment, append, prepend or trim)"""
+
+    field: str
+    operation: str
+    value: Any = None
+
+
 class DetaField:
     def __init__(self, field: ModelField):
         self.field = field
@@ -109,3 +119,43 @@ class DetaField:
                 "Not contains is only valid for strings or lists of strings"
             )
         return DetaQuery(condition=f"{self.field.name}?not_contains", value=other)
+
+    def increment(self, value: Union[int, float] = 1) -> DetaUpdate:
+        if (
+            self.field.type_ not in (int, float)
+            or self.field.shape != SHAPE_SINGLETON
+            or isinstance(value, bool)
+            or not isinstance(value, (int, float))
+        ):
+            raise TypeError("Increment is only valid for number types")
+        if value == 0:
+            # Deta's Util.increment turns a zero into 1
+            raise ValueError("Increment value must not be zero")
+        return DetaUpdate(self.field.name, "increment", value)
+
+    def _list_items(self, value: Any) -> List[Any]:
+        if self.field.shape != SHAPE_LIST:
+            raise TypeError("Append and prepend are only valid for list types")
+        items = value if isinstance(value, list) else [value]
+        converted = []
+        for item in items:
+            if isinstance(self.field.type_, type):
+                self._check_type(item)
+            if isinstance(item, BaseModel):
+                item = ujson.loads(item.json())
+            converted.append(_handle_datetimes(item))
+        return converted
+
+    def append(self, value: Any) -> DetaUpdate:
+        """Add an item, or a list of items, to the end of a list field"""
+        return DetaUpdate(self.field.name, "append", self._list_items(value))
+
+    def prepend(self, value: Any) -> DetaUpdate:
+        """Add an item, or a list of items, to the start of a list field"""
+        return DetaUpdate(self.field.name, "prepend", self._list_items(value))
+
+    def trim(self) -> DetaUpdate:
+        """Remove the field from the stored item"""
+        if self.field.required and not self.field.allow_none:
+            raise TypeError("Only optional fields can be trimmed")
+        return DetaUpdate(self.field.name, "trim")
@@ -0,0 +1,157 @@
+import logging
+import threading
+from typing import Any, Callable, NamedTuple, Optional, Sequence, Tuple, Type, Union
+
+logger = logging.getLogger(__name__)
+
+# the fields a query condition is on, with the operator but without the value,
+# e.g. ("age?gt", "name"), or a tuple of those for an OR
+QueryShape = Union[Tuple[str, ...], Tuple[Tuple[str, ...], ...]]
+
+
+class Event(NamedTuple):
+    """One round trip to Deta, or one decoding of records fetched by several
+
+    :param operation: get, fetch (one page), put, put_many, delete or update for a
+        round trip, decode for records decoded after several round trips (query,
+        get_many and put_many results)
+    :param page: index of the page for fetch, counting from 0
+    :param items: records sent, received or decoded
+    :param network: seconds waiting on Deta, including retries and rate limiting
+    :param deserialize: seconds turning records into python values
+    :param validate: seconds building (and validating) model instances
+    :param error: the exception the request failed with, if it did
+    """
+
+    model: Type[Any]
+    operation: str
+    query: Optional[QueryShape]
+    page: Optional[int]
+    items: int
+    network: float
+    deserialize: float
+    validate: float
+    error: Optional[BaseException]
+
+    @property
+    def duration(self) -> float:
+        return self.network + self.deserialize + self.validate
+
+
+Listener = Callable[[Event], Any]
+
+# read without the lock on every request, replaced rather than changed in place
+listeners: Tuple[Listener, ...] = ()
+_lock = threading.Lock()
+
+
+def add_listener(listener: Listener) -> None:
+    """Call listener with an Event for every round trip to Deta, from any model"""
+    global listeners
+    with _lock:
+        listeners = (*listeners, listener)
+
+
+def remove_listener(listener: Listener) -> None:
+    global listeners
+    with _lock:
+        if listener not in listeners:
+            raise ValueError("listener was not added")
+        index = listeners.index(listener)
+        listeners = listeners[:index] + listeners[index + 1 :]
+
+
+def _condition_shape(query: Any) -> Tuple[str, ...]:
+    return tuple(sorted(query)) if isinstance(query, dict) else ()
+
+
+def query_shape(query: Any) -> Optional[QueryShape]:
+    """The conditions of a query sent to Deta, without their values"""
+    if isinstance(query, dict):
+        return _condition_shape(query)
+    if isinstance(query, list):
+        return tuple(_condition_shape(condition) for condition in query)
+    return None
+
+
+class Trip:
+    """An Event being timed, filled in as the request is sent and its records are
+    decoded"""
+
+    __slots__ = (
+        "model",
+        "operation",
+        "query",
+        "page",
+        "items",
+        "network",
+        "deserialize",
+        "validate",
+        "error",
+        "emitted",
+    )
+
+    def __init__(
+        self,
+        model: Type[Any],
+        operation: str,
+        query: Optional[QueryShape] = None,
+        page: Optional[int] = None,
+    ):
+        self.model = model
+        self.operation = operation
+        self.query = query
+        self.page = page
+        self.items = 0
+        self.network = 0.0
+        self.deserialize = 0.0
+        self.validate = 0.0
+        self.error: Optional[BaseException] = None
+        self.emitted = False
+
+    def event(self) -> Event:
+        return Event(
+            model=self.model,
+            operation=self.operation,
+            query=self.query,
+            page=self.page,
+            items=self.items,
+            network=self.network,
+            deserialize=self.deserialize,
+            validate=self.validate,
+            error=self.error,
+        )
+
+
+def start(
+    model: Type[Any], operation: str, query: Any = None, page: Optional[int] = None
+) -> Optional[Trip]:
+    """A Trip to fill in, or None when nothing is listening"""
+    if not listeners:
+        return None
+    return Trip(model, operation, query_shape(query), page)
+
+
+def item_count(operation: str, args: Sequence[Any], result: Any) -> int:
+    """Records sent or received by a request"""
+    if operation == "fetch":
+        return len(result.items)
+    if operation == "put_many":
+        return len(args[0])
+    if operation == "get":
+        return 0 if result is None else 1
+    return 1
+
+
+def emit(trip: Optional[Trip]) -> None:
+    """Send the event for a trip to every listener, once. A listener raising does
+    not fail the request, the error is logged."""
+    if trip is None or trip.emitted:
+        return
+    trip.emitted = True
+    event = trip.event()
+    for listener in listeners:
+        try:
+            listener(event)
+        except Exception:
+            logger.exception("odetam instrumentation listener failed")
@@ -0,0 +1,535 @@
+import bisect
+import datetime
+import secrets
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+import ujson
+from deta.base import FetchResponse, Util
+
+from odetam.exceptions import ItemExists, KeyNotFound
+
+Query = Union[Dict[str, Any], List[Dict[str, Any]], None]
+
+# most items Deta returns in one page, and accepts in one put_many
+MAX_PAGE_SIZE = 1000
+MAX_PUT_MANY = 25
+
+_MISSING: Any = object()
+_SCALARS = (str, int, float, bool, type(None))
+
+
+def resolve(record: Dict[str, Any], path: str) -> Any:
+    """The value at a dotted path in a record, or _MISSING"""
+    value: Any = record
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _equal(value: Any, expected: Any) -> bool:
+    # JSON keeps booleans and numbers apart, python does not
+    if isinstance(value, bool) != isinstance(expected, bool):
+        return False
+    return value == expected
+
+
+def _comparable(value: Any, expected: Any) -> bool:
+    return (_is_number(value) and _is_number(expected)) or (
+        isinstance(value, str) and isinstance(expected, str)
+    )
+
+
+def _contains(value: Any, expected: Any) -> bool:
+    if isinstance(value, str):
+        return isinstance(expected, str) and expected in value
+    if isinstance(value, list):
+        return any(_equal(item, expected) for item in value)
+    return False
+
+
+def condition_matches(record: Dict[str, Any], condition: str, expected: Any) -> bool:
+    """Whether a record meets one condition of a Deta query, like "age?gt" """
+    path, _, operator = condition.partition("?")
+    value = resolve(record, path)
+    if operator == "ne":
+        return value is _MISSING or not _equal(value, expected)
+    if operator == "not_contains":
+        return value is _MISSING or not _contains(value, expected)
+    if value is _MISSING:
+        return False
+    if not operator:
+        return _equal(value, expected)
+    if operator == "contains":
+        return _contains(value, expected)
+    if operator == "pfx":
+        return isinstance(value, str) and value.startswith(str(expected))
+    if operator == "r":
+        low, high = expected
+        return (
+            _comparable(value, low)
+            and _comparable(value, high)
+            and low <= value <= high
+        )
+    if not _comparable(value, expected):
+        return False
+    if operator == "lt":
+        return value < expected
+    if operator == "gt":
+        return value > expected
+    if operator == "lte":
+        return value <= expected
+    if operator == "gte":
+        return value >= expected
+    raise ValueError(f"Unsupported query operator {operator}")
+
+
+def matches(record: Dict[str, Any], query: Query) -> bool:
+    """Whether a record matches a Deta query: a dict of conditions that must all
+    hold, or a list of those of which one must"""
+    if not query:
+        return True
+    if isinstance(query, list):
+        return any(matches(record, branch) for branch in query)
+    return all(
+        condition_matches(record, condition, expected)
+        for condition, expected in query.items()
+    )
+
+
+def _expires_at(
+    expire_in: Optional[int], expire_at: Union[int, float, datetime.datetime, None]
+) -> Optional[int]:
+    if expire_in is not None and expire_at is not None:
+        raise ValueError("Both expire_in and expire_at provided")
+    if expire_in is not None:
+        return int(time.time()) + expire_in
+    if isinstance(expire_at, datetime.datetime):
+        return int(expire_at.timestamp())
+    if expire_at is not None:
+        return int(expire_at)
+    return None
+
+
+class _Store:
+    """The items of one base, kept in key order, with equality (hash) and prefix
+    (sorted) indexes built the first time a path is queried and kept up to date
+    on every write after that. Indexes only narrow down the items to check, every
+    candidate is still matched against the whole query."""
+
+    def __init__(self) -> None:
+        self.lock = threading.RLock()
+        self.records: Dict[str, Dict[str, Any]] = {}
+        # records as JSON, items are handed out as fresh copies of these
+        self.texts: Dict[str, str] = {}
+        self.keys: List[str] = []
+        self.hash_indexes: Dict[str, Dict[Any, Set[str]]] = {}
+        self.sorted_indexes: Dict[str, List[Tuple[str, str]]] = {}
+
+    def clear(self) -> None:
+        with self.lock:
+            self.records.clear()
+            self.texts.clear()
+            self.keys.clear()
+            self.hash_indexes.clear()
+            self.sorted_indexes.clear()
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        text = self.texts.get(key)
+        if text is None:
+            return None
+        if self._expired(key):
+            self.remove(key)
+            return None
+        return ujson.loads(text)
+
+    def _expired(self, key: str) -> bool:
+        return is_expired(self.records[key])
+
+    def store(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        # a JSON round trip, like sending the item to Deta, also checks the item
+        # can be stored at all
+        text = ujson.dumps(record)
+        record = ujson.loads(text)
+        key = record["key"]
+        if key in self.records:
+            self._unindex(key, self.records[key])
+        else:
+            bisect.insort(self.keys, key)
+        self.records[key] = record
+        self.texts[key] = text
+        self._index(key, record)
+        return ujson.loads(text)
+
+    def remove(self, key: str) -> None:
+        record = self.records.pop(key, None)
+        if record is None:
+            return
+        del self.texts[key]
+        del self.keys[bisect.bisect_left(self.keys, key)]
+        self._unindex(key, record)
+
+    def _index(self, key: str, record: Dict[str, Any]) -> None:
+        for path, index in self.hash_indexes.items():
+            value = resolve(record, path)
+            if isinstance(value, _SCALARS):
+                index.setdefault(value, set()).add(key)
+        for path, entries in self.sorted_indexes.items():
+            value = resolve(record, path)
+            if isinstance(value, str):
+                bisect.insort(entries, (value, key))
+
+    def _unindex(self, key: str, record: Dict[str, Any]) -> None:
+        for path, index in self.hash_indexes.items():
+            value = resolve(record, path)
+            if isinstance(value, _SCALARS):
+                keys = index.get(value)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del index[value]
+        for path, entries in self.sorted_indexes.items():
+            value = resolve(record, path)
+            if isinstance(value, str):
+                position = bisect.bisect_left(entries, (value, key))
+                if position < len(entries) and entries[position] == (value, key):
+                    del entries[position]
+
+    def _hash_index(self, path: str) -> Dict[Any, Set[str]]:
+        index = self.hash_indexes.get(path)
+        if index is None:
+            index = self.hash_indexes[path] = {}
+            for key, record in self.records.items():
+                value = resolve(record, path)
+                if isinstance(value, _SCALARS):
+                    index.setdefault(value, set()).add(key)
+        return index
+
+    def _sorted_index(self, path: str) -> List[Tuple[str, str]]:
+        entries = self.sorted_indexes.get(path)
+        if entries is None:
+            entries = self.sorted_indexes[path] = sorted(
+                (value, key)
+                for key, value in (
+                    (key, resolve(record, path)) for key, record in self.records.items()
+                )
+                if isinstance(value, str)
+            )
+        return entries
+
+    def _with_prefix(self, path: str, prefix: str) -> Set[str]:
+        entries = self._sorted_index(path)
+        found = set()
+        for position in range(bisect.bisect_left(entries, (prefix, "")), len(entries)):
+            value, key = entries[position]
+            if not value.startswith(prefix):
+                break
+            found.add(key)
+        return found
+
+    def _candidates(self, query: Query) -> Optional[Set[str]]:
+        """Keys of the only items that can match, or None if every item has to be
+        checked"""
+        if not query:
+            return None
+        if isinstance(query, list):
+            found: Set[str] = set()
+            for branch in query:
+                branch_keys = self._candidates(branch)
+                if branch_keys is None:
+                    return None
+                found |= branch_keys
+            return found
+
+        candidates: Optional[Set[str]] = None
+        for condition, expected in query.items():
+            path, _, operator = condition.partition("?")
+            if not operator and isinstance(expected, _SCALARS):
+                keys = self._hash_index(path).get(expected, set())
+            elif operator == "pfx" and isinstance(expected, str):
+                keys = self._with_prefix(path, expected)
+            else:
+                continue
+            candidates = set(keys) if candidates is None else candidates & keys
+            if not candidates:
+                break
+        return candidates
+
+    def fetch(self, query: Query, limit: int, last: Optional[str]) -> FetchResponse:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        candidates = self._candidates(query)
+        if candidates is None:
+            start = bisect.bisect_right(self.keys, last) if last else 0
+            keys: Iterable[str] = self.keys[start:]
+        else:
+            keys = sorted(key for key in candidates if last is None or key > last)
+
+        found: List[str] = []
+        expired = []
+        for key in keys:
+            if self._expired(key):
+                expired.append(key)
+            elif matches(self.records[key], query):
+                found.append(key)
+                # one more than the page, to know whether there is another page
+                if len(found) > limit:
+                    break
+        for key in expired:
+            self.remove(key)
+
+        page = found[:limit]
+        items = [ujson.loads(self.texts[key]) for key in page]
+        return FetchResponse(
+            count=len(items),
+            last=page[-1] if len(found) > limit else None,
+            items=items,
+        )
+
+
+def _set_path(record: Dict[str, Any], path: str, value: Any) -> None:
+    *parents, name = path.split(".")
+    for part in parents:
+        child = record.get(part)
+        if not isinstance(child, dict):
+            child = record[part] = {}
+        record = child
+    record[name] = value
+
+
+def _delete_path(record: Dict[str, Any], path: str) -> None:
+    *parents, name = path.split(".")
+    for part in parents:
+        record = record.get(part)
+        if not isinstance(record, dict):
+            return
+    record.pop(name, None)
+
+
+def prepare_item(
+    data: Any,
+    key: Optional[str] = None,
+    expire_in: Optional[int] = None,
+    expire_at: Union[int, float, datetime.datetime, None] = None,
+) -> Dict[str, Any]:
+    """The item Deta would store for a put: data wrapped in {"value": ...} if it
+    is not a dict, with a key (a new one if it has none) and its expiry"""
+    item = dict(data) if isinstance(data, dict) else {"value": data}
+    if key:
+        item["key"] = key
+    if not item.get("key"):
+        item["key"] = secrets.token_hex(6)
+    if not isinstance(item["key"], str):
+        raise TypeError("Key must be a string")
+    return set_expiry(item, expire_in, expire_at)
+
+
+def set_expiry(
+    item: Dict[str, Any],
+    expire_in: Optional[int] = None,
+    expire_at: Union[int, float, datetime.datetime, None] = None,
+) -> Dict[str, Any]:
+    expires = _expires_at(expire_in, expire_at)
+    if expires is not None:
+        item["__expires"] = expires
+    return item
+
+
+def is_expired(record: Dict[str, Any]) -> bool:
+    expires = record.get("__expires")
+    return _is_number(expires) and expires <= time.time()
+
+
+def apply_updates(record: Dict[str, Any], updates: Dict[str, Any]) -> None:
+    """Change a record as Deta's update does: set values, or apply deta's Util
+    operations (trim, increment, append, prepend), at dotted paths"""
+    for path, value in updates.items():
+        current = resolve(record, path)
+        if isinstance(value, Util.Trim):
+            _delete_path(record, path)
+        elif isinstance(value, Util.Increment):
+            if current is _MISSING:
+                current = 0
+            if not _is_number(current):
+                raise ValueError(f"Can't increment {path}, not a number")
+            _set_path(record, path, current + value.val)
+        elif isinstance(value, (Util.Append, Util.Prepend)):
+            if current is _MISSING:
+                current = []
+            if not isinstance(current, list):
+                raise ValueError(f"Can't add to {path}, not a list")
+            if isinstance(value, Util.Prepend):
+                _set_path(record, path, [*value.val, *current])
+            else:
+                _set_path(record, path, [*current, *value.val])
+        else:
+            _set_path(record, path, value)
+
+
+class MemoryBase:
+    """A Deta Base kept in memory, with the same methods as the Deta SDK's Base.
+    Every handle for the same name on the same MemoryBackend shares its items."""
+
+    def __init__(self, name: str, store: _Store):
+        self.name = name
+        self.util = Util()
+        self._store = store
+
+    def close(self) -> None:
+        pass
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        if key == "":
+            raise ValueError("Key is empty")
+        with self._store.lock:
+            return self._store.load(key)
+
+    def put(
+        self,
+        data: Any,
+        key: Optional[str] = None,
+        *,
+        expire_in: Optional[int] = None,
+        expire_at: Union[int, float, datetime.datetime, None] = None,
+    ) -> Dict[str, Any]:
+        item = prepare_item(data, key, expire_in, expire_at)
+        with self._store.lock:
+            return self._store.store(item)
+
+    def put_many(
+        self,
+        items: List[Any],
+        *,
+        expire_in: Optional[int] = None,
+        expire_at: Union[int, float, datetime.datetime, None] = None,
+    ) -> Dict[str, Any]:
+        if len(items) > MAX_PUT_MANY:
+            raise AssertionError("We can't put more than 25 items at a time.")
+        prepared = [prepare_item(item, None, expire_in, expire_at) for item in items]
+        with self._store.lock:
+            return {"processed": {"items": [self._store.store(i) for i in prepared]}}
+
+    def insert(
+        self,
+        data: Any,
+        key: Optional[str] = None,
+        *,
+        expire_in: Optional[int] = None,
+        expire_at: Union[int, float, datetime.datetime, None] = None,
+    ) -> Dict[str, Any]:
+        item = prepare_item(data, key, expire_in, expire_at)
+        with self._store.lock:
+            if self._store.load(item["key"]) is not None:
+                raise ItemExists(f"Item with key '{item['key']}' already exists")
+            return self._store.store(item)
+
+    def update(
+        self,
+        updates: Dict[str, Any],
+        key: str,
+        *,
+        expire_in: Optional[int] = None,
+        expire_at: Union[int, float, datetime.datetime, None] = None,
+    ) -> None:
+        if key == "":
+            raise ValueError("Key is empty")
+        with self._store.lock:
+            record = self._store.load(key)
+            if record is None:
+                raise KeyNotFound(f"Key '{key}' not found")
+            apply_updates(record, updates)
+            self._store.store(set_expiry(record, expire_in, expire_at))
+
+    def delete(self, key: str) -> None:
+        if key == "":
+            raise ValueError("Key is empty")
+        with self._store.lock:
+            self._store.remove(key)
+
+    def fetch(
+        self,
+        query: Query = None,
+        limit: int = MAX_PAGE_SIZE,
+        last: Optional[str] = None,
+    ) -> FetchResponse:
+        with self._store.lock:
+            return self._store.fetch(query, limit, last)
+
+
+class AsyncMemoryBase:
+    """MemoryBase with the coroutine methods of the Deta SDK's AsyncBase"""
+
+    def __init__(self, name: str, store: _Store):
+        self.name = name
+        self.util = Util()
+        self._base = MemoryBase(name, store)
+
+    async def close(self) -> None:
+        pass
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._base.get(key)
+
+    async def put(self, data: Any, key: Optional[str] = None, **expiry: Any) -> Any:
+        return self._base.put(data, key, **expiry)
+
+    async def put_many(self, items: List[Any], **expiry: Any) -> Dict[str, Any]:
+        return self._base.put_many(items, **expiry)
+
+    async def insert(self, data: Any, key: Optional[str] = None, **expiry: Any) -> Any:
+        return self._base.insert(data, key, **expiry)
+
+    async def update(self, updates: Dict[str, Any], key: str, **expiry: Any) -> None:
+        return self._base.update(updates, key, **expiry)
+
+    async def delete(self, key: str) -> None:
+        return self._base.delete(key)
+
+    async def fetch(
+        self,
+        query: Query = None,
+        *,
+        limit: int = MAX_PAGE_SIZE,
+        last: Optional[str] = None,
+    ) -> FetchResponse:
+        return self._base.fetch(query, limit=limit, last=last)
+
+
+class MemoryBackend:
+    """Stores bases in memory instead of Deta, for tests and local development.
+    Use it for a model with Config.backend = "memory" (a backend shared by the
+    whole process) or Config.backend = MemoryBackend() for one of its own.
+
+    Queries, paging, updates and the limits of put_many work as they do on Deta.
+    Nothing is kept once the process ends.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._stores: Dict[str, _Store] = {}
+
+    def _store(self, name: str) -> _Store:
+        with self._lock:
+            store = self._stores.get(name)
+            if store is None:
+                store = self._stores[name] = _Store()
+        return store
+
+    def Base(self, name: str) -> MemoryBase:
+        return MemoryBase(name, self._store(name))
+
+    def AsyncBase(self, name: str) -> AsyncMemoryBase:
+        return AsyncMemoryBase(name, self._store(name))
+
+    def clear(self) -> None:
+        """Delete every item of every base"""
+        with self._lock:
+            stores = list(self._stores.values())
+        for store in stores:
+            store.clear()
@@ -1,32 +1,68 @@
-import datetime
 import re
-from typing import Any, Callable, Container, Dict, List, Optional, Type, TypeVar, Union
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import (
+    Any,
+    Callable,
+    Container,
+    Dict,
+    FrozenSet,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
 
 import pydantic
 import ujson
-from deta import Base, Deta
+from deta import Base
 from deta.base import FetchResponse, _Base
-from pydantic import BaseModel, Field, ValidationError
+from pydantic import BaseModel, Field, PrivateAttr, ValidationError
 
-from odetam.exceptions import DetaError, InvalidKey, ItemNotFound
-from odetam.field import DetaField
+from odetam import batch as batches
+from odetam import instrumentation, registry, retry
+from odetam.cache import CacheInfo, RecordCache
+from odetam.exceptions import DetaError, InvalidDetaQuery, InvalidKey, ItemNotFound
+from odetam.field import DetaField, DetaUpdate
+from odetam.instrumentation import Trip
+from odetam.optimizer import NO_MATCHES, optimize
 from odetam.query import DetaQuery, DetaQueryList, DetaQueryStatement
-
-DETA_BASIC_TYPES = [Dict[str, Any], List[Any], str, int, float, bool]
-DETA_OPTIONAL_TYPES = [Optional[type_] for type_ in DETA_BASIC_TYPES]
-DETA_BASIC_LIST_TYPES = [
-    List[type_] for type_ in DETA_BASIC_TYPES + DETA_OPTIONAL_TYPES
-]
-DETA_TYPES = DETA_BASIC_TYPES + DETA_OPTIONAL_TYPES + DETA_BASIC_LIST_TYPES
+from odetam.retry import RetryPolicy, TokenBucket
+from odetam.serialization import (
+    DETA_BASIC_LIST_TYPES,
+    DETA_BASIC_TYPES,
+    DETA_OPTIONAL_TYPES,
+    DETA_TYPES,
+    DeserializePlan,
+    SerializePlan,
+    build_deserialize_plan,
+    build_serialize_plan,
+    deserialize_json,
+)
 
 
 def handle_db_property(
-    cls: "BaseDetaModel", base_class: Callable[[str], _Base]
+    cls: "BaseDetaModel", base_class: Callable[[str], _Base], asynchronous: bool = False
 ) -> _Base:
     if cls._db:
         return cls._db
 
-    cls._db = base_class(cls.__db_name__)
+    cls._db = registry.get_base(
+        getattr(cls.Config, "deta_key", None),
+        cls.__db_name__,
+        asynchronous,
+        base_class,
+        model=cls,
+    )
     return cls._db
 
 
@@ -38,6 +74,37 @@ class DetaModelMetaClass(pydantic.main.ModelMetaclass):
         else:
             cls.__db_name__ = re.sub(r"(?<!^)(?=[A-Z])", "_", name).lower()
         cls._db = None
+        cls.__projections__ = {}
+        cache_size = getattr(cls.Config, "cache_size", None)
+        if cache_size:
+            cls.__cache__ = RecordCache(
+                cache_size, ttl=getattr(cls.Config, "cache_ttl", None)
+            )
+        else:
+            cls.__cache__ = None
+        query_cache_size = getattr(cls.Config, "query_cache_size", None)
+        if query_cache_size:
+            cls.__query_cache__ = RecordCache(
+                query_cache_size, ttl=getattr(cls.Config, "query_cache_ttl", None)
+            )
+        else:
+            cls.__query_cache__ = None
+        cls.__write_generation__ = 0
+        retry_policy = getattr(cls.Config, "retry", None)
+        cls.__retry__ = RetryPolicy() if retry_policy is True else retry_policy or None
+        cls._write_lock = threading.Lock()
+        cls.__track_changes__ = bool(
+            getattr(cls.Config, "partial_updates", False)
+            or getattr(cls.Config, "track_changes", False)
+        )
+
+        cls.__serialize_plan__ = build_serialize_plan(cls)
+        cls.__deserialize_plan__ = build_deserialize_plan(cls)
+        cls.__trusted_validate__ = tuple(
+            field_name
+            for field_name, decoder in cls.__deserialize_plan__
+            if decoder is deserialize_json
+        )
 
         for name, field in cls.__fields__.items():
             setattr(cls, name, DetaField(field=field))
@@ -45,103 +112,565 @@ class DetaModelMetaClass(pydantic.main.ModelMetaclass):
 
     @property
     def __db__(cls):
+        if cls._db is not None:
+            return cls._db
+        backend = getattr(cls.Config, "backend", None)
+        if backend is not None:
+            cls._db = registry.get_backend_base(
+                backend,
+                cls.__db_name__,
+                asynchronous=False,
+                model=cls,
+                indexes=getattr(cls.Config, "indexes", None),
+            )
+            return cls._db
         if getattr(cls.Config, "deta_key", None) is not None:
-            deta = Deta(cls.Config.deta_key)
+            deta = registry.get_deta(cls.Config.deta_key)
             return handle_db_property(cls, deta.Base)
 
         return handle_db_property(cls, Base)
 
+    def _new_db(cls) -> _Base:
+        """Create a Base handle that is not shared through __db__"""
+        backend = getattr(cls.Config, "backend", None)
+        if backend is not None:
+            return registry.get_backend_base(
+                backend,
+                cls.__db_name__,
+                asynchronous=False,
+                indexes=getattr(cls.Config, "indexes", None),
+            )
+        if getattr(cls.Config, "deta_key", None) is not None:
+            return registry.get_deta(cls.Config.deta_key).Base(cls.__db_name__)
+        return Base(cls.__db_name__)
+
+
+class DeleteResult(NamedTuple):
+    """Outcome of deleting several keys"""
+
+    deleted: int
+    failed: List[str]
+
 
 K = TypeVar("K", bound="BaseDetaModel")
 
 
+class _Digest:
+    """Stands in for a list or dict of a stored record: a hash of its JSON, equal
+    to any list or dict with the same JSON. Much cheaper to keep than a copy."""
+
+    __slots__ = ("digest",)
+
+    def __init__(self, value: Any):
+        self.digest = hash(ujson.dumps(value, sort_keys=True))
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, _Digest):
+            return self.digest == other.digest
+        return isinstance(other, (list, dict)) and _Digest(other).digest == self.digest
+
+    __hash__ = None  # type: ignore
+
+
+def _snapshot(record: Dict[str, Any]) -> Dict[str, Any]:
+    """What a stored record looked like, to find changed fields later. Lists and
+    dicts are kept as digests, as an instance may share and change them."""
+    return {
+        name: _Digest(value) if isinstance(value, (list, dict)) else value
+        for name, value in record.items()
+    }
+
+
+_MISSING = object()
+
+# Deta Base limits put_many to 25 items per request
+PUT_MANY_LIMIT = 25
+DEFAULT_MAX_CONCURRENCY = 8
+
+
 class BaseDetaModel(BaseModel):
     __db__ = Optional[_Base]
+    __serialize_plan__: SerializePlan = ()
+    __deserialize_plan__: DeserializePlan = ()
+    # fields that still need validating when building trusted instances
+    __trusted_validate__: Tuple[str, ...] = ()
+    # partial models for field projections, by the set of fields they hold
+    __projections__: Dict[FrozenSet[str], Type["BaseDetaModel"]] = {}
+    # read-through cache for get, enabled with Config.cache_size
+    __cache__: Optional[RecordCache] = None
+    # results of query by canonical query, enabled with Config.query_cache_size
+    __query_cache__: Optional[RecordCache] = None
+    # bumped by every write, query results from an older generation are not used
+    __write_generation__: int = 0
+    # whether instances remember the record they were loaded from or saved as,
+    # for save(partial=True). Projections can't be saved and never do.
+    __track_changes__: bool = False
 
     key: Optional[str] = Field(
         default=None, title="Key", description="Primary key in the database"
     )
+    # the record as it was last loaded from or saved to Deta, to find changes
+    _stored: Optional[Dict[str, Any]] = PrivateAttr(default=None)
 
-    def _serialize(self, exclude: Optional[Container[str]] = None) -> Dict[str, Any]:
-        if not exclude:
-            exclude = []
+    def changed_fields(self) -> List[str]:
+        """Fields changed since the item was loaded or last saved. Every field
+        counts as changed for an item that has not been loaded or saved."""
+        return list(self._changes())
+
+    def _changes(self) -> Dict[str, Any]:
+        """The serialized values of the changed fields"""
+        serialized = self._serialize(exclude={"key"})
+        stored = self._stored
+        if stored is None:
+            return serialized
+        return {
+            field_name: value
+            for field_name, value in serialized.items()
+            if stored.get(field_name, _MISSING) != value
+        }
+
+    @classmethod
+    def _limiter(cls) -> Optional[TokenBucket]:
+        """The token bucket for this model's project key, if Config.rate_limit is
+        set"""
+        rate = getattr(cls.Config, "rate_limit", None)
+        if not rate:
+            return None
+        project_key = registry.resolve_project_key(
+            getattr(cls.Config, "deta_key", None)
+        )
+        return retry.bucket(
+            project_key or "", rate, getattr(cls.Config, "rate_burst", None)
+        )
 
+    @classmethod
+    def _deta_field(cls, field: Union[str, DetaField]) -> DetaField:
+        field_name = field if isinstance(field, str) else field.field.name
+        if field_name == "key" or field_name not in cls.__fields__:
+            raise DetaError(f"{field_name} is not a field of {cls.__name__}")
+        return DetaField(field=cls.__fields__[field_name])
+
+    @staticmethod
+    def _update_data(db: _Base, update: DetaUpdate) -> Dict[str, Any]:
+        """The update to send to Deta for an atomic update of a field"""
+        operation = getattr(db.util, update.operation)
+        if update.operation == "trim":
+            return {update.field: operation()}
+        return {update.field: operation(update.value)}
+
+    def _require_key(self, action: str) -> str:
+        if not self.key:
+            raise DetaError(f"Item does not have key for {action}")
+        return self.key
+
+    def _apply_update(self, update: DetaUpdate, value: Any) -> None:
+        """Make the same change Deta made to the stored item to this instance"""
+        field = self.__fields__[update.field]
+        current = getattr(self, update.field)
+        if update.operation == "increment":
+            new_value = (current or 0) + value
+        elif update.operation == "trim":
+            new_value = field.get_default()
+        else:
+            items = value if isinstance(value, list) else [value]
+            if update.operation == "append":
+                new_value = [*(current or []), *items]
+            else:
+                new_value = [*items, *(current or [])]
+        setattr(self, update.field, new_value)
+        if self._stored is not None:
+            self._stored.update(
+                _snapshot(
+                    {update.field: self._serialize_value(update.field, new_value)}
+                )
+            )
+
+    @classmethod
+    def _serialize_value(cls, field_name: str, value: Any) -> Any:
+        for name, converter in cls.__serialize_plan__:
+            if name == field_name:
+                if value is None or converter is None:
+                    return value
+                return converter(value)
+        return value
+
+    def _remember(self, record: Dict[str, Any]) -> None:
+        """Keep what the stored record looks like, if the model tracks changes"""
+        if self.__class__.__track_changes__:
+            self._stored = _snapshot(record)
+
+    def _is_partial(self, partial: Optional[bool]) -> bool:
+        """Whether a save can send only the changed fields"""
+        if partial is None:
+            partial = getattr(self.Config, "partial_updates", False)
+        if partial and not self.__class__.__track_changes__:
+            raise DetaError(
+                f"{self.__class__.__name__} does not track changes, set "
+                "partial_updates or track_changes in its Config to save partially"
+            )
+        return bool(partial and self.key and self._stored is not None)
+
+    def _serialize(self, exclude: Optional[Container[str]] = None) -> Dict[str, Any]:
+        values = self.__dict__
         as_dict: Dict[str, Any] = {}
-        for field_name, field in self.__class__.__fields__.items():
-            if field_name in exclude:
-                continue
-            elif field_name == "key" and not self.key:
+        if values.get("key") and not (exclude and "key" in exclude):
+            as_dict["key"] = values["key"]
+
+        plan: SerializePlan = self.__class__.__serialize_plan__
+        for field_name, converter in plan:
+            if exclude and field_name in exclude:
                 continue
-            elif getattr(self, field_name, None) is None:
-                as_dict[field_name] = None
-            elif field.type_ in DETA_TYPES:
-                as_dict[field_name] = getattr(self, field_name)
-            elif field.type_ == datetime.datetime:
-                as_dict[field_name] = getattr(self, field_name).timestamp()
-            elif field.type_ == datetime.date:
-                as_dict[field_name] = int(
-                    getattr(self, field_name).strftime("%Y%m%d"))
-            elif field.type_ == datetime.time:
-                as_dict[field_name] = int(
-                    getattr(self, field_name).strftime("%H%M%S%f")
-                )
+            value = values.get(field_name)
+            if value is None or converter is None:
+                as_dict[field_name] = value
             else:
-                as_dict[field_name] = ujson.loads(self.json(include={field_name}))[
-                    field_name
-                ]
+                as_dict[field_name] = converter(value)
 
         return as_dict
 
     @classmethod
-    def _deserialize(cls: Type[K], data: Dict[str, Any]) -> K:
+    def _decode(cls, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Convert a record from Deta back into values pydantic can validate"""
         as_dict: Dict[str, Any] = {}
+        plan: DeserializePlan = cls.__deserialize_plan__
+        for field_name, decoder in plan:
+            value = data.get(field_name, _MISSING)
+            if value is _MISSING:
+                continue
+            elif value is None or decoder is None:
+                as_dict[field_name] = value
+            else:
+                as_dict[field_name] = decoder(value)
+
+        return as_dict
+
+    @classmethod
+    def _serialize_batches(
+        cls, items: List["BaseDetaModel"]
+    ) -> List[List[Dict[str, Any]]]:
+        """Serialize items into batches that fit in a single put_many request"""
+        batches: List[List[Dict[str, Any]]] = []
+        for start in range(0, len(items), PUT_MANY_LIMIT):
+            # noinspection PyProtectedMember
+            batches.append(
+                [item._serialize() for item in items[start : start + PUT_MANY_LIMIT]]
+            )
+        return batches
+
+    @classmethod
+    def _max_concurrency(cls, max_concurrency: Optional[int]) -> int:
+        if max_concurrency is None:
+            return getattr(cls.Config, "max_concurrency", DEFAULT_MAX_CONCURRENCY)
+        return max_concurrency
+
+    @classmethod
+    def _projection(cls, fields: Sequence[str]) -> Type["BaseDetaModel"]:
+        """A model holding only the given fields and key, used to decode partial
+        records. Created once for each set of fields."""
+        field_names = frozenset(fields) | {"key"}
+        projection = cls.__projections__.get(field_names)
+        if projection is not None:
+            return projection
+
+        unknown = field_names - cls.__fields__.keys()
+        if unknown:
+            raise InvalidDetaQuery(
+                f"{', '.join(sorted(unknown))} not fields of {cls.__name__}"
+            )
+        definitions: Dict[str, Any] = {}
         for field_name, field in cls.__fields__.items():
-            if field_name not in data:
+            if field_name == "key" or field_name not in field_names:
+                continue
+            type_ = field.outer_type_
+            if field.allow_none:
+                type_ = Optional[type_]
+            definitions[field_name] = (type_, field.field_info)
+
+        # the field validators for the kept fields, so values are validated the
+        # same way as on the full model
+        validators: Dict[str, Any] = {}
+        for field_name, field_validators in cls.__validators__.items():
+            if field_name != "*" and field_name not in field_names:
+                continue
+            for validator in field_validators:
+                validators[f"validate_{len(validators)}"] = pydantic.validator(
+                    field_name,
+                    pre=validator.pre,
+                    each_item=validator.each_item,
+                    always=validator.always,
+                    check_fields=validator.check_fields,
+                    allow_reuse=True,
+                )(validator.func)
+
+        # create_model can't take both a base and a config
+        projection = type(BaseDetaModel)(
+            f"{cls.__name__}Projection",
+            (BaseDetaModel,),
+            {
+                "__module__": cls.__module__,
+                "__annotations__": {
+                    name: type_ for name, (type_, _) in definitions.items()
+                },
+                "Config": cls.__config__,
+                **{name: field_info for name, (_, field_info) in definitions.items()},
+                **validators,
+            },
+        )
+        projection.__deserialize_plan__ = tuple(
+            step for step in cls.__deserialize_plan__ if step[0] in field_names
+        )
+        projection.__trusted_validate__ = tuple(
+            name for name in cls.__trusted_validate__ if name in field_names
+        )
+        cls.__projections__[field_names] = projection
+        return projection
+
+    @classmethod
+    def _model_for_fields(
+        cls, fields: Optional[Sequence[str]]
+    ) -> Type["BaseDetaModel"]:
+        if fields is None:
+            return cls
+        return cls._projection(fields)
+
+    @classmethod
+    def _is_trusted(cls, trusted: Optional[bool]) -> bool:
+        if trusted is None:
+            return getattr(cls.Config, "trusted_reads", False)
+        return trusted
+
+    @classmethod
+    def _construct(cls: Type[K], values: Dict[str, Any]) -> K:
+        """Build an instance from decoded values without validating the plain Deta
+        types. Fields of any other type (nested models, ip addresses, etc.) are
+        still validated so they have the right type on the instance."""
+        fields = cls.__fields__
+        for field_name in cls.__trusted_validate__:
+            value = values.get(field_name)
+            if value is None:
                 continue
-            elif data.get(field_name) is None:
-                as_dict[field_name] = None
-            elif field.type_ in DETA_TYPES:
-                as_dict[field_name] = data[field_name]
-            elif field.type_ == datetime.datetime:
-                as_dict[field_name] = datetime.datetime.fromtimestamp(
-                    data[field_name])
-            elif field.type_ == datetime.date:
-                as_dict[field_name] = datetime.datetime.strptime(
-                    str(data[field_name]), "%Y%m%d"
-                ).date()
-            elif field.type_ == datetime.time:
-                as_dict[field_name] = datetime.datetime.strptime(
-                    str(data[field_name]), "%H%M%S%f"
-                ).time()
+            values[field_name], errors = fields[field_name].validate(
+                value, values, loc=field_name, cls=cls
+            )
+            if errors:
+                raise ValidationError([errors], cls)
+        return cls.construct(**values)
+
+    @classmethod
+    def _deserialize(
+        cls: Type[K],
+        data: Dict[str, Any],
+        trusted: Optional[bool] = None,
+        trip: Optional[Trip] = None,
+    ) -> K:
+        """Turn a record from Deta into a model instance.
+
+        :param trusted: skip pydantic validation of the record, defaults to
+            Config.trusted_reads. Only use this for data that was validated when it
+            was written.
+        :param trip: add the time spent decoding and validating to this trip
+        """
+        if trip is not None:
+            return cls._deserialize_timed(data, trusted, trip)
+        if cls._is_trusted(trusted):
+            instance = cls._construct(cls._decode(data))
+        else:
+            instance = cls.parse_obj(cls._decode(data))
+        instance._remember(data)
+        return instance
+
+    @classmethod
+    def _deserialize_timed(
+        cls: Type[K], data: Dict[str, Any], trusted: Optional[bool], trip: Trip
+    ) -> K:
+        started = time.perf_counter()
+        decoded = cls._decode(data)
+        decoded_at = time.perf_counter()
+        trip.deserialize += decoded_at - started
+        try:
+            if cls._is_trusted(trusted):
+                instance = cls._construct(decoded)
             else:
-                value = data.get(field_name)
-                # value is guaranteed to not be none above
-                try:
-                    as_dict[field_name] = ujson.loads(value)
-                except (TypeError, ValueError):
-                    as_dict[field_name] = value
+                instance = cls.parse_obj(decoded)
+        finally:
+            trip.validate += time.perf_counter() - decoded_at
+        instance._remember(data)
+        return instance
 
-        return cls.parse_obj(as_dict)
+    @classmethod
+    def _deserialize_records(
+        cls: Type[K], records: List[Dict[str, Any]], trusted: Optional[bool] = None
+    ) -> List[K]:
+        """Deserialize records fetched by several requests, reported to listeners
+        as one decode event"""
+        trip = instrumentation.start(cls, "decode")
+        if trip is None:
+            return [cls._deserialize(record, trusted=trusted) for record in records]
+        trip.items = len(records)
+        try:
+            return [
+                cls._deserialize(record, trusted=trusted, trip=trip)
+                for record in records
+            ]
+        finally:
+            instrumentation.emit(trip)
 
     @classmethod
-    def _return_item_or_raise(cls: Type[K], item: Optional[Dict[str, Any]]) -> K:
+    def _return_item_or_raise(
+        cls: Type[K],
+        item: Optional[Dict[str, Any]],
+        trusted: Optional[bool] = None,
+        trip: Optional[Trip] = None,
+    ) -> K:
         if item is None or item.get("key") == "None":
             raise ItemNotFound("Could not find item matching that key")
         try:
-            return cls._deserialize(item)
+            return cls._deserialize(item, trusted=trusted, trip=trip)
         except ValidationError:
             raise ItemNotFound("Could not find item matching that key")
 
+    @classmethod
+    def _item_or_none(
+        cls: Type[K],
+        item: Optional[Dict[str, Any]],
+        trusted: Optional[bool] = None,
+        trip: Optional[Trip] = None,
+    ) -> Optional[K]:
+        try:
+            return cls._return_item_or_raise(item, trusted=trusted, trip=trip)
+        except ItemNotFound:
+            return None
+
+    @classmethod
+    def cache_info(cls) -> Optional[CacheInfo]:
+        """Hit and miss statistics for the cache in front of get, or None when the
+        model has no cache"""
+        if cls.__cache__ is None:
+            return None
+        return cls.__cache__.info()
+
+    @classmethod
+    def query_cache_info(cls) -> Optional[CacheInfo]:
+        """Hit and miss statistics for the cache of query results, or None when the
+        model has no query cache"""
+        if cls.__query_cache__ is None:
+            return None
+        return cls.__query_cache__.info()
+
+    @classmethod
+    def clear_cache(cls) -> None:
+        if cls.__cache__ is not None:
+            cls.__cache__.clear()
+        if cls.__query_cache__ is not None:
+            cls.__query_cache__.clear()
+
+    @classmethod
+    def _invalidate(cls, keys: Iterable[Optional[str]]) -> None:
+        """Called after every write, drop the written keys from the cache and move
+        on to a new write generation, so no cached query results are used"""
+        with cls._write_lock:
+            cls.__write_generation__ += 1
+        if cls.__cache__ is not None:
+            cls.__cache__.invalidate(keys)
+
+    @classmethod
+    def _optimize(
+        cls, query_statement: Union[DetaQuery, DetaQueryStatement, DetaQueryList]
+    ) -> Union[DetaQuery, DetaQueryStatement, DetaQueryList, None]:
+        """Simplify the query unless Config.optimize_queries is False, None means
+        nothing can match it"""
+        if not getattr(cls.Config, "optimize_queries", True):
+            return query_statement
+        return optimize(query_statement)
+
+    @classmethod
+    def _as_query(
+        cls, query_statement: Union[DetaQuery, DetaQueryStatement, DetaQueryList]
+    ) -> Any:
+        """The query to send to Deta, or NO_MATCHES when there is no need to send
+        one"""
+        optimized = cls._optimize(query_statement)
+        if optimized is None:
+            return NO_MATCHES
+        return optimized.as_query()
+
+    @classmethod
+    def _query_cache_key(
+        cls,
+        query_statement: Union[DetaQuery, DetaQueryStatement, DetaQueryList],
+        limit: Optional[int],
+    ) -> Hashable:
+        return cls.__write_generation__, query_statement.canonical(), limit
+
+    @classmethod
+    def _cache_record(
+        cls, key: str, item: Optional[Dict[str, Any]], generation: int
+    ) -> None:
+        if cls.__cache__ is not None and item is not None and item.get("key") == key:
+            cls.__cache__.set(key, item, generation=generation)
+
+    @staticmethod
+    def _assign_keys(
+        items: List["BaseDetaModel"], processed: List[List[Dict[str, Any]]]
+    ) -> None:
+        """Set the keys Deta gave the items put in batches of 25"""
+        for start, records in zip(range(0, len(items), PUT_MANY_LIMIT), processed):
+            batch = items[start : start + PUT_MANY_LIMIT]
+            if len(records) != len(batch):
+                raise DetaError(
+                    f"Only {len(records)} of {len(batch)} items could be saved"
+                )
+            for item, record in zip(batch, records):
+                item.key = record["key"]
+                item._remember(record)
+
+    @staticmethod
+    def _raise_failed_deletes(failed: List[str]) -> None:
+        if failed:
+            raise DetaError(f"Could not delete {', '.join(failed)}")
+
+    @staticmethod
+    def _merge_branches(
+        branches: List[List[Dict[str, Any]]], limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Combine the results of separately fetched OR conditions, dropping
+        duplicate keys and keeping Deta's ordering by key"""
+        merged: Dict[str, Dict[str, Any]] = {}
+        for records in branches:
+            for record in records:
+                merged.setdefault(record["key"], record)
+        return [merged[key] for key in sorted(merged)[:limit]]
+
+    @staticmethod
+    def _fetch_kwargs(last: Optional[str], limit: Optional[int]) -> Dict[str, Any]:
+        """Keyword arguments for fetching the page after last"""
+        kwargs: Dict[str, Any] = {}
+        if limit is not None:
+            kwargs["limit"] = limit
+        if last is not None:
+            kwargs["last"] = last
+        return kwargs
+
+    @staticmethod
+    def _unique_keys(keys: List[str]) -> List[str]:
+        if any(key is None for key in keys):
+            raise InvalidKey("key cannot be None")
+        return list(dict.fromkeys(keys))
+
 
 T = TypeVar("T", bound="DetaModel")
+A = TypeVar("A")
+R = TypeVar("R")
 
 
 class DetaModel(BaseDetaModel, metaclass=DetaModelMetaClass):
     @classmethod
-    def get(cls: Type[T], key: str) -> T:
+    def get(cls: Type[T], key: str, trusted: Optional[bool] = None) -> T:
         """
         Get a single instance
         :param key: Deta database key
+        :param trusted: skip validation of the record, defaults to
+            Config.trusted_reads
         :return: object found in database serialized into its pydantic object
 
         :raises ItemNotFound: No matching item was found
@@ -149,86 +678,583 @@ class DetaModel(BaseDetaModel, metaclass=DetaModelMetaClass):
         if key is None:
             raise InvalidKey("key cannot be None")
 
-        item: Dict[str, Any] = cls.__db__.get(key)
-        return cls._return_item_or_raise(item)
+        cache = cls.__cache__
+        trip = None
+        if cache is None:
+            trip = instrumentation.start(cls, "get")
+            item: Optional[Dict[str, Any]] = cls._call("get", key, trip=trip)
+        else:
+            item = cache.get(key)
+            if item is None:
+                generation = cache.generation
+                trip = instrumentation.start(cls, "get")
+                item = cls._call("get", key, trip=trip)
+                cls._cache_record(key, item, generation)
+        try:
+            return cls._return_item_or_raise(item, trusted=trusted, trip=trip)
+        finally:
+            instrumentation.emit(trip)
 
     @classmethod
-    def get_or_none(cls: Type[T], key: str) -> Optional[T]:
+    def get_or_none(
+        cls: Type[T], key: str, trusted: Optional[bool] = None
+    ) -> Optional[T]:
         """Try to get item by key or return None if item not found"""
         try:
-            return cls.get(key)
+            return cls.get(key, trusted=trusted)
         except ItemNotFound:
             return None
 
     @classmethod
-    def get_all(cls: Type[T]) -> List[T]:
-        """Get all the records from the database"""
-        response: FetchResponse = cls.__db__.fetch()
-        records: List[Dict[str, Any]] = response.items
-        while response.last:
-            response = cls.__db__.fetch(last=response.last)
-            records += response.items
+    def get_many(
+        cls: Type[T],
+        keys: List[str],
+        trusted: Optional[bool] = None,
+        max_workers: Optional[int] = None,
+    ) -> List[Optional[T]]:
+        """Get several instances by key, using a pool of threads
+
+        :param keys: Deta database keys
+        :param trusted: skip validation of the records, defaults to
+            Config.trusted_reads
+        :param max_workers: number of threads getting items, defaults to
+            Config.max_workers, then Config.max_concurrency or 8
+        :return: the objects in the same order as keys, with None for any key that
+            was not found
+        """
+        unique_keys = cls._unique_keys(keys)
+        if max_workers is None:
+            max_workers = cls._max_workers(None) or cls._max_concurrency(None)
+
+        items = cls._map_with_db(
+            lambda db, key: cls._call("get", key, db=db),
+            unique_keys,
+            max_workers=max_workers,
+        )
+        trip = instrumentation.start(cls, "decode")
+        try:
+            found = {
+                key: cls._item_or_none(item, trusted=trusted, trip=trip)
+                for key, item in zip(unique_keys, items)
+            }
+        finally:
+            if trip is not None:
+                trip.items = sum(item is not None for item in items)
+            instrumentation.emit(trip)
+        return [found[key] for key in keys]
+
+    @classmethod
+    def _fetch_pages(
+        cls,
+        query: Union[Dict[str, Any], List[Any], None] = None,
+        db: Optional[_Base] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[FetchResponse]:
+        """Fetch one page at a time, following the last key until the end, or until
+        limit items have been fetched"""
+        for response, trip in cls._fetch_page_trips(query, db=db, limit=limit):
+            instrumentation.emit(trip)
+            yield response
+
+    @classmethod
+    def _fetch_page_trips(
+        cls,
+        query: Union[Dict[str, Any], List[Any], None] = None,
+        db: Optional[_Base] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[Tuple[FetchResponse, Optional[Trip]]]:
+        """Like _fetch_pages, with the trip of every page, for the caller to emit
+        once it has decoded the page"""
+        if query is NO_MATCHES:
+            return
+        if db is None:
+            db = cls.__db__
+        args = () if query is None else (query,)
+        last = None
+        remaining = limit
+        page = 0
+        while True:
+            trip = instrumentation.start(cls, "fetch", query, page)
+            page += 1
+            # a failed page is retried from the same last key
+            response: FetchResponse = cls._call(
+                "fetch", *args, db=db, trip=trip, **cls._fetch_kwargs(last, remaining)
+            )
+            yield response, trip
+            last = response.last
+            if remaining is not None:
+                remaining -= len(response.items)
+                if remaining <= 0:
+                    return
+            if not last:
+                return
 
-        return [cls._deserialize(record) for record in records]
+    @classmethod
+    def _iter_models(
+        cls: Type[T],
+        query: Union[Dict[str, Any], List[Any], None],
+        trusted: Optional[bool],
+        fields: Optional[Sequence[str]],
+        limit: Optional[int],
+    ) -> Iterator[T]:
+        model = cls._model_for_fields(fields)
+        for response, trip in cls._fetch_page_trips(query, limit=limit):
+            try:
+                for record in response.items[:limit]:
+                    yield model._deserialize(record, trusted=trusted, trip=trip)
+            finally:
+                instrumentation.emit(trip)
+            if limit is not None:
+                limit -= len(response.items)
+
+    @classmethod
+    def iter_all(
+        cls: Type[T],
+        trusted: Optional[bool] = None,
+        limit: Optional[int] = None,
+        fields: Optional[Sequence[str]] = None,
+    ) -> Iterator[T]:
+        """Iterate over all the records in the database. Only one page of records is
+        held in memory at a time.
+
+        :param limit: stop after this many records
+        :param fields: only decode these fields (and key), returning partial
+            models that only have those fields
+        """
+        return cls._iter_models(None, trusted, fields, limit)
+
+    @classmethod
+    def iter_query(
+        cls: Type[T],
+        query_statement: Union[DetaQuery, DetaQueryStatement, DetaQueryList],
+        trusted: Optional[bool] = None,
+        limit: Optional[int] = None,
+        fields: Optional[Sequence[str]] = None,
+    ) -> Iterator[T]:
+        """Iterate over items matching the query. Only one page of records is held
+        in memory at a time.
+
+        :param limit: stop after this many records
+        :param fields: only decode these fields (and key), returning partial
+            models that only have those fields
+        """
+        return cls._iter_models(cls._as_query(query_statement), trusted, fields, limit)
+
+    @classmethod
+    def get_all(
+        cls: Type[T],
+        trusted: Optional[bool] = None,
+        limit: Optional[int] = None,
+        fields: Optional[Sequence[str]] = None,
+    ) -> List[T]:
+        """Get all the records from the database
+
+        :param limit: stop after this many records
+        :param fields: only decode these fields (and key), returning partial
+            models that only have those fields
+        """
+        return list(cls.iter_all(trusted=trusted, limit=limit, fields=fields))
 
     @classmethod
     def query(
-        cls: Type[T], query_statement: Union[DetaQuery, DetaQueryStatement, DetaQueryList]
+        cls: Type[T],
+        query_statement: Union[DetaQuery, DetaQueryStatement, DetaQueryList],
+        trusted: Optional[bool] = None,
+        parallel_or: bool = False,
+        max_workers: Optional[int] = None,
+        limit: Optional[int] = None,
+        fields: Optional[Sequence[str]] = None,
     ) -> List[T]:
-        """Get items from database based on the query."""
-        response: FetchResponse = cls.__db__.fetch(query_statement.as_query())
-        records: List[Dict[str, Any]] = response.items
-        while response.last:
-            response = cls.__db__.fetch(
-                query_statement.as_query(), last=response.last)
-            records += response.items
+        """Get items from database based on the query.
+
+        :param parallel_or: run each condition of an OR query as its own fetch,
+            from a pool of threads, and merge the results. Useful for large ORs or
+            ORs whose conditions match very different numbers of items.
+        :param max_workers: number of threads for parallel_or, defaults to
+            Config.max_workers, then Config.max_concurrency or 8
+        :param limit: stop fetching once this many items have been found
+        :param fields: only decode these fields (and key), returning partial
+            models that only have those fields
 
-        return [cls._deserialize(item) for item in records]
+        With Config.query_cache_size set, the records found are cached by the
+        canonical form of the query until the next write through this model.
+        """
+        model = cls._model_for_fields(fields)
+        query_statement = cls._optimize(query_statement)
+        if query_statement is None:
+            return []
+        cache = cls.__query_cache__
+        if cache is None:
+            records = cls._query_records(
+                query_statement, parallel_or, max_workers, limit
+            )
+        else:
+            cache_key = cls._query_cache_key(query_statement, limit)
+            records = cache.get(cache_key)
+            if records is None:
+                records = cls._query_records(
+                    query_statement, parallel_or, max_workers, limit
+                )
+                cache.set(cache_key, records)
+        return model._deserialize_records(records, trusted=trusted)
+
+    @classmethod
+    def _query_records(
+        cls,
+        query_statement: Union[DetaQuery, DetaQueryStatement, DetaQueryList],
+        parallel_or: bool,
+        max_workers: Optional[int],
+        limit: Optional[int],
+    ) -> List[Dict[str, Any]]:
+        """The raw records matching the query, in Deta's order"""
+        if not (parallel_or and isinstance(query_statement, DetaQueryList)):
+            return [
+                record
+                for response in cls._fetch_pages(
+                    query_statement.as_query(), limit=limit
+                )
+                for record in response.items
+            ][:limit]
+
+        if max_workers is None:
+            max_workers = cls._max_workers(None) or cls._max_concurrency(None)
+
+        def _fetch_branch(db: _Base, query: Dict[str, Any]) -> List[Dict[str, Any]]:
+            return [
+                record
+                for response in cls._fetch_pages(query, db=db, limit=limit)
+                for record in response.items
+            ]
+
+        branches = cls._map_with_db(
+            _fetch_branch, query_statement.as_query(), max_workers=max_workers
+        )
+        return cls._merge_branches(branches, limit=limit)
+
+    @classmethod
+    def query_first(
+        cls: Type[T],
+        query_statement: Union[DetaQuery, DetaQueryStatement, DetaQueryList],
+        trusted: Optional[bool] = None,
+    ) -> Optional[T]:
+        """Get the first item matching the query, or None if nothing matches. Only
+        fetches until a match is found."""
+        return next(cls.iter_query(query_statement, trusted=trusted, limit=1), None)
+
+    @classmethod
+    def query_exists(
+        cls, query_statement: Union[DetaQuery, DetaQueryStatement, DetaQueryList]
+    ) -> bool:
+        """Check whether anything matches the query, without building any models"""
+        return any(
+            response.items
+            for response in cls._fetch_pages(cls._as_query(query_statement), limit=1)
+        )
+
+    @classmethod
+    def query_count(
+        cls,
+        query_statement: Union[
+            DetaQuery, DetaQueryStatement, DetaQueryList, None
+        ] = None,
+    ) -> int:
+        """Count the items matching the query, or all items with no query. Uses the
+        count reported by Deta for each page, nothing is deserialized."""
+        query = None if query_statement is None else cls._as_query(query_statement)
+        return sum(response.count for response in cls._fetch_pages(query))
 
     @classmethod
     def delete_key(cls, key: str) -> None:
         """Delete an item based on the key"""
-        cls.__db__.delete(key)
+        batch = batches.current_batch(asynchronous=False)
+        if batch is not None:
+            batch.delete(cls, key)
+            return
+        try:
+            cls._call("delete", key)
+        finally:
+            cls._invalidate([key])
+
+    @classmethod
+    def delete_many(
+        cls, keys: List[str], max_workers: Optional[int] = None
+    ) -> DeleteResult:
+        """Delete several items by key, using a pool of threads
+
+        :param keys: Deta database keys
+        :param max_workers: number of threads deleting items, defaults to
+            Config.max_workers, then Config.max_concurrency or 8
+        :return: how many keys were deleted and which ones failed
+        """
+        if max_workers is None:
+            max_workers = cls._max_workers(None) or cls._max_concurrency(None)
+
+        def _delete(db: _Base, key: str) -> bool:
+            try:
+                cls._call("delete", key, db=db)
+            except Exception:
+                return False
+            return True
+
+        unique_keys = cls._unique_keys(keys)
+        results = cls._map_with_db(_delete, unique_keys, max_workers=max_workers)
+        # a failed delete may still have gone through
+        cls._invalidate(unique_keys)
+        return DeleteResult(
+            deleted=sum(results),
+            failed=[key for key, deleted in zip(unique_keys, results) if not deleted],
+        )
+
+    @classmethod
+    def delete_where(
+        cls,
+        query_statement: Union[DetaQuery, DetaQueryStatement, DetaQueryList],
+        max_workers: Optional[int] = None,
+    ) -> DeleteResult:
+        """Delete every item matching the query. Matches are fetched page by page
+        and deleted by key, without being turned into models.
+
+        :param max_workers: number of threads deleting items, defaults to
+            Config.max_workers, then Config.max_concurrency or 8
+        :return: how many keys were deleted and which ones failed
+        """
+        deleted = 0
+        failed: List[str] = []
+        for response in cls._fetch_pages(cls._as_query(query_statement)):
+            result = cls.delete_many(
+                [item["key"] for item in response.items], max_workers=max_workers
+            )
+            deleted += result.deleted
+            failed.extend(result.failed)
+        return DeleteResult(deleted=deleted, failed=failed)
 
     @classmethod
-    def put_many(cls: Type[T], items: List[T]) -> List[T]:
+    def put_many(
+        cls: Type[T],
+        items: List[T],
+        trusted: Optional[bool] = None,
+        max_workers: Optional[int] = None,
+    ) -> List[T]:
         """Put multiple instances at once
 
         :param items: List of pydantic objects to put in the database
+        :param trusted: skip validation of the returned records, defaults to
+            Config.trusted_reads
+        :param max_workers: send batches of 25 from a pool of this many threads,
+            defaults to Config.max_workers. Batches are sent one at a time if
+            neither is set.
         :returns: List of items successfully added, serialized with pydantic
         """
-        records = []
-        processed: List[Dict[str, Any]] = []
-        for item in items:
-            exclude: set[str] = set()
-            if item.key is None:
-                exclude = {"key"}
-            # noinspection PyProtectedMember
-            records.append(item._serialize(exclude=exclude))
-            if len(records) == 25:
-                result = cls.__db__.put_many(records)
-                processed.extend(result["processed"]["items"])
-                records = []
-        if records:
-            result = cls.__db__.put_many(records)
-            processed.extend(result["processed"]["items"])
 
-        return [cls._deserialize(record) for record in processed]
+        return cls._deserialize_records(
+            [
+                record
+                for processed in cls._put_records(items, max_workers=max_workers)
+                for record in processed
+            ],
+            trusted=trusted,
+        )
+
+    @classmethod
+    def _put_records(
+        cls, items: List[T], max_workers: Optional[int] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """Put items in batches of 25, returning the records Deta processed for
+        each batch"""
+
+        def _put_batch(
+            db: _Base, records: List[Dict[str, Any]]
+        ) -> List[Dict[str, Any]]:
+            response = cls._call(
+                "put_many",
+                records,
+                db=db,
+                idempotent=all("key" in record for record in records),
+            )
+            return response["processed"]["items"]
+
+        try:
+            return cls._map_with_db(
+                _put_batch, cls._serialize_batches(items), max_workers=max_workers
+            )
+        finally:
+            cls._invalidate(item.key for item in items)
+
+    @classmethod
+    @contextmanager
+    def batching(cls, max_workers: Optional[int] = None) -> Iterator[batches.Batch]:
+        """Hold back save() and delete() of every model until the end of the block,
+        then put the saved items with put_many, 25 at a time, and delete the
+        deleted keys with delete_many. Keys for new items are set when the batch
+        is sent. Nothing is sent if the block raises, a batch inside another one
+        is sent with the outer one.
+
+        :param max_workers: threads sending requests, defaults to each model's
+            Config.max_workers
+        """
+        batch, token = batches.start(asynchronous=False)
+        if token is None:
+            yield batch
+            return
+        try:
+            yield batch
+        finally:
+            batches.finish(batch, token)
+
+        failed: List[str] = []
+        for model, items, keys in batch.operations():
+            if items:
+                model._assign_keys(
+                    items, model._put_records(items, max_workers=max_workers)
+                )
+            if keys:
+                failed.extend(model.delete_many(keys, max_workers=max_workers).failed)
+        cls._raise_failed_deletes(failed)
+
+    @classmethod
+    def _call(
+        cls,
+        method: str,
+        *args: Any,
+        db: Optional[_Base] = None,
+        idempotent: bool = True,
+        trip: Optional[Trip] = None,
+        **kwargs: Any,
+    ) -> Any:
+        """Send one request to Deta, through db or the shared handle. Every request
+        goes through here to be rate limited (Config.rate_limit), retried
+        (Config.retry) and reported to instrumentation listeners.
+
+        :param idempotent: whether the request can be sent twice with the same
+            effect, otherwise it is only retried when Deta turned it away
+        :param trip: the trip to time the request in, the caller emits it once
+            the response is decoded. Without one, the request is reported as soon
+            as it is done.
+        """
+        if db is None:
+            db = cls.__db__
+        owned = trip is None
+        if owned:
+            trip = instrumentation.start(cls, method)
+        if trip is None:
+            return retry.call(
+                getattr(db, method),
+                *args,
+                policy=cls.__retry__,
+                limiter=cls._limiter(),
+                idempotent=idempotent,
+                **kwargs,
+            )
+
+        started = time.perf_counter()
+        try:
+            result = retry.call(
+                getattr(db, method),
+                *args,
+                policy=cls.__retry__,
+                limiter=cls._limiter(),
+                idempotent=idempotent,
+                **kwargs,
+            )
+        except BaseException as error:
+            trip.network += time.perf_counter() - started
+            trip.error = error
+            instrumentation.emit(trip)
+            raise
+        trip.network += time.perf_counter() - started
+        trip.items = instrumentation.item_count(method, args, result)
+        if owned:
+            instrumentation.emit(trip)
+        return result
+
+    @classmethod
+    def _max_workers(cls, max_workers: Optional[int]) -> Optional[int]:
+        if max_workers is None:
+            return getattr(cls.Config, "max_workers", None)
+        return max_workers
+
+    @classmethod
+    @contextmanager
+    def _borrow_db(cls) -> Iterator[_Base]:
+        """A Base handle no other thread is using, so the shared handle is never
+        used from more than one thread at a time. Deta handles are kept in the
+        registry for later calls, backend handles hold no connection and are
+        made for each call."""
+        if getattr(cls.Config, "backend", None) is not None:
+            yield cls._new_db()
+            return
+        with registry.borrow_base(
+            getattr(cls.Config, "deta_key", None),
+            cls.__db_name__,
+            lambda name: cls._new_db(),
+        ) as db:
+            yield db
+
+    @classmethod
+    def _map_with_db(
+        cls,
+        func: Callable[[_Base, A], R],
+        args: List[A],
+        max_workers: Optional[int] = None,
+    ) -> List[R]:
+        """Call func(db, arg) for every arg and return the results in order. With
+        more than one worker the calls are made from a thread pool, each with a
+        Base handle no other thread is using at the time."""
+        max_workers = cls._max_workers(max_workers)
+        if not max_workers or max_workers < 2 or len(args) < 2:
+            db = cls.__db__
+            return [func(db, arg) for arg in args]
+
+        def _call_with_db(arg: A) -> R:
+            with cls._borrow_db() as db:
+                return func(db, arg)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(_call_with_db, args))
 
     @classmethod
     def _db_put(cls, data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        return cls.__db__.put(data)  # type: ignore
+        return cls._call("put", data, idempotent="key" in data)  # type: ignore
 
-    def save(self) -> None:
+    def save(self, partial: Optional[bool] = None) -> None:
         """Saves the record to the database. Behaves as upsert, will create
-        if not present. Database key will then be set on the object."""
+        if not present. Database key will then be set on the object. Inside a
+        batching() block the save is sent, and the key set, when the block ends.
+
+        :param partial: only send the fields changed since the item was loaded or
+            last saved, with an update, defaults to Config.partial_updates. Items
+            that were never loaded or saved are always put whole, as are items
+            saved in a batch. Raises DetaError if the model does not track
+            changes.
+        """
         # exclude = set()
         # if self.key is None:
         #     exclude.add("key")
         # # this is dumb, but it ensures everything is in a json-serializable form
         # data = ujson.loads(self.json(exclude=exclude))
-        saved = self._db_put(self._serialize())
+        batch = batches.current_batch(asynchronous=False)
+        if batch is not None:
+            batch.save(self)
+            return
+        if self._is_partial(partial):
+            self._update(self._changes())
+            return
+        data = self._serialize()
+        try:
+            saved = self._db_put(data)
+        finally:
+            self._invalidate([self.key])
         self.key = saved["key"]
+        self._remember({**data, "key": self.key})
+
+    def _update(self, changes: Dict[str, Any]) -> None:
+        if not changes:
+            return
+        try:
+            self._call("update", changes, self.key)
+        finally:
+            self._invalidate([self.key])
+        self._stored.update(_snapshot(changes))  # type: ignore
 
     def delete(self) -> None:
         """Delete the open object from the database. The object will still exist in
@@ -238,3 +1264,70 @@ class DetaModel(BaseDetaModel, metaclass=DetaModelMetaClass):
             raise DetaError("Item does not have key for deletion")
         self.delete_key(self.key)
         self.key = None
+
+    @classmethod
+    def _send_update(cls, key: str, update: DetaUpdate) -> None:
+        db = cls.__db__
+        try:
+            cls._call(
+                "update",
+                cls._update_data(db, update),
+                key,
+                db=db,
+                # repeating an increment, append or prepend would repeat its effect
+                idempotent=update.operation == "trim",
+            )
+        finally:
+            cls._invalidate([key])
+
+    @classmethod
+    def increment(
+        cls, key: str, field: Union[str, DetaField], value: Union[int, float] = 1
+    ) -> None:
+        """Add value to a number field of the item with this key, in one request
+        and without reading it first. Use a negative value to decrement."""
+        cls._send_update(key, cls._deta_field(field).increment(value))
+
+    @classmethod
+    def append_by_key(cls, key: str, field: Union[str, DetaField], value: Any) -> None:
+        """Add an item, or a list of items, to the end of a list field of the item
+        with this key, without reading it first"""
+        cls._send_update(key, cls._deta_field(field).append(value))
+
+    @classmethod
+    def prepend_by_key(cls, key: str, field: Union[str, DetaField], value: Any) -> None:
+        """Add an item, or a list of items, to the start of a list field of the
+        item with this key, without reading it first"""
+        cls._send_update(key, cls._deta_field(field).prepend(value))
+
+    @classmethod
+    def trim_by_key(cls, key: str, field: Union[str, DetaField]) -> None:
+        """Remove an optional field from the item with this key"""
+        cls._send_update(key, cls._deta_field(field).trim())
+
+    def increment_field(
+        self, field: Union[str, DetaField], value: Union[int, float] = 1
+    ) -> None:
+        """Increment a number field in the database and on this instance"""
+        update = self._deta_field(field).increment(value)
+        self._send_update(self._require_key("update"), update)
+        self._apply_update(update, value)
+
+    def append_to(self, field: Union[str, DetaField], value: Any) -> None:
+        """Append to a list field in the database and on this instance"""
+        update = self._deta_field(field).append(value)
+        self._send_update(self._require_key("update"), update)
+        self._apply_update(update, value)
+
+    def prepend_to(self, field: Union[str, DetaField], value: Any) -> None:
+        """Prepend to a list field in the database and on this instance"""
+        update = self._deta_field(field).prepend(value)
+        self._send_update(self._require_key("update"), update)
+        self._apply_update(update, value)
+
+    def trim_field(self, field: Union[str, DetaField]) -> None:
+        """Remove an optional field in the database, and reset it to its default
+        on this instance"""
+        update = self._deta_field(field).trim()
+        self._send_update(self._require_key("update"), update)
+        self._apply_update(update, None)
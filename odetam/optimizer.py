@@ -0,0 +1,229 @@
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from odetam.query import DetaQuery, DetaQueryList, DetaQueryStatement
+
+Query = Union[DetaQuery, DetaQueryStatement, DetaQueryList]
+# (value, inclusive)
+Bound = Tuple[Any, bool]
+
+# stands in for the output of as_query() when nothing can match
+NO_MATCHES: Any = object()
+
+
+class _Impossible(Exception):
+    """Raised while simplifying an AND that no item can match"""
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _equal(value: Any, other: Any) -> bool:
+    # JSON keeps booleans and numbers apart, python does not
+    if isinstance(value, bool) != isinstance(other, bool):
+        return False
+    return value == other
+
+
+def _tighter(current: Optional[Bound], new: Bound, lower: bool) -> Bound:
+    """The more restrictive of two lower (or upper) bounds"""
+    if current is None:
+        return new
+    if new[0] == current[0]:
+        return current if not current[1] else new
+    if (new[0] > current[0]) == lower:
+        return new
+    return current
+
+
+class _FieldConditions:
+    """Everything an AND says about one field"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.equals: List[Any] = []
+        self.lower: Optional[Bound] = None
+        self.upper: Optional[Bound] = None
+        self.prefix: Optional[str] = None
+        self.not_equals: List[Any] = []
+        # conditions that are passed through as they are, by condition
+        self.other: Dict[str, Any] = {}
+
+    def add(self, operator: str, value: Any) -> None:
+        if operator == "":
+            if self.equals and not _equal(self.equals[0], value):
+                raise _Impossible
+            self.equals = [value]
+        elif operator in ("gt", "gte") and _is_number(value):
+            self.lower = _tighter(self.lower, (value, operator == "gte"), lower=True)
+        elif operator in ("lt", "lte") and _is_number(value):
+            self.upper = _tighter(self.upper, (value, operator == "lte"), lower=False)
+        elif (
+            operator == "r"
+            and isinstance(value, (list, tuple))
+            and len(value) == 2
+            and all(_is_number(bound) for bound in value)
+        ):
+            self.lower = _tighter(self.lower, (value[0], True), lower=True)
+            self.upper = _tighter(self.upper, (value[1], True), lower=False)
+        elif operator == "pfx" and isinstance(value, str):
+            if self.prefix is None or value.startswith(self.prefix):
+                self.prefix = value
+            elif not self.prefix.startswith(value):
+                raise _Impossible
+        elif operator == "ne":
+            self.not_equals.append(value)
+        else:
+            self.other[f"{self.name}?{operator}"] = value
+
+    def _check_value(self, value: Any) -> None:
+        """Raise if an equality value is ruled out by the other conditions"""
+        if any(_equal(value, other) for other in self.not_equals):
+            raise _Impossible
+        if _is_number(value):
+            if self.lower is not None and (
+                value < self.lower[0] or (value == self.lower[0] and not self.lower[1])
+            ):
+                raise _Impossible
+            if self.upper is not None and (
+                value > self.upper[0] or (value == self.upper[0] and not self.upper[1])
+            ):
+                raise _Impossible
+        if self.prefix is not None and isinstance(value, str):
+            if not value.startswith(self.prefix):
+                raise _Impossible
+
+    def conditions(self) -> List[DetaQuery]:
+        lower, upper = self.lower, self.upper
+        if (
+            not self.equals
+            and lower is not None
+            and upper is not None
+            and lower[0] == upper[0]
+            and lower[1]
+            and upper[1]
+        ):
+            # a range of a single value
+            self.equals = [lower[0]]
+        if self.equals:
+            value = self.equals[0]
+            self._check_value(value)
+            # the equality already rules out everything the other conditions do,
+            # unless they could not be checked against its value
+            kept: List[DetaQuery] = [DetaQuery(condition=self.name, value=value)]
+            if not _is_number(value) and (self.lower or self.upper):
+                kept.extend(self._bounds())
+            if not isinstance(value, str) and self.prefix is not None:
+                kept.append(DetaQuery(condition=f"{self.name}?pfx", value=self.prefix))
+            return kept + self._other()
+
+        kept = self._bounds()
+        if self.prefix is not None:
+            kept.append(DetaQuery(condition=f"{self.name}?pfx", value=self.prefix))
+        kept.extend(
+            DetaQuery(condition=f"{self.name}?ne", value=value)
+            for value in self.not_equals
+        )
+        return kept + self._other()
+
+    def _bounds(self) -> List[DetaQuery]:
+        lower, upper = self.lower, self.upper
+        if lower is not None and upper is not None:
+            if lower[0] > upper[0]:
+                raise _Impossible
+            if lower[0] == upper[0]:
+                raise _Impossible
+            if lower[1] and upper[1]:
+                return [
+                    DetaQuery(condition=f"{self.name}?r", value=[lower[0], upper[0]])
+                ]
+        bounds = []
+        if lower is not None:
+            operator = "gte" if lower[1] else "gt"
+            bounds.append(
+                DetaQuery(condition=f"{self.name}?{operator}", value=lower[0])
+            )
+        if upper is not None:
+            operator = "lte" if upper[1] else "lt"
+            bounds.append(
+                DetaQuery(condition=f"{self.name}?{operator}", value=upper[0])
+            )
+        return bounds
+
+    def _other(self) -> List[DetaQuery]:
+        return [
+            DetaQuery(condition=condition, value=value)
+            for condition, value in self.other.items()
+        ]
+
+
+def _optimize_and(
+    conditions: List[DetaQuery],
+) -> Optional[Union[DetaQuery, DetaQueryStatement]]:
+    fields: Dict[str, _FieldConditions] = {}
+    try:
+        for query in conditions:
+            name, _, operator = query.condition.partition("?")
+            if name not in fields:
+                fields[name] = _FieldConditions(name)
+            fields[name].add(operator, query.value)
+        simplified = [
+            condition
+            for field_conditions in fields.values()
+            for condition in field_conditions.conditions()
+        ]
+    except _Impossible:
+        return None
+    if len(simplified) == 1:
+        return simplified[0]
+    return DetaQueryStatement(conditions=simplified)
+
+
+def _branches(query_list: DetaQueryList) -> List[Union[DetaQuery, DetaQueryStatement]]:
+    branches: List[Union[DetaQuery, DetaQueryStatement]] = []
+    for condition in query_list.conditions:
+        if isinstance(condition, DetaQueryList):
+            branches.extend(_branches(condition))
+        else:
+            branches.append(condition)
+    return branches
+
+
+def _optimize_or(query_list: DetaQueryList) -> Optional[Query]:
+    simplified = []
+    for branch in _branches(query_list):
+        optimized = optimize(branch)
+        if optimized is not None:
+            simplified.append((optimized, optimized.canonical()))
+
+    # drop repeated branches, and branches that only add conditions to another
+    # branch, as everything they match is already matched
+    kept = [
+        branch
+        for index, (branch, canonical) in enumerate(simplified)
+        if not any(
+            other < canonical or (other == canonical and other_index < index)
+            for other_index, (_, other) in enumerate(simplified)
+        )
+    ]
+    if not kept:
+        return None
+    if len(kept) == 1:
+        return kept[0]
+    return DetaQueryList(conditions=kept)
+
+
+def optimize(query: Query) -> Optional[Query]:
+    """Simplify a query before it is sent to Deta. Bounds on the same field are
+    merged into the tightest range, repeated or redundant OR branches are dropped
+    and contradictory conditions are found.
+
+    :return: an equivalent, new query, or None if nothing can match it
+    """
+    if isinstance(query, DetaQueryList):
+        return _optimize_or(query)
+    if isinstance(query, DetaQueryStatement):
+        return _optimize_and(query.conditions)
+    if isinstance(query, DetaQuery):
+        return _optimize_and([query])
+    return query
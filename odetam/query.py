@@ -1,11 +1,48 @@
-from typing import Any, List, Union, Dict
+from abc import ABC, abstractmethod
+from typing import Any, Hashable, List, Union, Dict
 
 from typing_extensions import Self
 
 from odetam.exceptions import InvalidDetaQuery
 
 
-class DetaQuery:
+def freeze(value: Any) -> Hashable:
+    """Turn the output of as_query() into a hashable form. Dicts (ANDs) become
+    frozensets, so the order of their conditions does not matter, lists become
+    tuples. Booleans are tagged, as Deta tells them apart from numbers while
+    python has True == 1."""
+    if isinstance(value, bool):
+        return (bool, value)
+    if isinstance(value, dict):
+        return frozenset((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(freeze(item) for item in value)
+    return value
+
+
+class _CanonicalQuery(ABC):
+    """Equality and hashing by what is sent to Deta, so identical queries can be
+    recognised. Queries are mutable, changing one changes its hash."""
+
+    @abstractmethod
+    def as_query(self) -> Any:
+        """The query as sent to Deta"""
+
+    def canonical(self) -> Hashable:
+        return freeze(self.as_query())
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, _CanonicalQuery):
+            return NotImplemented
+        return self.canonical() == other.canonical()
+
+    def __hash__(self) -> int:
+        return hash(self.canonical())
+
+
+class DetaQuery(_CanonicalQuery):
     def __init__(self, condition: str, value: Any):
         self.condition = condition
         self.value = value
@@ -28,7 +65,7 @@ class DetaQuery:
         return {self.condition: self.value}
 
 
-class DetaQueryList:
+class DetaQueryList(_CanonicalQuery):
     def __init__(
         self,
         conditions: List[Union["DetaQuery", "DetaQueryStatement", "DetaQueryList"]],
@@ -48,7 +85,7 @@ class DetaQueryList:
         return [query.as_query() for query in self.conditions]
 
 
-class DetaQueryStatement:
+class DetaQueryStatement(_CanonicalQuery):
     def __init__(self, conditions: List[DetaQuery]):
         self.conditions = conditions
 
@@ -0,0 +1,229 @@
+import inspect
+import os
+import threading
+import weakref
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from deta import Deta
+from deta.base import _Base
+
+from odetam.exceptions import DetaError
+
+# (project key, base name, async)
+RegistryKey = Tuple[str, str, bool]
+
+_lock = threading.Lock()
+_clients: Dict[str, Deta] = {}
+# backends named in Config.backend, created on first use
+_backends: Dict[str, Any] = {}
+# model classes holding a handle from a backend in their _db
+_backend_bound: "weakref.WeakSet[Any]" = weakref.WeakSet()
+_bases: Dict[RegistryKey, _Base] = {}
+# model classes holding each handle in their _db, reset when it is closed
+_bound: Dict[RegistryKey, "weakref.WeakSet[Any]"] = {}
+# sync handles not in use, lent to threads that must not share a handle
+_spares: Dict[RegistryKey, List[_Base]] = {}
+
+
+def resolve_project_key(project_key: Optional[str]) -> Optional[str]:
+    """The project key given, or DETA_PROJECT_KEY"""
+    return project_key or os.getenv("DETA_PROJECT_KEY") or None
+
+
+def get_deta(project_key: str) -> Deta:
+    """The Deta client for a project key, created on first use"""
+    client = _clients.get(project_key)
+    if client is not None:
+        return client
+    with _lock:
+        client = _clients.get(project_key)
+        if client is None:
+            client = _clients[project_key] = Deta(project_key)
+    return client
+
+
+def _create_backend(name: str) -> Any:
+    if name == "memory":
+        from odetam.memory import MemoryBackend
+
+        return MemoryBackend()
+    if name == "sqlite":
+        from odetam.sqlite import SQLiteBackend
+
+        return SQLiteBackend(os.getenv("ODETAM_SQLITE_PATH", "odetam.sqlite3"))
+    raise DetaError(f"Unknown backend {name!r}")
+
+
+def get_backend(backend: Any) -> Any:
+    """The backend for a model's Config.backend: the process wide backend for a
+    name like "memory", or the object itself, anything with Base(name) and
+    AsyncBase(name) methods"""
+    if not isinstance(backend, str):
+        return backend
+    found = _backends.get(backend)
+    if found is not None:
+        return found
+    with _lock:
+        found = _backends.get(backend)
+        if found is None:
+            found = _backends[backend] = _create_backend(backend)
+    return found
+
+
+def get_backend_base(
+    backend: Any,
+    name: str,
+    asynchronous: bool,
+    model: Any = None,
+    indexes: Optional[List[str]] = None,
+) -> Any:
+    """A handle for a base of a model's Config.backend
+
+    :param model: model class that stores the handle, its _db is reset when the
+        registry is cleared
+    :param indexes: fields to index, from the model's Config.indexes, for backends
+        with a create_indexes method. Others ignore them.
+    """
+    resolved = get_backend(backend)
+    if model is not None:
+        with _lock:
+            _backend_bound.add(model)
+    base = resolved.AsyncBase(name) if asynchronous else resolved.Base(name)
+    if indexes and hasattr(base, "create_indexes"):
+        base.create_indexes(indexes)
+    return base
+
+
+def get_base(
+    project_key: Optional[str],
+    name: str,
+    asynchronous: bool,
+    factory: Callable[[str], _Base],
+    model: Any = None,
+) -> _Base:
+    """The shared handle for a base, created with factory(name) on first use.
+
+    :param project_key: project key of the base, defaults to DETA_PROJECT_KEY
+    :param asynchronous: whether the handle is an AsyncBase, sync and async handles
+        for the same base are kept apart
+    :param model: model class that stores the handle, its _db is reset when the
+        handle is closed
+    """
+    resolved = resolve_project_key(project_key)
+    if resolved is None:
+        # let the Deta SDK raise its usual error for a missing project key
+        return factory(name)
+
+    key = (resolved, name, asynchronous)
+    base = _bases.get(key)
+    if base is None:
+        with _lock:
+            base = _bases.get(key)
+            if base is None:
+                base = _bases[key] = factory(name)
+    if model is not None:
+        with _lock:
+            _bound.setdefault(key, weakref.WeakSet()).add(model)
+    return base
+
+
+def _close(base: Any) -> None:
+    close = getattr(base, "close", None)
+    if close is not None:
+        close()
+
+
+@contextmanager
+def borrow_base(
+    project_key: Optional[str], name: str, factory: Callable[[str], _Base]
+) -> Iterator[_Base]:
+    """A sync handle for a base that no other thread is using, for requests sent
+    from a thread pool. It is taken from the spare handles of the base, or created
+    with factory(name), and given back afterwards, so every handle is reused by
+    later calls. close_all closes the spares."""
+    resolved = resolve_project_key(project_key)
+    if resolved is None:
+        # let the Deta SDK raise its usual error for a missing project key
+        base = factory(name)
+        try:
+            yield base
+        finally:
+            _close(base)
+        return
+
+    key = (resolved, name, False)
+    with _lock:
+        spares = _spares.get(key)
+        base = spares.pop() if spares else None
+    if base is None:
+        base = factory(name)
+    try:
+        yield base
+    finally:
+        with _lock:
+            _spares.setdefault(key, []).append(base)
+
+
+def spare_count() -> int:
+    """Sync handles kept for thread pools, across every base"""
+    with _lock:
+        return sum(len(spares) for spares in _spares.values())
+
+
+def bases(asynchronous: bool) -> List[_Base]:
+    """The sync or async handles currently in the registry"""
+    with _lock:
+        return [base for key, base in _bases.items() if key[2] == asynchronous]
+
+
+def _take(asynchronous: Optional[bool]) -> List[_Base]:
+    """Remove handles from the registry, unbinding the models that hold them"""
+    with _lock:
+        keys = [key for key in _bases if asynchronous is None or key[2] == asynchronous]
+        bases = [_bases.pop(key) for key in keys]
+        for key in keys:
+            for model in _bound.pop(key, ()):
+                model._db = None
+        if not asynchronous:
+            for spares in _spares.values():
+                bases.extend(spares)
+            _spares.clear()
+    return bases
+
+
+def close_all() -> None:
+    """Close every sync Base handle, including the spares lent to thread pools.
+    Models open a new one the next time they need it. Async handles need an event
+    loop to close, see aclose_all."""
+    for base in _take(asynchronous=False):
+        _close(base)
+
+
+async def aclose_all() -> None:
+    """Close every Base handle, sync and async"""
+    for base in _take(asynchronous=None):
+        close = getattr(base, "close", None)
+        if close is None:
+            continue
+        result = close()
+        if inspect.isawaitable(result):
+            await result
+
+
+def clear(asynchronous: Optional[bool] = None) -> None:
+    """Forget handles without closing them, for example in a forked process that
+    must not share connections with its parent
+
+    :param asynchronous: only forget the async (True) or sync (False) handles,
+        defaults to forgetting every handle, client and named backend (and with it
+        everything in the "memory" backend, the "sqlite" backend keeps its file)
+    """
+    _take(asynchronous=asynchronous)
+    if asynchronous is None:
+        with _lock:
+            _clients.clear()
+            _backends.clear()
+            for model in list(_backend_bound):
+                model._db = None
+            _backend_bound.clear()
@@ -0,0 +1,223 @@
+import asyncio
+import http.client
+import random
+import threading
+import time
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Collection,
+    Dict,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+)
+
+try:
+    from aiohttp import ClientConnectionError
+except ImportError:  # pragma: no cover
+    ClientConnectionError = ConnectionError  # type: ignore
+
+R = TypeVar("R")
+
+# raised when a request could not be sent or its response could not be read
+CONNECTION_ERRORS: Tuple[Type[BaseException], ...] = (
+    ConnectionError,
+    TimeoutError,
+    asyncio.TimeoutError,
+    http.client.HTTPException,
+    ClientConnectionError,
+)
+
+
+def _status(error: BaseException) -> Optional[int]:
+    """HTTP status of an error raised by the Deta SDK: urllib's HTTPError for sync
+    bases, aiohttp's ClientResponseError for async bases"""
+    status = getattr(error, "status", None)
+    if status is None:
+        status = getattr(error, "code", None)
+    return status if isinstance(status, int) else None
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    headers = getattr(error, "headers", None)
+    if not headers:
+        return None
+    try:
+        return max(0.0, float(headers.get("Retry-After")))
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """When, and after how long, a failed request to Deta is sent again.
+
+    Rate limited requests (429) are always retried, as Deta did nothing with them.
+    Server errors and connection errors are only retried for requests that can
+    safely be sent twice, a put without a key or an increment that may have gone
+    through is not.
+
+    :param attempts: most times a request is sent, including the first
+    :param base_delay: seconds to wait before the first retry, doubled for every
+        retry after it
+    :param max_delay: longest wait before a retry, in seconds
+    :param statuses: HTTP statuses worth retrying
+    :param jitter: wait a random time up to the delay (full jitter), so clients
+        that failed together do not retry together
+    """
+
+    def __init__(
+        self,
+        attempts: int = 5,
+        base_delay: float = 0.1,
+        max_delay: float = 10.0,
+        statuses: Collection[int] = (429, 500, 502, 503, 504),
+        jitter: bool = True,
+        random: Callable[[], float] = random.random,
+    ):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.statuses = frozenset(statuses)
+        self.jitter = jitter
+        self._random = random
+
+    def should_retry(
+        self, error: BaseException, attempt: int, idempotent: bool = True
+    ) -> bool:
+        """Whether to send a request again after its attempt-th try (counting from
+        zero) failed with error"""
+        if attempt + 1 >= self.attempts:
+            return False
+        status = _status(error)
+        if status is not None:
+            return status == 429 or (idempotent and status in self.statuses)
+        return idempotent and isinstance(error, CONNECTION_ERRORS)
+
+    def delay(self, attempt: int, error: Optional[BaseException] = None) -> float:
+        """Seconds to wait before retrying after the attempt-th try failed. A
+        Retry-After header sent with the error is honoured, up to max_delay."""
+        delay = min(self.max_delay, self.base_delay * 2**attempt)
+        if self.jitter:
+            delay *= self._random()
+        retry_after = None if error is None else _retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+
+class TokenBucket:
+    """Rate limiter allowing rate requests a second on average, and bursts of up to
+    burst requests. Safe to share between threads.
+
+    Tokens are reserved ahead of time, so callers waiting on an empty bucket are
+    spaced out evenly instead of all retrying the moment a token comes back.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1, int(rate))
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._tokens = float(self.capacity)
+        self._updated = clock()
+
+    def reserve(self) -> float:
+        """Take a token, returning the seconds to wait before using it"""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self) -> None:
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+
+    async def acquire_async(self) -> None:
+        wait = self.reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+
+_lock = threading.Lock()
+_buckets: Dict[str, TokenBucket] = {}
+
+
+def bucket(project_key: str, rate: float, burst: Optional[int] = None) -> TokenBucket:
+    """The token bucket shared by every model of a project key. It is created on
+    first use, with the rate and burst of the first model that uses it."""
+    limiter = _buckets.get(project_key)
+    if limiter is not None:
+        return limiter
+    with _lock:
+        limiter = _buckets.get(project_key)
+        if limiter is None:
+            limiter = _buckets[project_key] = TokenBucket(rate, burst)
+    return limiter
+
+
+def clear_buckets() -> None:
+    with _lock:
+        _buckets.clear()
+
+
+def call(
+    func: Callable[..., R],
+    *args: Any,
+    policy: Optional[RetryPolicy] = None,
+    limiter: Optional[TokenBucket] = None,
+    idempotent: bool = True,
+    **kwargs: Any,
+) -> R:
+    """Call func, waiting for the limiter before every try and retrying as the
+    policy allows"""
+    attempt = 0
+    while True:
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            return func(*args, **kwargs)
+        except Exception as error:
+            if policy is None or not policy.should_retry(error, attempt, idempotent):
+                raise
+            time.sleep(policy.delay(attempt, error))
+        attempt += 1
+
+
+async def call_async(
+    func: Callable[..., Awaitable[R]],
+    *args: Any,
+    policy: Optional[RetryPolicy] = None,
+    limiter: Optional[TokenBucket] = None,
+    idempotent: bool = True,
+    **kwargs: Any,
+) -> R:
+    """Await func, waiting for the limiter before every try and retrying as the
+    policy allows"""
+    attempt = 0
+    while True:
+        if limiter is not None:
+            await limiter.acquire_async()
+        try:
+            return await func(*args, **kwargs)
+        except Exception as error:
+            if policy is None or not policy.should_retry(error, attempt, idempotent):
+                raise
+            await asyncio.sleep(policy.delay(attempt, error))
+        attempt += 1
@@ -0,0 +1,130 @@
+import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+import ujson
+from pydantic import BaseModel
+
+DETA_BASIC_TYPES = [Dict[str, Any], List[Any], str, int, float, bool]
+DETA_OPTIONAL_TYPES = [Optional[type_] for type_ in DETA_BASIC_TYPES]
+DETA_BASIC_LIST_TYPES = [
+    List[type_] for type_ in DETA_BASIC_TYPES + DETA_OPTIONAL_TYPES
+]
+DETA_TYPES = DETA_BASIC_TYPES + DETA_OPTIONAL_TYPES + DETA_BASIC_LIST_TYPES
+
+Converter = Callable[[Any], Any]
+# (field name, converter); a converter of None means the value is stored as-is
+SerializePlan = Tuple[Tuple[str, Optional[Converter]], ...]
+DeserializePlan = Tuple[Tuple[str, Optional[Converter]], ...]
+
+
+def serialize_datetime(value: datetime.datetime) -> float:
+    return value.timestamp()
+
+
+def serialize_date(value: datetime.date) -> int:
+    """Store a date as an integer of the form YYYYMMDD"""
+    return value.year * 10000 + value.month * 100 + value.day
+
+
+def serialize_time(value: datetime.time) -> int:
+    """Store a time as an integer of the form HHMMSSffffff"""
+    return (
+        value.hour * 10_000_000_000
+        + value.minute * 100_000_000
+        + value.second * 1_000_000
+        + value.microsecond
+    )
+
+
+def deserialize_datetime(value: float) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(value)
+
+
+def deserialize_date(value: Any) -> datetime.date:
+    """Decode a YYYYMMDD integer with arithmetic, strptime is only used for values
+    that did not come back from Deta as an integer."""
+    if type(value) is not int:
+        return datetime.datetime.strptime(str(value), "%Y%m%d").date()
+    year, month_day = divmod(value, 10000)
+    month, day = divmod(month_day, 100)
+    return datetime.date(year, month, day)
+
+
+def deserialize_time(value: Any) -> datetime.time:
+    """Decode a HHMMSSffffff integer with arithmetic, strptime is only used for
+    values that did not come back from Deta as an integer."""
+    if type(value) is not int:
+        return datetime.datetime.strptime(str(value), "%H%M%S%f").time()
+    hour_minute_second, microsecond = divmod(value, 1_000_000)
+    hour_minute, second = divmod(hour_minute_second, 100)
+    hour, minute = divmod(hour_minute, 100)
+    return datetime.time(hour, minute, second, microsecond)
+
+
+def deserialize_json(value: Any) -> Any:
+    """Anything that is not a string is already in its decoded form, only strings
+    may hold json that needs to be loaded."""
+    if type(value) is str:
+        try:
+            return ujson.loads(value)
+        except ValueError:
+            return value
+    return value
+
+
+def _json_converter(model: Type[BaseModel]) -> Converter:
+    """Convert anything else the same way pydantic's .json() would, then bring it
+    back into plain python types that Deta can store."""
+    dumps = model.__config__.json_dumps
+    encoder = model.__json_encoder__
+
+    def _convert(value: Any) -> Any:
+        return ujson.loads(dumps(value, default=encoder))
+
+    return _convert
+
+
+def build_serialize_plan(model: Type[BaseModel]) -> SerializePlan:
+    """Work out once per model class how each field is converted for storage, so
+    serializing an instance does not need to inspect any types."""
+    plan = []
+    json_converter = None
+    for field_name, field in model.__fields__.items():
+        if field_name == "key":
+            # key is handled separately, it is only sent when it is set
+            continue
+        converter: Optional[Converter]
+        if field.type_ in DETA_TYPES:
+            converter = None
+        elif field.type_ == datetime.datetime:
+            converter = serialize_datetime
+        elif field.type_ == datetime.date:
+            converter = serialize_date
+        elif field.type_ == datetime.time:
+            converter = serialize_time
+        else:
+            if json_converter is None:
+                json_converter = _json_converter(model)
+            converter = json_converter
+        plan.append((field_name, converter))
+    return tuple(plan)
+
+
+def build_deserialize_plan(model: Type[BaseModel]) -> DeserializePlan:
+    """Work out once per model class how each field is decoded when it comes back
+    from Deta, the counterpart to build_serialize_plan."""
+    plan = []
+    for field_name, field in model.__fields__.items():
+        decoder: Optional[Converter]
+        if field.type_ in DETA_TYPES:
+            decoder = None
+        elif field.type_ == datetime.datetime:
+            decoder = deserialize_datetime
+        elif field.type_ == datetime.date:
+            decoder = deserialize_date
+        elif field.type_ == datetime.time:
+            decoder = deserialize_time
+        else:
+            decoder = deserialize_json
+        plan.append((field_name, decoder))
+    return tuple(plan)
@@ -0,0 +1,178 @@
+import asyncio
+import json
+from typing import Any, Dict, NamedTuple, Optional, Set, Tuple
+
+import aiohttp
+from deta.base import _Base
+
+from odetam import registry
+from odetam.exceptions import DetaError
+
+
+class PoolStats(NamedTuple):
+    """Usage of the connection pool shared by async models"""
+
+    limit: int
+    limit_per_host: int
+    # connections currently serving a request
+    in_use: int
+    # open connections kept alive for the next request
+    idle: int
+    sessions: int
+    requests: int
+    connections_created: int
+    connections_reused: int
+
+
+_active: Optional["AsyncSessionPool"] = None
+
+
+def current_pool() -> Optional["AsyncSessionPool"]:
+    """The open AsyncSessionPool, if there is one"""
+    return _active
+
+
+def attach(base: _Base) -> _Base:
+    """Move a new async Base handle onto the open pool's sessions, if a pool is
+    open"""
+    if _active is not None:
+        _active.bind(base)
+    return base
+
+
+class AsyncSessionPool:
+    """Shared HTTP sessions for every AsyncDetaModel, all drawing on a single
+    connection pool.
+
+    While the pool is open every async Base handle, existing or new, sends its
+    requests through it instead of through a session of its own. Closing the pool
+    closes the sessions and the handles using them, models open new handles the
+    next time they are used. Handles share sessions, so leave closing them to the
+    pool (or registry.aclose_all) rather than closing one on its own.
+
+    :param limit: most connections open at once, 0 for no limit
+    :param limit_per_host: most connections open to one host at once, 0 for no
+        limit
+    :param keepalive_timeout: seconds an idle connection is kept open for reuse
+    """
+
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 0,
+        keepalive_timeout: float = 30.0,
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self._connector: Optional[aiohttp.TCPConnector] = None
+        self._sessions: Dict[Tuple[Any, ...], aiohttp.ClientSession] = {}
+        # sessions replaced by bind, closed in the background
+        self._closing: Set["asyncio.Future[Any]"] = set()
+        self._requests = 0
+        self._connections_created = 0
+        self._connections_reused = 0
+
+    async def __aenter__(self) -> "AsyncSessionPool":
+        return await self.open()
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+    async def open(self) -> "AsyncSessionPool":
+        global _active
+        if _active is not None:
+            raise DetaError("An AsyncSessionPool is already open")
+        self._connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        _active = self
+        for base in registry.bases(asynchronous=True):
+            self.bind(base)
+        return self
+
+    async def close(self) -> None:
+        global _active
+        if _active is self:
+            _active = None
+        # the handles using these sessions can't be used any more
+        registry.clear(asynchronous=True)
+        for session in self._sessions.values():
+            await session.close()
+        self._sessions.clear()
+        if self._closing:
+            await asyncio.gather(*self._closing, return_exceptions=True)
+        if self._connector is not None:
+            await self._connector.close()
+            self._connector = None
+
+    def bind(self, base: _Base) -> None:
+        """Send the requests of an async Base handle through this pool"""
+        if self._connector is None:
+            raise DetaError("The AsyncSessionPool is not open")
+        own_session = getattr(base, "_session", None)
+        if (
+            not isinstance(own_session, aiohttp.ClientSession)
+            or own_session.connector is self._connector
+        ):
+            return
+        base._session = self._session_like(own_session)
+        if not own_session.closed:
+            closing = asyncio.ensure_future(own_session.close())
+            self._closing.add(closing)
+            closing.add_done_callback(self._closing.discard)
+
+    def _session_like(self, session: aiohttp.ClientSession) -> aiohttp.ClientSession:
+        """A pooled session sending the same headers (and so the same project key)
+        as session"""
+        headers = tuple(sorted(session.headers.items()))
+        pooled = self._sessions.get(headers)
+        if pooled is None or pooled.closed:
+            pooled = self._sessions[headers] = aiohttp.ClientSession(
+                connector=self._connector,
+                connector_owner=False,
+                headers=dict(headers),
+                json_serialize=getattr(session, "_json_serialize", json.dumps),
+                raise_for_status=getattr(session, "_raise_for_status", True),
+                trace_configs=[self._trace_config()],
+            )
+        return pooled
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        async def _on_request_start(*_: Any) -> None:
+            self._requests += 1
+
+        async def _on_connection_create_end(*_: Any) -> None:
+            self._connections_created += 1
+
+        async def _on_connection_reuseconn(*_: Any) -> None:
+            self._connections_reused += 1
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(_on_request_start)
+        trace_config.on_connection_create_end.append(_on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(_on_connection_reuseconn)
+        return trace_config
+
+    def stats(self) -> PoolStats:
+        connector = self._connector
+        in_use = idle = 0
+        if connector is not None:
+            # aiohttp has no public api for these
+            in_use = len(getattr(connector, "_acquired", ()))
+            idle = sum(
+                len(connections)
+                for connections in getattr(connector, "_conns", {}).values()
+            )
+        return PoolStats(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            in_use=in_use,
+            idle=idle,
+            sessions=len(self._sessions),
+            requests=self._requests,
+            connections_created=self._connections_created,
+            connections_reused=self._connections_reused,
+        )
@@ -0,0 +1,515 @@
+import asyncio
+import datetime
+import functools
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import ujson
+from deta.base import FetchResponse, Util
+
+from odetam.exceptions import ItemExists, KeyNotFound
+from odetam.memory import (
+    MAX_PAGE_SIZE,
+    MAX_PUT_MANY,
+    Query,
+    _is_number,
+    apply_updates,
+    prepare_item,
+    set_expiry,
+)
+
+# generated columns were added in SQLite 3.31, older versions index the
+# json_extract expression itself
+GENERATED_COLUMNS = sqlite3.sqlite_version_info >= (3, 31, 0)
+
+# SQL for a field's value and its JSON type: json_type() gives 'true', 'false',
+# 'null', 'integer', 'real', 'text', 'array' or 'object'
+Column = Tuple[str, str]
+Params = List[Any]
+
+_NUMBERS = "('integer', 'real')"
+
+
+def _identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def json_path(field: str) -> str:
+    """The JSON path of a dotted field, like $."address"."city" """
+    if '"' in field:
+        raise ValueError(f"Can't query field {field!r}, it contains a double quote")
+    return "$" + "".join(f'."{part}"' for part in field.split("."))
+
+
+def _literal(text: str) -> str:
+    return "'" + text.replace("'", "''") + "'"
+
+
+def _extract(field: str) -> str:
+    """json_extract of a field with its path written into the SQL, the same
+    expression every time, so SQLite can match it to an index"""
+    return f"json_extract(data, {_literal(json_path(field))})"
+
+
+def _equals(column: Column, expected: Any) -> Tuple[str, Params]:
+    value, kind = column
+    if isinstance(expected, bool):
+        return f"{kind} = ?", ["true" if expected else "false"]
+    if expected is None:
+        return f"{kind} = 'null'", []
+    if _is_number(expected):
+        return f"({kind} IN {_NUMBERS} AND {value} = ?)", [expected]
+    if isinstance(expected, str):
+        return f"({kind} = 'text' AND {value} = ?)", [expected]
+    if isinstance(expected, (list, dict)):
+        return f"({kind} IN ('array', 'object') AND {value} = json(?))", [
+            ujson.dumps(expected)
+        ]
+    raise ValueError(f"Can't query for {expected!r}")
+
+
+def _comparison(column: Column, sign: str, expected: Any) -> Tuple[str, Params]:
+    value, kind = column
+    if _is_number(expected):
+        return f"({kind} IN {_NUMBERS} AND {value} {sign} ?)", [expected]
+    if isinstance(expected, str):
+        return f"({kind} = 'text' AND {value} {sign} ?)", [expected]
+    # Deta only compares numbers with numbers and strings with strings
+    return "0", []
+
+
+def _range(column: Column, expected: Any) -> Tuple[str, Params]:
+    value, kind = column
+    low, high = expected
+    if _is_number(low) and _is_number(high):
+        return f"({kind} IN {_NUMBERS} AND {value} BETWEEN ? AND ?)", [low, high]
+    if isinstance(low, str) and isinstance(high, str):
+        return f"({kind} = 'text' AND {value} BETWEEN ? AND ?)", [low, high]
+    return "0", []
+
+
+def _prefix(column: Column, expected: Any) -> Tuple[str, Params]:
+    value, kind = column
+    prefix = str(expected)
+    if not prefix:
+        return f"{kind} = 'text'", []
+    # a range an index can answer, then the exact check
+    sql = f"({kind} = 'text' AND {value} >= ?"
+    params: Params = [prefix]
+    if ord(prefix[-1]) < 0x10FFFF:
+        sql += f" AND {value} < ?"
+        following = ord(prefix[-1]) + 1
+        if 0xD800 <= following <= 0xDFFF:
+            # surrogates can't be encoded, and nothing between them sorts
+            following = 0xE000
+        params.append(prefix[:-1] + chr(following))
+    sql += f" AND substr({value}, 1, ?) = ?)"
+    return sql, [*params, len(prefix), prefix]
+
+
+def _contains(column: Column, path: str, expected: Any) -> Tuple[str, Params]:
+    value, kind = column
+    item, item_params = _equals(("element.value", "element.type"), expected)
+    sql = (
+        f"({kind} = 'array' AND EXISTS "
+        f"(SELECT 1 FROM json_each(data, ?) AS element WHERE {item}))"
+    )
+    params: Params = [path, *item_params]
+    if isinstance(expected, str):
+        sql = f"(({kind} = 'text' AND instr({value}, ?) > 0) OR {sql})"
+        params.insert(0, expected)
+    return sql, params
+
+
+def _negate(sql: str, params: Params) -> Tuple[str, Params]:
+    # a missing field makes the condition NULL, which its negation must match
+    return f"NOT COALESCE({sql}, 0)", params
+
+
+_COMPARISONS = {"lt": "<", "gt": ">", "lte": "<=", "gte": ">="}
+
+
+def translate_condition(
+    condition: str, expected: Any, columns: Optional[Dict[str, str]] = None
+) -> Tuple[str, Params]:
+    """SQL for one condition of a Deta query, like "age?gt", over items stored as
+    JSON in a data column
+
+    :param columns: SQL for the value of indexed fields, used instead of
+        json_extract so SQLite can use their index
+    """
+    field, _, operator = condition.partition("?")
+    path = json_path(field)
+    if field == "key":
+        column: Column = ("key", "'text'")
+    elif columns and field in columns:
+        column = (columns[field], f"json_type(data, {_literal(path)})")
+    else:
+        column = (
+            f"json_extract(data, {_literal(path)})",
+            f"json_type(data, {_literal(path)})",
+        )
+
+    if not operator:
+        return _equals(column, expected)
+    if operator == "ne":
+        return _negate(*_equals(column, expected))
+    if operator in _COMPARISONS:
+        return _comparison(column, _COMPARISONS[operator], expected)
+    if operator == "r":
+        return _range(column, expected)
+    if operator == "pfx":
+        return _prefix(column, expected)
+    if operator == "contains":
+        return _contains(column, path, expected)
+    if operator == "not_contains":
+        return _negate(*_contains(column, path, expected))
+    raise ValueError(f"Unsupported query operator {operator}")
+
+
+def translate(
+    query: Query, columns: Optional[Dict[str, str]] = None
+) -> Tuple[str, Params]:
+    """A SQL expression and its parameters matching the items a Deta query does:
+    the dict of a DetaQueryStatement.as_query(), all of whose conditions must
+    hold, or the list of a DetaQueryList.as_query(), one of which must"""
+    if not query:
+        return "1", []
+    if isinstance(query, list):
+        branches = [translate(branch, columns) for branch in query]
+        return (
+            " OR ".join(f"({sql})" for sql, _ in branches),
+            [param for _, params in branches for param in params],
+        )
+    conditions = [
+        translate_condition(condition, expected, columns)
+        for condition, expected in query.items()
+    ]
+    return (
+        " AND ".join(sql for sql, _ in conditions),
+        [param for _, params in conditions for param in params],
+    )
+
+
+class _Table:
+    """One base, stored in a table of the backend's database"""
+
+    def __init__(self, backend: "SQLiteBackend", name: str):
+        self.backend = backend
+        self.name = name
+        self.table = _identifier(name)
+        # SQL for the value of every indexed field
+        self.columns: Dict[str, str] = {}
+        with backend.transaction() as connection:
+            connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} "
+                "(key TEXT PRIMARY KEY, data TEXT NOT NULL, expires INTEGER) "
+                "WITHOUT ROWID"
+            )
+            connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {_identifier(name + '__expires')} "
+                f"ON {self.table} (expires) WHERE expires IS NOT NULL"
+            )
+
+    def create_indexes(self, fields: Iterable[str]) -> None:
+        """Index fields, as generated columns, skipping those already indexed"""
+        fields = [
+            field for field in fields if field != "key" and field not in self.columns
+        ]
+        if not fields:
+            return
+        with self.backend.transaction() as connection:
+            existing = {
+                row[1]
+                for row in connection.execute(f"PRAGMA table_xinfo({self.table})")
+            }
+            for field in fields:
+                expression = _extract(field)
+                column = "idx_" + field.replace(".", "__")
+                if GENERATED_COLUMNS:
+                    if column not in existing:
+                        connection.execute(
+                            f"ALTER TABLE {self.table} ADD COLUMN "
+                            f"{_identifier(column)} "
+                            f"GENERATED ALWAYS AS ({expression}) VIRTUAL"
+                        )
+                    indexed = _identifier(column)
+                else:
+                    indexed = expression
+                connection.execute(
+                    "CREATE INDEX IF NOT EXISTS "
+                    f"{_identifier(self.name + '__' + column)} "
+                    f"ON {self.table} ({indexed})"
+                )
+                self.columns[field] = indexed
+
+    def _write(self, connection: sqlite3.Connection, item: Dict[str, Any]) -> str:
+        text = ujson.dumps(item)
+        expires = item.get("__expires")
+        connection.execute(
+            f"INSERT OR REPLACE INTO {self.table} (key, data, expires) "
+            "VALUES (?, ?, ?)",
+            (item["key"], text, expires if _is_number(expires) else None),
+        )
+        return text
+
+    def _read(self, connection: sqlite3.Connection, key: str) -> Optional[str]:
+        row = connection.execute(
+            f"SELECT data FROM {self.table} "
+            "WHERE key = ? AND (expires IS NULL OR expires > ?)",
+            (key, time.time()),
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self.backend.lock:
+            text = self._read(self.backend.connection, key)
+        return None if text is None else ujson.loads(text)
+
+    def put(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        with self.backend.transaction() as connection:
+            texts = [self._write(connection, item) for item in items]
+        return [ujson.loads(text) for text in texts]
+
+    def insert(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        with self.backend.transaction() as connection:
+            if self._read(connection, item["key"]) is not None:
+                raise ItemExists(f"Item with key '{item['key']}' already exists")
+            text = self._write(connection, item)
+        return ujson.loads(text)
+
+    def update(
+        self,
+        key: str,
+        updates: Dict[str, Any],
+        expire_in: Optional[int],
+        expire_at: Union[int, float, datetime.datetime, None],
+    ) -> None:
+        with self.backend.transaction() as connection:
+            text = self._read(connection, key)
+            if text is None:
+                raise KeyNotFound(f"Key '{key}' not found")
+            record = ujson.loads(text)
+            apply_updates(record, updates)
+            self._write(connection, set_expiry(record, expire_in, expire_at))
+
+    def delete(self, key: str) -> None:
+        with self.backend.transaction() as connection:
+            connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def fetch(self, query: Query, limit: int, last: Optional[str]) -> FetchResponse:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        now = time.time()
+        where, params = translate(query, self.columns)
+        sql = (
+            f"SELECT key, data FROM {self.table} "
+            f"WHERE ({where}) AND (expires IS NULL OR expires > ?)"
+        )
+        params.append(now)
+        if last:
+            sql += " AND key > ?"
+            params.append(last)
+        # one more than the page, to know whether there is another page
+        sql += " ORDER BY key LIMIT ?"
+        params.append(limit + 1)
+
+        with self.backend.transaction() as connection:
+            connection.execute(f"DELETE FROM {self.table} WHERE expires <= ?", (now,))
+            rows = connection.execute(sql, params).fetchall()
+
+        page = rows[:limit]
+        return FetchResponse(
+            count=len(page),
+            last=page[-1][0] if len(rows) > limit else None,
+            items=[ujson.loads(data) for _, data in page],
+        )
+
+
+class SQLiteBase:
+    """A Deta Base stored in SQLite, with the same methods as the Deta SDK's
+    Base"""
+
+    def __init__(self, name: str, table: _Table):
+        self.name = name
+        self.util = Util()
+        self._table = table
+
+    def close(self) -> None:
+        pass
+
+    def create_indexes(self, fields: Iterable[str]) -> None:
+        self._table.create_indexes(fields)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        if key == "":
+            raise ValueError("Key is empty")
+        return self._table.get(key)
+
+    def put(
+        self,
+        data: Any,
+        key: Optional[str] = None,
+        *,
+        expire_in: Optional[int] = None,
+        expire_at: Union[int, float, datetime.datetime, None] = None,
+    ) -> Dict[str, Any]:
+        return self._table.put([prepare_item(data, key, expire_in, expire_at)])[0]
+
+    def put_many(
+        self,
+        items: List[Any],
+        *,
+        expire_in: Optional[int] = None,
+        expire_at: Union[int, float, datetime.datetime, None] = None,
+    ) -> Dict[str, Any]:
+        if len(items) > MAX_PUT_MANY:
+            raise AssertionError("We can't put more than 25 items at a time.")
+        prepared = [prepare_item(item, None, expire_in, expire_at) for item in items]
+        return {"processed": {"items": self._table.put(prepared)}}
+
+    def insert(
+        self,
+        data: Any,
+        key: Optional[str] = None,
+        *,
+        expire_in: Optional[int] = None,
+        expire_at: Union[int, float, datetime.datetime, None] = None,
+    ) -> Dict[str, Any]:
+        return self._table.insert(prepare_item(data, key, expire_in, expire_at))
+
+    def update(
+        self,
+        updates: Dict[str, Any],
+        key: str,
+        *,
+        expire_in: Optional[int] = None,
+        expire_at: Union[int, float, datetime.datetime, None] = None,
+    ) -> None:
+        if key == "":
+            raise ValueError("Key is empty")
+        self._table.update(key, updates, expire_in, expire_at)
+
+    def delete(self, key: str) -> None:
+        if key == "":
+            raise ValueError("Key is empty")
+        self._table.delete(key)
+
+    def fetch(
+        self,
+        query: Query = None,
+        limit: int = MAX_PAGE_SIZE,
+        last: Optional[str] = None,
+    ) -> FetchResponse:
+        return self._table.fetch(query, limit, last)
+
+
+class AsyncSQLiteBase:
+    """SQLiteBase with the coroutine methods of the Deta SDK's AsyncBase, running
+    queries in the event loop's default executor"""
+
+    def __init__(self, name: str, table: _Table):
+        self.name = name
+        self.util = Util()
+        self._base = SQLiteBase(name, table)
+
+    async def _run(self, method: str, *args: Any, **kwargs: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(getattr(self._base, method), *args, **kwargs)
+        )
+
+    async def close(self) -> None:
+        pass
+
+    def create_indexes(self, fields: Iterable[str]) -> None:
+        self._base.create_indexes(fields)
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return await self._run("get", key)
+
+    async def put(self, data: Any, key: Optional[str] = None, **expiry: Any) -> Any:
+        return await self._run("put", data, key, **expiry)
+
+    async def put_many(self, items: List[Any], **expiry: Any) -> Dict[str, Any]:
+        return await self._run("put_many", items, **expiry)
+
+    async def insert(self, data: Any, key: Optional[str] = None, **expiry: Any) -> Any:
+        return await self._run("insert", data, key, **expiry)
+
+    async def update(self, updates: Dict[str, Any], key: str, **expiry: Any) -> None:
+        return await self._run("update", updates, key, **expiry)
+
+    async def delete(self, key: str) -> None:
+        return await self._run("delete", key)
+
+    async def fetch(
+        self,
+        query: Query = None,
+        *,
+        limit: int = MAX_PAGE_SIZE,
+        last: Optional[str] = None,
+    ) -> FetchResponse:
+        return await self._run("fetch", query, limit=limit, last=last)
+
+
+class SQLiteBackend:
+    """Stores bases in a SQLite database instead of Deta, one table per base, each
+    item as JSON. Use it for a model with Config.backend = "sqlite" (a database
+    shared by the whole process, at $ODETAM_SQLITE_PATH or odetam.sqlite3) or
+    Config.backend = SQLiteBackend(path) for one of its own.
+
+    Queries are translated to SQL, and work as they do on Deta, as do paging,
+    updates and the limits of put_many. Fields in a model's Config.indexes are
+    stored in generated columns with an index, for queries on them to use.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self.lock = threading.RLock()
+        # one connection, shared by every thread under the lock
+        self.connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        if path != ":memory:":
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+        self._tables: Dict[str, _Table] = {}
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        with self.lock:
+            if self.connection.in_transaction:
+                yield self.connection
+                return
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.connection
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    def _table(self, name: str) -> _Table:
+        with self.lock:
+            table = self._tables.get(name)
+            if table is None:
+                table = self._tables[name] = _Table(self, name)
+        return table
+
+    def Base(self, name: str) -> SQLiteBase:
+        return SQLiteBase(name, self._table(name))
+
+    def AsyncBase(self, name: str) -> AsyncSQLiteBase:
+        return AsyncSQLiteBase(name, self._table(name))
+
+    def clear(self) -> None:
+        """Delete every item of every base"""
+        with self.transaction() as connection:
+            for table in self._tables.values():
+                connection.execute(f"DELETE FROM {table.table}")
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
@@ -4,6 +4,7 @@ import uuid
 import pytest
 from faker import Faker
 
+from odetam import registry, retry
 from odetam.query import DetaQuery
 
 TEST_UUID = uuid.uuid4()
@@ -11,6 +12,13 @@ TEST_UUID = uuid.uuid4()
 print("unique test id", TEST_UUID)
 
 
+@pytest.fixture(autouse=True)
+def clear_registry():
+    yield
+    registry.clear()
+    retry.clear_buckets()
+
+
 @pytest.fixture
 def unique_test_id():
     return str(TEST_UUID)
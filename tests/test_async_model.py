@@ -10,7 +10,9 @@ from pydantic import EmailStr
 
 from odetam.async_model import AsyncDetaModel
 from odetam.exceptions import ItemNotFound, DetaError, InvalidKey
+from odetam.model import DeleteResult
 from odetam.field import DetaField
+from odetam.retry import RetryPolicy
 
 
 @pytest.fixture
@@ -34,6 +36,9 @@ def Captain(monkeypatch):
         joined: datetime.date
         ships: List[str]
 
+        class Config:
+            track_changes = True
+
     _Captain._db = mock.MagicMock()
     return _Captain
 
@@ -478,3 +483,597 @@ async def test_delete_no_key(captains, Captain):
 async def test_none_as_key_raises(Basic):
     with pytest.raises(InvalidKey):
         await Basic.get(None)
+
+
+@pytest.mark.asyncio
+async def test_async_trusted_get_skips_validation(Captain):
+    Captain._db.get.return_value = future_with(
+        {
+            "name": "Jean-Luc Picard",
+            "joined": 23230101,
+            "ships": ["Enterprise-D"],
+            "key": "key5",
+        }
+    )
+    with mock.patch.object(Captain, "parse_obj") as parse_obj:
+        picard = await Captain.get("key5", trusted=True)
+
+    parse_obj.assert_not_called()
+    assert picard.joined == datetime.date(2323, 1, 1)
+    assert picard.key == "key5"
+
+
+@pytest.mark.asyncio
+async def test_async_trusted_get_all_and_query(
+    Captain, captains_with_keys_list, FakeResult
+):
+    async def _mock_fetch(*args, **kwargs):
+        return FakeResult(captains_with_keys_list)
+
+    Captain._db.fetch = _mock_fetch
+    with mock.patch.object(Captain, "parse_obj") as parse_obj:
+        records = await Captain.get_all(trusted=True)
+        results = await Captain.query(Captain.name == "James T. Kirk", trusted=True)
+
+    parse_obj.assert_not_called()
+    assert [record.key for record in records] == ["key1", "key2"]
+    assert len(results) == 2
+
+
+@pytest.mark.asyncio
+async def test_async_trusted_put_many(Captain, captains, captains_with_keys_list):
+    Captain._db.put_many.return_value = future_with(
+        put_returns_items(captains_with_keys_list)
+    )
+    with mock.patch.object(Captain, "parse_obj") as parse_obj:
+        saved = await Captain.put_many(captains, trusted=True)
+
+    parse_obj.assert_not_called()
+    assert [captain.key for captain in saved] == ["key1", "key2"]
+
+
+@pytest.mark.asyncio
+async def test_async_aiter_all_prefetches_next_page(
+    Captain, captains_with_keys_list, FakeResult
+):
+    calls = []
+
+    async def _mock_fetch(*args, **kwargs):
+        calls.append(kwargs.get("last"))
+        if kwargs.get("last") is None:
+            return FakeResult(captains_with_keys_list[:1], last="key1")
+        return FakeResult(captains_with_keys_list[1:])
+
+    Captain._db.fetch = _mock_fetch
+
+    records = Captain.aiter_all()
+    first = await records.__anext__()
+    # let the background fetch run while the first page is being consumed
+    await asyncio.sleep(0)
+    assert calls == [None, "key1"]
+
+    rest = [record async for record in records]
+    assert [first.key] + [record.key for record in rest] == ["key1", "key2"]
+
+
+@pytest.mark.asyncio
+async def test_async_aiter_query_without_prefetch(
+    Captain, captains_with_keys_list, FakeResult
+):
+    calls = []
+
+    async def _mock_fetch(query, last=None):
+        calls.append((query, last))
+        if last is None:
+            return FakeResult(captains_with_keys_list[:1], last="key1")
+        return FakeResult(captains_with_keys_list[1:])
+
+    Captain._db.fetch = _mock_fetch
+
+    records = Captain.aiter_query(Captain.name.prefix("B"), prefetch=0)
+    await records.__anext__()
+    await asyncio.sleep(0)
+    assert calls == [({"name?pfx": "B"}, None)]
+
+    assert len([record async for record in records]) == 1
+    assert calls[1] == ({"name?pfx": "B"}, "key1")
+
+
+@pytest.mark.asyncio
+async def test_async_aiter_close_cancels_inflight_fetch(
+    Captain, captains_with_keys_list, FakeResult
+):
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    async def _mock_fetch(*args, last=None):
+        if last is None:
+            return FakeResult(captains_with_keys_list[:1], last="key1")
+        started.set()
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    Captain._db.fetch = _mock_fetch
+
+    records = Captain.aiter_all()
+    await records.__anext__()
+    await asyncio.wait_for(started.wait(), 1)
+    await records.aclose()
+
+    assert cancelled.is_set()
+
+
+@pytest.mark.asyncio
+async def test_async_aiter_raises_fetch_errors(
+    Captain, captains_with_keys_list, FakeResult
+):
+    async def _mock_fetch(*args, last=None):
+        if last is None:
+            return FakeResult(captains_with_keys_list[:1], last="key1")
+        raise ConnectionError("lost connection")
+
+    Captain._db.fetch = _mock_fetch
+
+    with pytest.raises(ConnectionError):
+        await Captain.get_all()
+
+
+@pytest.mark.asyncio
+async def test_async_put_many_sends_batches_concurrently(
+    Captain, make_bunch_of_random_captains
+):
+    captains, captain_data, _ = make_bunch_of_random_captains(Captain, 130)
+    in_flight = 0
+    most_in_flight = 0
+
+    async def _mock_put_many(records):
+        nonlocal in_flight, most_in_flight
+        in_flight += 1
+        most_in_flight = max(most_in_flight, in_flight)
+        # the last, smaller, batch finishes first
+        await asyncio.sleep(0.0001 * len(records))
+        in_flight -= 1
+        return put_returns_items(
+            [{**record, "key": f"key-{record['name']}"} for record in records]
+        )
+
+    Captain._db.put_many = _mock_put_many
+
+    results = await Captain.put_many(captains, max_concurrency=3)
+
+    assert most_in_flight == 3
+    assert [result.name for result in results] == [
+        captain["name"] for captain in captain_data
+    ]
+    assert all(result.key == f"key-{result.name}" for result in results)
+
+
+@pytest.mark.asyncio
+async def test_async_put_many_concurrency_from_config(
+    monkeypatch, make_bunch_of_random_captains
+):
+    monkeypatch.setenv("DETA_PROJECT_KEY", "123_123")
+
+    class SerialCaptain(AsyncDetaModel):
+        name: str
+        joined: datetime.date
+        ships: List[str]
+
+        class Config:
+            max_concurrency = 1
+
+    captains, _, _ = make_bunch_of_random_captains(SerialCaptain, 60)
+    in_flight = 0
+    most_in_flight = 0
+
+    async def _mock_put_many(records):
+        nonlocal in_flight, most_in_flight
+        in_flight += 1
+        most_in_flight = max(most_in_flight, in_flight)
+        await asyncio.sleep(0)
+        in_flight -= 1
+        return put_returns_items(records)
+
+    SerialCaptain._db = mock.MagicMock()
+    SerialCaptain._db.put_many = _mock_put_many
+
+    assert len(await SerialCaptain.put_many(captains)) == 60
+    assert most_in_flight == 1
+
+
+@pytest.mark.asyncio
+async def test_async_get_many(Captain, captains_with_keys_list):
+    records = {record["key"]: record for record in captains_with_keys_list}
+    records["key3"] = {"key": "None"}
+    in_flight = 0
+    most_in_flight = 0
+
+    async def _mock_get(key):
+        nonlocal in_flight, most_in_flight
+        in_flight += 1
+        most_in_flight = max(most_in_flight, in_flight)
+        await asyncio.sleep(0)
+        in_flight -= 1
+        return records.get(key)
+
+    Captain._db.get = _mock_get
+
+    results = await Captain.get_many(
+        ["key2", "missing", "key1", "key3", "key2"], max_concurrency=2
+    )
+
+    assert most_in_flight == 2
+    assert [result and result.key for result in results] == [
+        "key2",
+        None,
+        "key1",
+        None,
+        "key2",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_async_get_many_none_key_raises(Captain):
+    with pytest.raises(InvalidKey):
+        await Captain.get_many([None])
+
+
+@pytest.mark.asyncio
+async def test_async_delete_many_reports_failures(Captain):
+    deleted = []
+
+    async def _mock_delete(key):
+        if key == "key2":
+            raise ConnectionError("lost connection")
+        deleted.append(key)
+
+    Captain._db.delete = _mock_delete
+
+    result = await Captain.delete_many(["key1", "key2", "key3", "key1"])
+
+    assert result == DeleteResult(deleted=2, failed=["key2"])
+    assert deleted == ["key1", "key3"]
+
+
+@pytest.mark.asyncio
+async def test_async_delete_where(Captain, captains_with_keys_list, FakeResult):
+    deleted = []
+
+    async def _mock_fetch(query, last=None):
+        assert query == {"name?pfx": "B"}
+        if last is None:
+            return FakeResult(captains_with_keys_list[:1], last="key1")
+        return FakeResult(captains_with_keys_list[1:])
+
+    async def _mock_delete(key):
+        deleted.append(key)
+
+    Captain._db.fetch = _mock_fetch
+    Captain._db.delete = _mock_delete
+
+    with mock.patch.object(Captain, "_deserialize") as deserialize:
+        result = await Captain.delete_where(Captain.name.prefix("B"))
+
+    deserialize.assert_not_called()
+    assert result == DeleteResult(deleted=2, failed=[])
+    assert deleted == ["key1", "key2"]
+
+
+@pytest.mark.asyncio
+async def test_async_query_parallel_or(Captain, captains_with_keys_list, FakeResult):
+    kirk, sisko = captains_with_keys_list
+    calls = []
+
+    async def _mock_fetch(query, last=None):
+        calls.append((query, last))
+        if query == {"name": "Benjamin Sisko"}:
+            return FakeResult([sisko])
+        if last is None:
+            return FakeResult([kirk], last="key1")
+        return FakeResult([sisko])
+
+    Captain._db.fetch = _mock_fetch
+
+    results = await Captain.query(
+        (Captain.name == "Benjamin Sisko") | Captain.ships.contains("Enterprise"),
+        parallel_or=True,
+    )
+
+    assert len(calls) == 3
+    assert [result.key for result in results] == ["key1", "key2"]
+
+
+@pytest.fixture
+def paged_fetch(FakeResult):
+    """Serve records in pages of the given size, honouring limit and last"""
+
+    def _make(records, page_size=1):
+        calls = []
+
+        async def _mock_fetch(*args, limit=1000, last=None):
+            calls.append((args, limit, last))
+            start = 0
+            if last is not None:
+                start = [record["key"] for record in records].index(last) + 1
+            page = records[start : start + min(limit, page_size)]
+            more = start + len(page) < len(records)
+            result = FakeResult(page, last=page[-1]["key"] if more else None)
+            result.count = len(page)
+            return result
+
+        return _mock_fetch, calls
+
+    return _make
+
+
+@pytest.mark.asyncio
+async def test_async_query_limit_stops_fetching(
+    Captain, make_bunch_of_random_captains, paged_fetch
+):
+    _, _, records = make_bunch_of_random_captains(Captain, 6)
+    for i, record in enumerate(records):
+        record["key"] = f"key{i}"
+    Captain._db.fetch, calls = paged_fetch(records, page_size=2)
+
+    results = await Captain.query(Captain.name.prefix("B"), limit=3)
+
+    assert calls == [
+        (({"name?pfx": "B"},), 3, None),
+        (({"name?pfx": "B"},), 1, "key1"),
+    ]
+    assert [result.key for result in results] == ["key0", "key1", "key2"]
+
+
+@pytest.mark.asyncio
+async def test_async_first_exists_and_count(
+    Captain, captains_with_keys_list, paged_fetch
+):
+    Captain._db.fetch, calls = paged_fetch(captains_with_keys_list)
+
+    first = await Captain.query_first(Captain.name.prefix("B"))
+    assert first.key == "key1"
+    assert len(calls) == 1
+
+    with mock.patch.object(Captain, "_deserialize") as deserialize:
+        assert await Captain.query_exists(Captain.name.prefix("B")) is True
+        assert await Captain.query_count(Captain.name.prefix("B")) == 2
+    deserialize.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_async_not_exists_and_no_first(Captain, paged_fetch):
+    Captain._db.fetch, _ = paged_fetch([])
+
+    assert await Captain.query_exists(Captain.name == "Nobody") is False
+    assert await Captain.query_first(Captain.name == "Nobody") is None
+    assert await Captain.query_count() == 0
+
+
+@pytest.mark.asyncio
+async def test_async_query_with_fields(Captain, captains_with_keys_list, paged_fetch):
+    Captain._db.fetch, _ = paged_fetch(captains_with_keys_list)
+
+    results = await Captain.query(Captain.name.prefix("B"), fields=["joined"])
+    everything = await Captain.get_all(fields=["joined"])
+
+    assert [result.dict() for result in results] == [
+        {"key": "key1", "joined": datetime.date(2252, 1, 1)},
+        {"key": "key2", "joined": datetime.date(2350, 1, 1)},
+    ]
+    assert not hasattr(results[0], "name")
+    assert type(everything[0]) is type(results[0])
+
+
+@pytest.mark.asyncio
+async def test_async_get_served_from_cache_and_invalidated(monkeypatch):
+    monkeypatch.setenv("DETA_PROJECT_KEY", "123_123")
+
+    class _CachedCaptain(AsyncDetaModel):
+        name: str
+        joined: datetime.date
+        ships: List[str]
+
+        class Config:
+            cache_size = 10
+
+    async def _get(key):
+        return {
+            "key": key,
+            "name": "James T. Kirk",
+            "joined": 22520101,
+            "ships": ["Enterprise"],
+        }
+
+    async def _put(data):
+        return data
+
+    async def _put_many(records):
+        return {"processed": {"items": records}}
+
+    async def _delete(key):
+        return None
+
+    _CachedCaptain._db = mock.MagicMock()
+    _CachedCaptain._db.get.side_effect = _get
+    _CachedCaptain._db.put.side_effect = _put
+    _CachedCaptain._db.put_many.side_effect = _put_many
+    _CachedCaptain._db.delete.side_effect = _delete
+
+    kirk = await _CachedCaptain.get("key1")
+    assert await _CachedCaptain.get_or_none("key1") == kirk
+    assert _CachedCaptain._db.get.call_count == 1
+
+    await kirk.save()
+    await _CachedCaptain.get("key1")
+    await _CachedCaptain.put_many([kirk])
+    await _CachedCaptain.get("key1")
+    await _CachedCaptain.delete_many(["key1"])
+    await _CachedCaptain.get("key1")
+    await kirk.delete()
+    await _CachedCaptain.get("key1")
+
+    assert _CachedCaptain._db.get.call_count == 5
+    assert _CachedCaptain.cache_info().hits == 1
+
+
+@pytest.mark.asyncio
+async def test_async_query_results_cached(
+    monkeypatch, captains_with_keys_list, paged_fetch
+):
+    monkeypatch.setenv("DETA_PROJECT_KEY", "123_123")
+
+    class _QueryCachedCaptain(AsyncDetaModel):
+        name: str
+        joined: datetime.date
+        ships: List[str]
+
+        class Config:
+            query_cache_size = 4
+
+    _QueryCachedCaptain._db = mock.MagicMock()
+    _QueryCachedCaptain._db.fetch, calls = paged_fetch(captains_with_keys_list)
+    _QueryCachedCaptain._db.delete.side_effect = lambda key: future_with(None)
+
+    first = await _QueryCachedCaptain.query(_QueryCachedCaptain.name.prefix("B"))
+    second = await _QueryCachedCaptain.query(_QueryCachedCaptain.name.prefix("B"))
+    await _QueryCachedCaptain.delete_key("key3")
+    third = await _QueryCachedCaptain.query(_QueryCachedCaptain.name.prefix("B"))
+
+    assert first == second == third
+    assert len(calls) == 2 * len(captains_with_keys_list)
+    assert _QueryCachedCaptain.query_cache_info().hits == 1
+
+
+@pytest.mark.asyncio
+async def test_async_impossible_query_not_fetched(Captain):
+    impossible = (Captain.name == "James T. Kirk") & (Captain.name == "Benjamin Sisko")
+
+    assert await Captain.query(impossible) == []
+    assert [captain async for captain in Captain.aiter_query(impossible)] == []
+    assert await Captain.query_first(impossible) is None
+    assert await Captain.query_exists(impossible) is False
+    assert await Captain.query_count(impossible) == 0
+    assert await Captain.delete_where(impossible) == (0, [])
+
+    Captain._db.fetch.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_async_batch(Captain, Basic):
+    new_keys = (f"new{i}" for i in range(1000))
+
+    async def _put_many(records):
+        return {
+            "processed": {
+                "items": [
+                    {**record, "key": record.get("key") or next(new_keys)}
+                    for record in records
+                ]
+            }
+        }
+
+    async def _delete(key):
+        return None
+
+    Captain._db.put_many.side_effect = _put_many
+    Captain._db.delete.side_effect = _delete
+    Basic._db.put_many.side_effect = _put_many
+    captains = [
+        Captain(name=f"Captain {i}", joined=datetime.date(2300, 1, 1), ships=[])
+        for i in range(30)
+    ]
+    basic = Basic(name="basic")
+
+    async with AsyncDetaModel.batching():
+        await asyncio.gather(*(captain.save() for captain in captains))
+        await basic.save()
+        await Captain.delete_key("key1")
+        Captain._db.put_many.assert_not_called()
+        Captain._db.delete.assert_not_called()
+
+    assert [len(call.args[0]) for call in Captain._db.put_many.call_args_list] == [
+        25,
+        5,
+    ]
+    assert [captain.key for captain in captains] == [f"new{i}" for i in range(30)]
+    assert basic.key == "new30"
+    Captain._db.delete.assert_called_once_with("key1")
+    Captain._db.put.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_async_partial_save(Captain):
+    Captain._db.get.return_value = future_with(
+        {"key": "key1", "name": "James T. Kirk", "joined": 22520101, "ships": []}
+    )
+    Captain._db.update.return_value = future_with(None)
+    kirk = await Captain.get("key1")
+
+    kirk.ships.append("Enterprise")
+    await kirk.save(partial=True)
+
+    Captain._db.update.assert_called_once_with({"ships": ["Enterprise"]}, "key1")
+    Captain._db.put.assert_not_called()
+    assert kirk.changed_fields() == []
+
+
+@pytest.mark.asyncio
+async def test_async_atomic_updates(monkeypatch):
+    monkeypatch.setenv("DETA_PROJECT_KEY", "123_123")
+
+    class _Officer(AsyncDetaModel):
+        name: str
+        commendations: int = 0
+        postings: List[str] = []
+
+        class Config:
+            track_changes = True
+
+    _Officer._db = mock.MagicMock()
+    _Officer._db.util.increment.side_effect = lambda value: ("increment", value)
+    _Officer._db.util.append.side_effect = lambda value: ("append", value)
+    _Officer._db.update.side_effect = lambda *args: future_with(None)
+    _Officer._db.get.return_value = future_with(
+        {"key": "key1", "name": "Spock", "commendations": 3, "postings": []}
+    )
+
+    await _Officer.increment("key1", "commendations", 2)
+    spock = await _Officer.get("key1")
+    await spock.append_to("postings", "Enterprise")
+
+    assert _Officer._db.update.call_args_list == [
+        mock.call({"commendations": ("increment", 2)}, "key1"),
+        mock.call({"postings": ("append", ["Enterprise"])}, "key1"),
+    ]
+    assert spock.postings == ["Enterprise"]
+    assert spock.changed_fields() == []
+
+
+@pytest.mark.asyncio
+async def test_async_requests_retried(monkeypatch):
+    monkeypatch.setenv("DETA_PROJECT_KEY", "123_123")
+
+    class _Captain(AsyncDetaModel):
+        name: str
+
+        class Config:
+            retry = RetryPolicy(base_delay=0)
+
+    attempts = []
+
+    async def _get(key):
+        attempts.append(key)
+        if len(attempts) == 1:
+            raise ConnectionResetError
+        return {"key": key, "name": "James T. Kirk"}
+
+    _Captain._db = mock.MagicMock()
+    _Captain._db.get = _get
+
+    kirk = await _Captain.get("key1")
+
+    assert kirk.name == "James T. Kirk"
+    assert attempts == ["key1", "key1"]
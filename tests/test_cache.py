@@ -0,0 +1,106 @@
+import threading
+
+from odetam.cache import CacheInfo, RecordCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_get_missing_counts_miss():
+    cache = RecordCache(2)
+
+    assert cache.get("key1") is None
+    assert cache.info() == CacheInfo(hits=0, misses=1, size=0, max_size=2, ttl=None)
+
+
+def test_get_returns_copy_of_record():
+    cache = RecordCache(2)
+    record = {"key": "key1", "ships": ["Enterprise"]}
+    cache.set("key1", record)
+    record["ships"].append("Defiant")
+
+    cached = cache.get("key1")
+    cached["ships"].append("Reliant")
+
+    assert cache.get("key1") == {"key": "key1", "ships": ["Enterprise"]}
+    assert cache.info().hits == 2
+
+
+def test_least_recently_used_evicted():
+    cache = RecordCache(2)
+    cache.set("key1", {"key": "key1"})
+    cache.set("key2", {"key": "key2"})
+    cache.get("key1")
+    cache.set("key3", {"key": "key3"})
+
+    assert cache.get("key2") is None
+    assert cache.get("key1") == {"key": "key1"}
+    assert cache.get("key3") == {"key": "key3"}
+    assert cache.info().size == 2
+
+
+def test_records_expire_after_ttl():
+    clock = FakeClock()
+    cache = RecordCache(2, ttl=10, clock=clock)
+    cache.set("key1", {"key": "key1"})
+
+    clock.now = 9.9
+    assert cache.get("key1") == {"key": "key1"}
+    clock.now = 10
+    assert cache.get("key1") is None
+    assert cache.info().size == 0
+
+
+def test_invalidate_drops_keys():
+    cache = RecordCache(4)
+    cache.set("key1", {"key": "key1"})
+    cache.set("key2", {"key": "key2"})
+
+    cache.invalidate(["key1", None, "missing"])
+
+    assert cache.get("key1") is None
+    assert cache.get("key2") == {"key": "key2"}
+
+
+def test_set_ignored_after_write_since_generation():
+    cache = RecordCache(2)
+    generation = cache.generation
+    cache.invalidate(["key1"])
+
+    cache.set("key1", {"key": "key1"}, generation=generation)
+
+    assert cache.get("key1") is None
+
+
+def test_clear_resets_records_and_stats():
+    cache = RecordCache(2)
+    cache.set("key1", {"key": "key1"})
+    cache.get("key1")
+
+    cache.clear()
+
+    assert cache.info() == CacheInfo(hits=0, misses=0, size=0, max_size=2, ttl=None)
+
+
+def test_threads_share_cache():
+    cache = RecordCache(50)
+
+    def _work(start):
+        for i in range(start, start + 100):
+            cache.set(f"key{i % 75}", {"key": f"key{i % 75}"})
+            cache.get(f"key{(i * 7) % 75}")
+
+    threads = [threading.Thread(target=_work, args=(i * 100,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    info = cache.info()
+    assert info.hits + info.misses == 800
+    assert info.size == 50
@@ -42,3 +42,32 @@ def test_deta_query_or_deta_query_list(query_one, query_two, query_three):
 
 def test_as_query(query_one, query_two, query_three):
     assert query_one.as_query() == {"condition1": "value1"}
+
+
+def test_equal_queries(query_one, query_two):
+    same = DetaQuery(condition="condition1", value="value1")
+
+    assert query_one == same
+    assert hash(query_one) == hash(same)
+    assert query_one != query_two
+    assert query_one != {"condition1": "value1"}
+
+
+def test_canonical_is_hashable():
+    query = DetaQuery(condition="ships?contains", value=["Enterprise", "Defiant"])
+
+    assert query.canonical() == frozenset(
+        [("ships?contains", ("Enterprise", "Defiant"))]
+    )
+    assert {query: "cached"}[
+        DetaQuery(condition="ships?contains", value=["Enterprise", "Defiant"])
+    ] == "cached"
+
+
+def test_booleans_and_numbers_are_different_queries():
+    true = DetaQuery(condition="active", value=True)
+    one = DetaQuery(condition="active", value=1)
+
+    assert true != one
+    assert len({true, one}) == 2
+    assert (true & DetaQuery("rank", 1)) != (one & DetaQuery("rank", True))
@@ -50,3 +50,16 @@ def test_as_query(query_one, query_two):
     assert dql.as_query() == ["query_one", "query_two"]
     query_one.as_query.assert_called()
     query_two.as_query.assert_called()
+
+
+def test_equality(query_one, query_two, query_three, query_four):
+    dql1 = DetaQueryList(
+        conditions=[DetaQueryStatement(conditions=[query_one, query_two]), query_three]
+    )
+    dql2 = DetaQueryList(
+        conditions=[DetaQueryStatement(conditions=[query_two, query_one]), query_three]
+    )
+
+    assert dql1 == dql2
+    assert hash(dql1) == hash(dql2)
+    assert dql1 != DetaQueryList(conditions=[query_one, query_four])
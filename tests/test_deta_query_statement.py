@@ -64,3 +64,13 @@ def test_as_query(query_one, query_two):
         "condition1": "value1",
         "condition2": "value2",
     }
+
+
+def test_equality_ignores_order(query_one, query_two, query_three):
+    dqs1 = DetaQueryStatement(conditions=[query_one, query_two, query_three])
+    dqs2 = DetaQueryStatement(conditions=[query_three, query_one, query_two])
+
+    assert dqs1 == dqs2
+    assert hash(dqs1) == hash(dqs2)
+    assert dqs1 != DetaQueryStatement(conditions=[query_one, query_two])
+    assert DetaQueryStatement(conditions=[query_one]) == query_one
@@ -4,9 +4,10 @@ from unittest import mock
 
 import pytest
 from pydantic import BaseModel
+from pydantic.fields import SHAPE_LIST, SHAPE_SINGLETON
 
 from odetam.exceptions import InvalidDetaQuery
-from odetam.field import DetaField
+from odetam.field import DetaField, DetaUpdate
 from odetam.query import DetaQuery
 
 
@@ -431,3 +432,63 @@ def test_compare_wrong_type(int_field):
         int_field._check_type([1, 2, 3])
     with pytest.raises(TypeError):
         qe = int_field == "5"
+
+
+def _update_field(name, type_, shape, required=True, allow_none=False):
+    _mock = mock.MagicMock()
+    _mock.name = name
+    _mock.type_ = type_
+    _mock.shape = shape
+    _mock.required = required
+    _mock.allow_none = allow_none
+    return DetaField(_mock)
+
+
+def test_increment():
+    field = _update_field("crew", int, SHAPE_SINGLETON)
+    assert field.increment() == DetaUpdate("crew", "increment", 1)
+    assert field.increment(-2.5) == DetaUpdate("crew", "increment", -2.5)
+    with pytest.raises(TypeError):
+        field.increment("1")
+    with pytest.raises(TypeError):
+        field.increment(True)
+    with pytest.raises(ValueError):
+        field.increment(0)
+    with pytest.raises(ValueError):
+        field.increment(0.0)
+    with pytest.raises(TypeError):
+        _update_field("name", str, SHAPE_SINGLETON).increment()
+    with pytest.raises(TypeError):
+        _update_field("counts", int, SHAPE_LIST).increment()
+
+
+def test_append_and_prepend():
+    field = _update_field("launches", datetime.date, SHAPE_LIST)
+    a_date = datetime.date(2245, 4, 11)
+    assert field.append(a_date) == DetaUpdate("launches", "append", [22450411])
+    assert field.prepend([a_date, a_date]) == DetaUpdate(
+        "launches", "prepend", [22450411, 22450411]
+    )
+    with pytest.raises(TypeError):
+        field.append("2245-04-11")
+    with pytest.raises(TypeError):
+        _update_field("name", str, SHAPE_SINGLETON).append("a")
+
+
+def test_append_models():
+    class Ship(BaseModel):
+        name: str
+
+    field = _update_field("ships", Ship, SHAPE_LIST)
+    assert field.append(Ship(name="Enterprise")) == DetaUpdate(
+        "ships", "append", [{"name": "Enterprise"}]
+    )
+
+
+def test_trim():
+    assert _update_field("rank", str, SHAPE_SINGLETON, required=False).trim() == (
+        DetaUpdate("rank", "trim")
+    )
+    assert _update_field("rank", str, SHAPE_SINGLETON, allow_none=True).trim()
+    with pytest.raises(TypeError):
+        _update_field("name", str, SHAPE_SINGLETON).trim()
@@ -0,0 +1,163 @@
+from unittest import mock
+
+import deta
+import pytest
+
+from odetam import DetaModel, instrumentation
+from odetam.async_model import AsyncDetaModel
+
+
+@pytest.fixture
+def events():
+    received = []
+    instrumentation.add_listener(received.append)
+    yield received
+    instrumentation.remove_listener(received.append)
+
+
+@pytest.fixture
+def Captain(monkeypatch):
+    monkeypatch.setenv("DETA_PROJECT_KEY", "123_123")
+
+    class _Captain(DetaModel):
+        name: str
+        rank: int
+
+    _Captain._db = mock.MagicMock()
+    return _Captain
+
+
+def pages(*pages):
+    responses = []
+    for index, items in enumerate(pages):
+        last = items[-1]["key"] if index < len(pages) - 1 else None
+        responses.append(
+            deta.base.FetchResponse(count=len(items), last=last, items=items)
+        )
+    return responses
+
+
+kirk = {"key": "key1", "name": "James T. Kirk", "rank": 1}
+sisko = {"key": "key2", "name": "Benjamin Sisko", "rank": 2}
+
+
+def test_nothing_timed_without_listeners(Captain):
+    assert instrumentation.start(Captain, "get") is None
+    Captain._db.get.return_value = kirk
+    Captain.get("key1")
+
+
+def test_get_event(Captain, events):
+    Captain._db.get.return_value = kirk
+
+    Captain.get("key1")
+
+    [event] = events
+    assert event.model is Captain
+    assert (event.operation, event.query, event.page, event.items) == (
+        "get",
+        None,
+        None,
+        1,
+    )
+    assert event.network >= 0
+    assert event.validate > 0
+    assert event.duration == event.network + event.deserialize + event.validate
+    assert event.error is None
+
+
+def test_page_events(Captain, events):
+    Captain._db.fetch.side_effect = pages([kirk], [sisko])
+
+    Captain.query(Captain.rank > 0)
+
+    assert [(e.operation, e.page, e.items, e.query) for e in events] == [
+        ("fetch", 0, 1, ("rank?gt",)),
+        ("fetch", 1, 1, ("rank?gt",)),
+        ("decode", None, 2, None),
+    ]
+    assert events[-1].network == 0
+    assert events[-1].validate > 0
+
+
+def test_iterated_pages_include_decoding(Captain, events):
+    Captain._db.fetch.side_effect = pages([kirk], [sisko])
+
+    assert len(Captain.get_all()) == 2
+
+    assert [(e.operation, e.page) for e in events] == [("fetch", 0), ("fetch", 1)]
+    assert all(event.validate > 0 for event in events)
+
+
+def test_query_shape():
+    assert instrumentation.query_shape(None) is None
+    assert instrumentation.query_shape({"rank?gt": 1, "name": "x"}) == (
+        "name",
+        "rank?gt",
+    )
+    assert instrumentation.query_shape([{"name": "x"}, {"rank": 1}]) == (
+        ("name",),
+        ("rank",),
+    )
+
+
+def test_failed_request_reported(Captain, events):
+    Captain._db.delete.side_effect = ConnectionError("lost connection")
+
+    with pytest.raises(ConnectionError):
+        Captain.delete_key("key1")
+
+    [event] = events
+    assert event.operation == "delete"
+    assert isinstance(event.error, ConnectionError)
+
+
+def test_failing_listener_does_not_fail_request(Captain, events, caplog):
+    def _broken(event):
+        raise ValueError
+
+    instrumentation.add_listener(_broken)
+    try:
+        Captain._db.put.side_effect = lambda data: {**data, "key": "key1"}
+        Captain(name="James T. Kirk", rank=1).save()
+    finally:
+        instrumentation.remove_listener(_broken)
+
+    assert [event.operation for event in events] == ["put"]
+    assert "listener failed" in caplog.text
+
+
+def test_remove_unknown_listener():
+    with pytest.raises(ValueError):
+        instrumentation.remove_listener(print)
+
+
+@pytest.mark.asyncio
+async def test_async_events(monkeypatch, events):
+    monkeypatch.setenv("DETA_PROJECT_KEY", "123_123")
+
+    class _Captain(AsyncDetaModel):
+        name: str
+        rank: int
+
+    responses = iter(pages([kirk], [sisko]))
+
+    async def _fetch(*args, limit=None, last=None):
+        return next(responses)
+
+    async def _get(key):
+        return kirk
+
+    _Captain._db = mock.MagicMock()
+    _Captain._db.fetch = _fetch
+    _Captain._db.get = _get
+
+    await _Captain.get("key1")
+    assert len(await _Captain.get_all()) == 2
+
+    assert [(e.operation, e.page, e.items) for e in events] == [
+        ("get", None, 1),
+        ("fetch", 0, 1),
+        ("fetch", 1, 1),
+    ]
+    assert all(event.validate > 0 for event in events)
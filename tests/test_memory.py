@@ -0,0 +1,249 @@
+import datetime
+from typing import List
+
+import pytest
+
+from odetam import DetaModel, registry
+from odetam.async_model import AsyncDetaModel
+from odetam.exceptions import ItemExists, ItemNotFound, KeyNotFound
+from odetam.memory import MemoryBackend
+from odetam.retry import RetryPolicy
+
+
+@pytest.fixture
+def base():
+    return MemoryBackend().Base("crew")
+
+
+@pytest.fixture
+def crew(base):
+    items = [
+        {"key": "a", "name": "Kirk", "rank": 4, "ships": ["Enterprise"]},
+        {"key": "b", "name": "Spock", "rank": 3, "ships": ["Enterprise"]},
+        {"key": "c", "name": "Sisko", "rank": 4, "ships": ["Defiant", "DS9"]},
+        {"key": "d", "name": "Sulu", "rank": 2.5, "address": {"city": "SF"}},
+        {"key": "e", "name": "Scotty", "rank": True},
+    ]
+    base.put_many(items)
+    return items
+
+
+def keys(response):
+    return [item["key"] for item in response.items]
+
+
+def test_put_and_get_copies(base):
+    item = base.put({"name": "Kirk", "ships": ["Enterprise"]})
+    assert isinstance(item["key"], str) and item["key"]
+
+    found = base.get(item["key"])
+    assert found == item
+    found["ships"].append("Defiant")
+    assert base.get(item["key"])["ships"] == ["Enterprise"]
+    assert base.get("missing") is None
+    assert base.put("plain", "k1") == {"key": "k1", "value": "plain"}
+
+
+def test_put_many_limit(base):
+    with pytest.raises(AssertionError):
+        base.put_many([{"n": i} for i in range(26)])
+    assert len(base.put_many([{"n": i} for i in range(25)])["processed"]["items"]) == 25
+
+
+def test_insert_existing_key(base):
+    base.insert({"name": "Kirk"}, "a")
+    with pytest.raises(ItemExists, match="already exists"):
+        base.insert({"name": "Kirk"}, "a")
+
+
+def test_fetch_pages_with_last(base):
+    base.put_many([{"key": f"k{i:02d}", "n": i} for i in range(20)])
+    base.put_many([{"key": f"k{i:02d}", "n": i} for i in range(20, 30)])
+
+    first = base.fetch({"n?gte": 5}, limit=10)
+    assert keys(first) == [f"k{i:02d}" for i in range(5, 15)]
+    assert first.last == "k14"
+    second = base.fetch({"n?gte": 5}, limit=10, last=first.last)
+    third = base.fetch({"n?gte": 5}, limit=10, last=second.last)
+    assert keys(third) == [f"k{i:02d}" for i in range(25, 30)]
+    assert third.last is None
+
+
+@pytest.mark.parametrize(
+    "query,expected",
+    [
+        (None, ["a", "b", "c", "d", "e"]),
+        ({"rank": 4}, ["a", "c"]),
+        ({"rank": True}, ["e"]),
+        ({"rank?ne": 4}, ["b", "d", "e"]),
+        ({"rank?lt": 4}, ["b", "d"]),
+        ({"rank?gt": 3}, ["a", "c"]),
+        ({"rank?lte": 3}, ["b", "d"]),
+        ({"rank?gte": 3}, ["a", "b", "c"]),
+        ({"rank?r": [2, 3]}, ["b", "d"]),
+        ({"name?pfx": "S"}, ["b", "c", "d", "e"]),
+        ({"name?pfx": "Sc"}, ["e"]),
+        ({"name?contains": "ul"}, ["d"]),
+        ({"ships?contains": "Defiant"}, ["c"]),
+        ({"ships?not_contains": "Enterprise"}, ["c", "d", "e"]),
+        ({"address.city": "SF"}, ["d"]),
+        ({"name?pfx": "S", "rank": 4}, ["c"]),
+        ([{"name": "Kirk"}, {"rank?lt": 3}, {"name": "Kirk"}], ["a", "d"]),
+        ([{"name": "Kirk"}, {"name?pfx": "Sp"}], ["a", "b"]),
+    ],
+)
+def test_operators(base, crew, query, expected):
+    assert keys(base.fetch(query)) == expected
+
+
+def test_indexes_follow_writes(base, crew):
+    assert keys(base.fetch({"name": "Kirk"})) == ["a"]
+    assert keys(base.fetch({"name?pfx": "S"})) == ["b", "c", "d", "e"]
+
+    base.update({"name": "Spock Prime"}, "a")
+    base.delete("c")
+    base.put({"key": "f", "name": "Kirk"})
+
+    assert keys(base.fetch({"name": "Kirk"})) == ["f"]
+    assert keys(base.fetch({"name?pfx": "Sp"})) == ["a", "b"]
+    assert keys(base.fetch({"name?pfx": "S"})) == ["a", "b", "d", "e"]
+
+
+def test_update_utilities(base, crew):
+    base.update(
+        {
+            "rank": base.util.increment(2),
+            "ships": base.util.append("Enterprise-A"),
+            "missions": base.util.prepend(["Khan"]),
+            "name": base.util.trim(),
+            "address.city": "Iowa",
+        },
+        "a",
+    )
+
+    assert base.get("a") == {
+        "key": "a",
+        "rank": 6,
+        "ships": ["Enterprise", "Enterprise-A"],
+        "missions": ["Khan"],
+        "address": {"city": "Iowa"},
+    }
+    with pytest.raises(KeyNotFound, match="not found"):
+        base.update({"rank": 1}, "missing")
+
+
+def test_errors_carry_deta_status(base):
+    base.put({"name": "Kirk"}, "a")
+
+    with pytest.raises(Exception) as exists:
+        base.insert({"name": "Kirk"}, "a")
+    with pytest.raises(ItemNotFound) as missing:
+        base.update({"rank": 1}, "missing")
+
+    assert (exists.value.status, missing.value.status) == (409, 404)
+    policy = RetryPolicy()
+    assert not policy.should_retry(exists.value, 0)
+    assert not policy.should_retry(missing.value, 0)
+
+
+def test_expiry(base):
+    base.put({"name": "Kirk"}, "a", expire_at=datetime.datetime(2000, 1, 1))
+    base.put({"name": "Spock"}, "b", expire_in=300)
+
+    assert base.get("a") is None
+    assert keys(base.fetch()) == ["b"]
+
+
+@pytest.fixture
+def Captain():
+    class _Captain(DetaModel):
+        name: str
+        joined: datetime.date
+        ships: List[str]
+        rank: int = 0
+
+        class Config:
+            backend = "memory"
+
+    return _Captain
+
+
+def test_memory_model(Captain):
+    kirk = Captain(name="Kirk", joined=datetime.date(2252, 1, 1), ships=["Enterprise"])
+    kirk.save()
+    Captain.put_many(
+        [
+            Captain(name=f"Ensign {i}", joined=datetime.date(2260, 1, 1), ships=[])
+            for i in range(60)
+        ]
+    )
+
+    assert Captain.get(kirk.key) == kirk
+    assert Captain.query(Captain.name == "Kirk") == [kirk]
+    assert Captain.query(Captain.joined < datetime.date(2255, 1, 1)) == [kirk]
+    assert Captain.query_count(Captain.name.prefix("Ensign")) == 60
+    assert len(Captain.get_all()) == 61
+
+    Captain.append_by_key(kirk.key, "ships", "Enterprise-A")
+    Captain.increment(kirk.key, "rank", 4)
+    kirk = Captain.get(kirk.key)
+    assert (kirk.ships, kirk.rank) == (["Enterprise", "Enterprise-A"], 4)
+
+    kirk.delete()
+    with pytest.raises(ItemNotFound):
+        Captain.get("missing")
+    assert Captain.query(Captain.name == "Kirk") == []
+
+
+def test_memory_backend_shared_by_name(Captain):
+    Captain(name="Kirk", joined=datetime.date(2252, 1, 1), ships=[]).save()
+
+    class _Other(DetaModel):
+        name: str
+
+        class Config:
+            backend = "memory"
+            table_name = Captain.__db_name__
+
+    assert [other.name for other in _Other.get_all()] == ["Kirk"]
+
+    registry.clear()
+    assert _Other.get_all() == []
+
+
+def test_injected_backend():
+    backend = MemoryBackend()
+
+    class _Captain(DetaModel):
+        name: str
+
+        class Config:
+            table_name = "captain"
+
+    _Captain.Config.backend = backend
+    _Captain(name="Kirk").save()
+
+    assert keys(backend.Base("captain").fetch()) == [_Captain.get_all()[0].key]
+
+
+@pytest.mark.asyncio
+async def test_async_memory_model():
+    backend = MemoryBackend()
+
+    class _Captain(AsyncDetaModel):
+        name: str
+        rank: int
+
+        class Config:
+            table_name = "captain"
+
+    _Captain.Config.backend = backend
+    await _Captain.put_many([_Captain(name=f"Crew {i}", rank=i) for i in range(30)])
+    kirk = _Captain(name="Kirk", rank=99)
+    await kirk.save()
+
+    assert await _Captain.get(kirk.key) == kirk
+    assert len(await _Captain.query(_Captain.rank >= 20)) == 11
+    assert [
+        item["name"] for item in backend.Base("captain").fetch({"rank": 99}).items
+    ] == ["Kirk"]
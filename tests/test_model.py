@@ -1,6 +1,10 @@
 import datetime
+import enum
 import ipaddress
 import os
+import threading
+import time
+import urllib.error
 from typing import List, Optional
 from unittest import mock
 
@@ -9,9 +13,11 @@ import pytest
 from pydantic import EmailStr, Field
 import pydantic
 
-from odetam import DetaModel
-from odetam.exceptions import ItemNotFound, DetaError, InvalidKey
+from odetam import DetaModel, registry, retry
+from odetam.exceptions import ItemNotFound, DetaError, InvalidDetaQuery, InvalidKey
+from odetam.model import DeleteResult
 from odetam.field import DetaField
+from odetam.retry import RetryPolicy
 
 
 @pytest.fixture
@@ -35,6 +41,9 @@ def Captain(monkeypatch):
         joined: datetime.date
         ships: List[str]
 
+        class Config:
+            track_changes = True
+
     _Captain._db = mock.MagicMock()
     return _Captain
 
@@ -508,3 +517,1223 @@ def test_missing_values_deserialize_to_default(WithDefaults):
 def test_missing_values_without_default_error(WithDefaults):
     with pytest.raises(pydantic.error_wrappers.ValidationError):
         WithDefaults._deserialize({})
+
+
+class _Ship(pydantic.BaseModel):
+    name: str
+    registry: str
+
+
+@pytest.fixture
+def Starship(monkeypatch):
+    monkeypatch.setenv("DETA_PROJECT_KEY", "123_123")
+
+    class _Starship(DetaModel):
+        name: str
+        launched: datetime.date
+        shift_start: datetime.time
+        updated: datetime.datetime
+        crew: int
+        decks: List[str]
+        flagship: _Ship
+        escorts: List[_Ship]
+
+        class Config:
+            track_changes = True
+
+    _Starship._db = mock.MagicMock()
+    return _Starship
+
+
+def test_serialize_plan_built_once_per_class(Starship):
+    plan = dict(Starship.__serialize_plan__)
+
+    assert "key" not in plan
+    assert plan["name"] is None
+    assert plan["crew"] is None
+    assert plan["decks"] is None
+    assert plan["launched"] is not None
+    assert plan["flagship"] is plan["escorts"]
+
+
+def test_serialize_matches_pydantic_json(Starship):
+    updated = datetime.datetime(2021, 8, 1, 20, 26, 51, 737609)
+    ship = Starship(
+        name="Enterprise",
+        launched=datetime.date(2245, 4, 11),
+        shift_start=datetime.time(9, 5, 3, 12),
+        updated=updated,
+        crew=430,
+        decks=["Bridge", "Engineering"],
+        flagship={"name": "Enterprise", "registry": "NCC-1701"},
+        escorts=[{"name": "Reliant", "registry": "NCC-1864"}],
+        key="key1",
+    )
+
+    assert ship._serialize() == {
+        "key": "key1",
+        "name": "Enterprise",
+        "launched": 22450411,
+        "shift_start": 90503000012,
+        "updated": updated.timestamp(),
+        "crew": 430,
+        "decks": ["Bridge", "Engineering"],
+        "flagship": {"name": "Enterprise", "registry": "NCC-1701"},
+        "escorts": [{"name": "Reliant", "registry": "NCC-1864"}],
+    }
+    assert ship._serialize(exclude={"key", "escorts"}) == {
+        "name": "Enterprise",
+        "launched": 22450411,
+        "shift_start": 90503000012,
+        "updated": updated.timestamp(),
+        "crew": 430,
+        "decks": ["Bridge", "Engineering"],
+        "flagship": {"name": "Enterprise", "registry": "NCC-1701"},
+    }
+
+
+def test_serialize_skips_empty_key(Basic):
+    assert Basic(name="test", key="")._serialize() == {"name": "test"}
+
+
+def test_trusted_get_skips_validation(Captain):
+    Captain._db.get.return_value = {
+        "name": "Jean-Luc Picard",
+        "joined": 23230101,
+        "ships": ["Enterprise-D"],
+        "key": "key5",
+    }
+    with mock.patch.object(Captain, "parse_obj") as parse_obj:
+        picard = Captain.get("key5", trusted=True)
+
+    parse_obj.assert_not_called()
+    assert isinstance(picard, Captain)
+    assert picard.joined == datetime.date(2323, 1, 1)
+    assert picard.key == "key5"
+
+
+def test_trusted_reads_config(monkeypatch, captains_with_keys_list):
+    monkeypatch.setenv("DETA_PROJECT_KEY", "123_123")
+
+    class TrustedCaptain(DetaModel):
+        name: str
+        joined: datetime.date
+        ships: List[str]
+
+        class Config:
+            trusted_reads = True
+
+    TrustedCaptain._db = mock.MagicMock()
+    TrustedCaptain._db.fetch.return_value = deta.base.FetchResponse(
+        count=2, last=None, items=captains_with_keys_list
+    )
+    with mock.patch.object(TrustedCaptain, "parse_obj") as parse_obj:
+        records = TrustedCaptain.get_all()
+        parse_obj.assert_not_called()
+        assert [record.key for record in records] == ["key1", "key2"]
+
+        TrustedCaptain.get_all(trusted=False)
+        assert parse_obj.call_count == 2
+
+
+def test_trusted_still_validates_complex_fields(Starship):
+    updated = datetime.datetime(2021, 8, 1, 20, 26, 51, 737609)
+    data = {
+        "key": "key1",
+        "name": "Enterprise",
+        "launched": 22450411,
+        "shift_start": 90503000012,
+        "updated": updated.timestamp(),
+        "crew": 430,
+        "decks": ["Bridge"],
+        "flagship": {"name": "Enterprise", "registry": "NCC-1701"},
+        "escorts": [{"name": "Reliant", "registry": "NCC-1864"}],
+    }
+
+    ship = Starship._deserialize(data, trusted=True)
+
+    assert ship == Starship._deserialize(data)
+    assert ship.flagship.registry == "NCC-1701"
+    assert ship.escorts[0].name == "Reliant"
+
+
+def test_trusted_query_and_put_many(Captain, captains, captains_with_keys_list):
+    Captain._db.fetch.return_value = deta.base.FetchResponse(
+        count=1, last=None, items=captains_with_keys_list[1:]
+    )
+    Captain._db.put_many.return_value = {
+        "processed": {"items": captains_with_keys_list}
+    }
+    with mock.patch.object(Captain, "parse_obj") as parse_obj:
+        results = Captain.query(Captain.name == "Benjamin Sisko", trusted=True)
+        saved = Captain.put_many(captains, trusted=True)
+
+    parse_obj.assert_not_called()
+    assert results[0].name == "Benjamin Sisko"
+    assert [captain.key for captain in saved] == ["key1", "key2"]
+
+
+def test_iter_all_fetches_one_page_at_a_time(Captain, make_bunch_of_random_captains):
+    _, _, captain_data_with_keys = make_bunch_of_random_captains(Captain, 6)
+    Captain._db.fetch.side_effect = [
+        deta.base.FetchResponse(count=3, last="key2", items=captain_data_with_keys[:3]),
+        deta.base.FetchResponse(count=3, last=None, items=captain_data_with_keys[3:]),
+    ]
+
+    records = Captain.iter_all()
+    Captain._db.fetch.assert_not_called()
+
+    first_page = [next(records) for _ in range(3)]
+    assert Captain._db.fetch.call_count == 1
+    Captain._db.fetch.assert_called_with()
+
+    second_page = list(records)
+    assert Captain._db.fetch.call_count == 2
+    Captain._db.fetch.assert_called_with(last="key2")
+    assert first_page + second_page == [
+        Captain._deserialize(item) for item in captain_data_with_keys
+    ]
+
+
+def test_iter_query_follows_last(Captain, captains_with_keys_list):
+    Captain._db.fetch.side_effect = [
+        deta.base.FetchResponse(
+            count=1, last="key1", items=captains_with_keys_list[:1]
+        ),
+        deta.base.FetchResponse(count=1, last=None, items=captains_with_keys_list[1:]),
+    ]
+
+    results = list(Captain.iter_query(Captain.name.prefix("B")))
+
+    assert Captain._db.fetch.call_args_list == [
+        mock.call({"name?pfx": "B"}),
+        mock.call({"name?pfx": "B"}, last="key1"),
+    ]
+    assert [result.key for result in results] == ["key1", "key2"]
+
+
+def test_get_all_pages(Captain, captains_with_keys_list):
+    Captain._db.fetch.side_effect = [
+        deta.base.FetchResponse(
+            count=1, last="key1", items=captains_with_keys_list[:1]
+        ),
+        deta.base.FetchResponse(count=1, last=None, items=captains_with_keys_list[1:]),
+    ]
+
+    records = Captain.get_all()
+
+    assert [record.key for record in records] == ["key1", "key2"]
+
+
+def test_put_many_with_workers_uses_a_base_per_thread(
+    Captain, make_bunch_of_random_captains
+):
+    captains, captain_data, _ = make_bunch_of_random_captains(Captain, 130)
+    handles = []
+    in_use = set()
+    lock = threading.Lock()
+
+    def _new_db():
+        db = mock.MagicMock()
+
+        def _put_many(records):
+            with lock:
+                assert id(db) not in in_use
+                in_use.add(id(db))
+            time.sleep(0.001)
+            with lock:
+                in_use.discard(id(db))
+            return {
+                "processed": {
+                    "items": [
+                        {**record, "key": f"key-{record['name']}"} for record in records
+                    ]
+                }
+            }
+
+        db.put_many.side_effect = _put_many
+        with lock:
+            handles.append(db)
+        return db
+
+    Captain._new_db = _new_db
+
+    results = Captain.put_many(captains, max_workers=3)
+
+    Captain._db.put_many.assert_not_called()
+    assert 1 <= len(handles) <= 3
+    assert sum(db.put_many.call_count for db in handles) == 6
+    assert [result.name for result in results] == [
+        captain["name"] for captain in captain_data
+    ]
+    assert all(result.key == f"key-{result.name}" for result in results)
+
+
+def test_thread_pool_handles_are_reused_and_closed(
+    Captain, make_bunch_of_random_captains
+):
+    captains, _, _ = make_bunch_of_random_captains(Captain, 60)
+    handles = []
+
+    def _new_db():
+        db = mock.MagicMock()
+        db.put_many.side_effect = lambda records: {"processed": {"items": records}}
+        handles.append(db)
+        return db
+
+    Captain._new_db = _new_db
+    for _ in range(10):
+        Captain.put_many(captains, max_workers=3)
+
+    assert 1 <= len(handles) <= 3
+    assert registry.spare_count() == len(handles)
+    registry.close_all()
+    assert registry.spare_count() == 0
+    assert all(db.close.call_count == 1 for db in handles)
+
+
+def test_put_many_max_workers_from_config(monkeypatch, make_bunch_of_random_captains):
+    monkeypatch.setenv("DETA_PROJECT_KEY", "123_123")
+
+    class PooledCaptain(DetaModel):
+        name: str
+        joined: datetime.date
+        ships: List[str]
+
+        class Config:
+            max_workers = 2
+
+    captains, _, _ = make_bunch_of_random_captains(PooledCaptain, 60)
+    worker_db = mock.MagicMock()
+    worker_db.put_many.side_effect = lambda records: {"processed": {"items": records}}
+    PooledCaptain._db = mock.MagicMock()
+    PooledCaptain._new_db = lambda: worker_db
+
+    assert len(PooledCaptain.put_many(captains)) == 60
+    assert worker_db.put_many.call_count == 3
+    PooledCaptain._db.put_many.assert_not_called()
+
+
+def test_get_many(Captain, captains_with_keys_list):
+    records = {record["key"]: record for record in captains_with_keys_list}
+    records["key3"] = {"key": "None"}
+    Captain._new_db = lambda: Captain._db
+    Captain._db.get.side_effect = lambda key: records.get(key)
+
+    results = Captain.get_many(["key2", "missing", "key1", "key3", "key2"])
+
+    assert [result and result.key for result in results] == [
+        "key2",
+        None,
+        "key1",
+        None,
+        "key2",
+    ]
+    # duplicate keys are only fetched once
+    assert Captain._db.get.call_count == 4
+
+
+def test_get_many_without_threads(Captain, captains_with_keys_list):
+    Captain._db.get.side_effect = lambda key: captains_with_keys_list[0]
+    Captain._new_db = mock.MagicMock()
+
+    results = Captain.get_many(["key1", "key1"], max_workers=1)
+
+    Captain._new_db.assert_not_called()
+    assert [result.key for result in results] == ["key1", "key1"]
+
+
+def test_get_many_none_key_raises(Captain):
+    with pytest.raises(InvalidKey):
+        Captain.get_many(["key1", None])
+
+
+def test_delete_many_reports_failures(Captain):
+    def _delete(key):
+        if key == "key2":
+            raise ConnectionError("lost connection")
+
+    Captain._new_db = lambda: Captain._db
+    Captain._db.delete.side_effect = _delete
+
+    result = Captain.delete_many(["key1", "key2", "key3", "key1"])
+
+    assert result == DeleteResult(deleted=2, failed=["key2"])
+    assert Captain._db.delete.call_count == 3
+
+
+def test_delete_where_deletes_page_by_page(Captain, captains_with_keys_list):
+    Captain._db.fetch.side_effect = [
+        deta.base.FetchResponse(
+            count=1, last="key1", items=captains_with_keys_list[:1]
+        ),
+        deta.base.FetchResponse(count=1, last=None, items=captains_with_keys_list[1:]),
+    ]
+
+    with mock.patch.object(Captain, "_deserialize") as deserialize:
+        result = Captain.delete_where(Captain.name.prefix("B"), max_workers=1)
+
+    deserialize.assert_not_called()
+    assert result == DeleteResult(deleted=2, failed=[])
+    assert Captain._db.delete.call_args_list == [mock.call("key1"), mock.call("key2")]
+    assert Captain._db.fetch.call_args_list == [
+        mock.call({"name?pfx": "B"}),
+        mock.call({"name?pfx": "B"}, last="key1"),
+    ]
+
+
+def test_query_parallel_or(Captain, captains_with_keys_list):
+    kirk, sisko = captains_with_keys_list
+
+    def _mock_fetch(query, last=None):
+        if query == {"name": "Benjamin Sisko"}:
+            return deta.base.FetchResponse(count=1, last=None, items=[sisko])
+        if last is None:
+            return deta.base.FetchResponse(count=1, last="key1", items=[kirk])
+        return deta.base.FetchResponse(count=1, last=None, items=[sisko])
+
+    Captain._new_db = lambda: Captain._db
+    Captain._db.fetch.side_effect = _mock_fetch
+
+    results = Captain.query(
+        (Captain.name == "Benjamin Sisko") | Captain.ships.contains("Enterprise"),
+        parallel_or=True,
+    )
+
+    assert Captain._db.fetch.call_count == 3
+    assert [result.key for result in results] == ["key1", "key2"]
+
+
+def test_query_parallel_or_single_condition_uses_one_fetch(
+    Captain, captains_with_keys_list
+):
+    Captain._db.fetch.return_value = deta.base.FetchResponse(
+        count=2, last=None, items=captains_with_keys_list
+    )
+
+    results = Captain.query(Captain.name.prefix("B"), parallel_or=True)
+
+    Captain._db.fetch.assert_called_once_with({"name?pfx": "B"})
+    assert len(results) == 2
+
+
+def test_query_limit_stops_fetching(Captain, make_bunch_of_random_captains):
+    _, _, captain_data_with_keys = make_bunch_of_random_captains(Captain, 6)
+    Captain._db.fetch.side_effect = [
+        deta.base.FetchResponse(count=2, last="a", items=captain_data_with_keys[:2]),
+        deta.base.FetchResponse(count=2, last="b", items=captain_data_with_keys[2:4]),
+    ]
+
+    results = Captain.query(Captain.name.prefix("B"), limit=3)
+
+    assert Captain._db.fetch.call_args_list == [
+        mock.call({"name?pfx": "B"}, limit=3),
+        mock.call({"name?pfx": "B"}, limit=1, last="a"),
+    ]
+    assert results == [
+        Captain._deserialize(item) for item in captain_data_with_keys[:3]
+    ]
+
+
+def test_first(Captain, captains_with_keys_list):
+    Captain._db.fetch.return_value = deta.base.FetchResponse(
+        count=1, last="key1", items=captains_with_keys_list[:1]
+    )
+
+    first = Captain.query_first(Captain.name == "James T. Kirk")
+
+    Captain._db.fetch.assert_called_once_with({"name": "James T. Kirk"}, limit=1)
+    assert first.key == "key1"
+
+
+def test_first_no_match(Captain):
+    Captain._db.fetch.return_value = deta.base.FetchResponse(
+        count=0, last=None, items=[]
+    )
+
+    assert Captain.query_first(Captain.name == "Nobody") is None
+
+
+def test_exists(Captain, captains_with_keys_list):
+    Captain._db.fetch.side_effect = [
+        # a page can come back empty with more to fetch
+        deta.base.FetchResponse(count=0, last="key0", items=[]),
+        deta.base.FetchResponse(
+            count=1, last="key1", items=captains_with_keys_list[:1]
+        ),
+    ]
+
+    with mock.patch.object(Captain, "_deserialize") as deserialize:
+        assert Captain.query_exists(Captain.name == "James T. Kirk") is True
+
+    deserialize.assert_not_called()
+    assert Captain._db.fetch.call_args_list == [
+        mock.call({"name": "James T. Kirk"}, limit=1),
+        mock.call({"name": "James T. Kirk"}, limit=1, last="key0"),
+    ]
+
+
+def test_not_exists(Captain):
+    Captain._db.fetch.return_value = deta.base.FetchResponse(
+        count=0, last=None, items=[]
+    )
+
+    assert Captain.query_exists(Captain.name == "Nobody") is False
+
+
+def test_count(Captain, captains_with_keys_list):
+    Captain._db.fetch.side_effect = [
+        deta.base.FetchResponse(
+            count=1, last="key1", items=captains_with_keys_list[:1]
+        ),
+        deta.base.FetchResponse(count=1, last=None, items=captains_with_keys_list[1:]),
+    ]
+
+    with mock.patch.object(Captain, "_deserialize") as deserialize:
+        assert Captain.query_count(Captain.name.prefix("B")) == 2
+
+    deserialize.assert_not_called()
+
+
+def test_query_helpers_leave_common_field_names_free():
+    class Tally(DetaModel):
+        first: str
+        count: int
+        exists: bool
+
+    tally = Tally(first="Kirk", count=3, exists=True)
+    assert (tally.first, tally.count, tally.exists) == ("Kirk", 3, True)
+
+
+def test_batching_leaves_batch_field_name_free():
+    class Shipment(DetaModel):
+        batch: str
+
+    assert Shipment(batch="B-1701").batch == "B-1701"
+
+
+def test_query_with_fields_returns_partial_models(Starship):
+    Starship._db.fetch.return_value = deta.base.FetchResponse(
+        count=1,
+        last=None,
+        items=[
+            {
+                "key": "key1",
+                "name": "Enterprise",
+                "launched": 22450411,
+                "shift_start": 90503000012,
+                "updated": 1627849611.737609,
+                "crew": 430,
+                "decks": ["Bridge"],
+                "flagship": {"name": "Enterprise", "registry": "NCC-1701"},
+                "escorts": [{"name": "Reliant", "registry": "NCC-1864"}],
+            }
+        ],
+    )
+
+    results = Starship.query(Starship.crew > 100, fields=["name", "launched"])
+    everything = Starship.get_all(fields=["name", "launched"])
+
+    ship = results[0]
+    assert ship.dict() == {
+        "key": "key1",
+        "name": "Enterprise",
+        "launched": datetime.date(2245, 4, 11),
+    }
+    assert type(ship).__name__ == "_StarshipProjection"
+    assert type(everything[0]) is type(ship)
+
+
+def test_projection_created_once_per_set_of_fields(Starship):
+    projection = Starship._projection(["name", "flagship"])
+
+    assert Starship._projection(["flagship", "name", "key"]) is projection
+    assert Starship._projection(["name"]) is not projection
+    assert set(projection.__fields__) == {"key", "name", "flagship"}
+
+
+def test_trusted_projection_validates_complex_fields(Starship):
+    projection = Starship._projection(["flagship"])
+
+    ship = projection._deserialize(
+        {"key": "key1", "flagship": {"name": "Enterprise", "registry": "NCC-1701"}},
+        trusted=True,
+    )
+
+    assert ship.flagship.registry == "NCC-1701"
+
+
+def test_projection_keeps_config_and_validators(monkeypatch):
+    monkeypatch.setenv("DETA_PROJECT_KEY", "123_123")
+
+    class Rank(enum.Enum):
+        captain = "captain"
+        admiral = "admiral"
+
+    class _Officer(DetaModel):
+        name: str
+        rank: Rank
+        ships: List[str] = []
+
+        class Config:
+            use_enum_values = True
+            anystr_strip_whitespace = True
+
+        @pydantic.validator("name")
+        def shout(cls, value):
+            return value.upper()
+
+        @pydantic.validator("ships", each_item=True)
+        def registry(cls, value):
+            return f"USS {value}"
+
+    _Officer._db = mock.MagicMock()
+    _Officer._db.fetch.return_value = deta.base.FetchResponse(
+        count=1,
+        last=None,
+        items=[{"key": "key1", "name": "  kirk ", "rank": "captain", "ships": []}],
+    )
+
+    (officer,) = _Officer.get_all()
+    (projected,) = _Officer.get_all(fields=["name", "rank"])
+
+    assert (projected.name, projected.rank) == (officer.name, officer.rank)
+    assert projected.dict() == {"key": "key1", "name": "KIRK", "rank": "captain"}
+
+
+def test_projection_unknown_field(Starship):
+    with pytest.raises(InvalidDetaQuery):
+        Starship.query(Starship.crew > 100, fields=["warp_speed"])
+
+
+@pytest.fixture
+def CachedCaptain(monkeypatch):
+    monkeypatch.setenv("DETA_PROJECT_KEY", "123_123")
+
+    class _CachedCaptain(DetaModel):
+        name: str
+        joined: datetime.date
+        ships: List[str]
+
+        class Config:
+            cache_size = 2
+            cache_ttl = 60
+
+    _CachedCaptain._db = mock.MagicMock()
+    _CachedCaptain._db.get.side_effect = lambda key: {
+        "key": key,
+        "name": "James T. Kirk",
+        "joined": 22520101,
+        "ships": ["Enterprise"],
+    }
+    return _CachedCaptain
+
+
+def test_no_cache_by_default(Captain):
+    assert Captain.__cache__ is None
+    assert Captain.cache_info() is None
+
+
+def test_get_served_from_cache(CachedCaptain):
+    first = CachedCaptain.get("key1")
+    first.ships.append("Enterprise-A")
+    second = CachedCaptain.get("key1")
+    third = CachedCaptain.get_or_none("key1")
+
+    CachedCaptain._db.get.assert_called_once_with("key1")
+    assert second.ships == ["Enterprise"]
+    assert third == second
+    info = CachedCaptain.cache_info()
+    assert (info.hits, info.misses, info.size) == (2, 1, 1)
+    assert info.max_size == 2
+    assert info.ttl == 60
+
+
+def test_cache_does_not_store_missing_items(CachedCaptain):
+    CachedCaptain._db.get.side_effect = None
+    CachedCaptain._db.get.return_value = None
+
+    assert CachedCaptain.get_or_none("key1") is None
+    assert CachedCaptain.get_or_none("key1") is None
+
+    assert CachedCaptain._db.get.call_count == 2
+
+
+def test_cache_invalidated_by_writes(CachedCaptain):
+    CachedCaptain._db.put.side_effect = lambda data: data
+    CachedCaptain._db.put_many.side_effect = lambda records: {
+        "processed": {"items": records}
+    }
+
+    kirk = CachedCaptain.get("key1")
+    kirk.save()
+    CachedCaptain.get("key1")
+    CachedCaptain.put_many([kirk])
+    CachedCaptain.get("key1")
+    CachedCaptain.delete_key("key1")
+    CachedCaptain.get("key1")
+    CachedCaptain.delete_many(["key1"])
+    kirk = CachedCaptain.get("key1")
+    kirk.delete()
+    CachedCaptain.get("key1")
+
+    assert CachedCaptain._db.get.call_count == 6
+    assert CachedCaptain.cache_info().hits == 0
+
+
+def test_cache_invalidated_when_write_fails(CachedCaptain):
+    CachedCaptain._db.put.side_effect = DetaError("failed")
+    kirk = CachedCaptain.get("key1")
+
+    with pytest.raises(DetaError):
+        kirk.save()
+    CachedCaptain.get("key1")
+
+    assert CachedCaptain._db.get.call_count == 2
+
+
+def test_clear_cache(CachedCaptain):
+    CachedCaptain.get("key1")
+    CachedCaptain.clear_cache()
+    CachedCaptain.get("key1")
+
+    assert CachedCaptain._db.get.call_count == 2
+
+
+@pytest.fixture
+def QueryCachedCaptain(monkeypatch, captains_with_keys_list):
+    monkeypatch.setenv("DETA_PROJECT_KEY", "123_123")
+
+    class _QueryCachedCaptain(DetaModel):
+        name: str
+        joined: datetime.date
+        ships: List[str]
+
+        class Config:
+            query_cache_size = 4
+
+    _QueryCachedCaptain._db = mock.MagicMock()
+    _QueryCachedCaptain._db.fetch.return_value = deta.base.FetchResponse(
+        count=2, last=None, items=captains_with_keys_list
+    )
+    return _QueryCachedCaptain
+
+
+def test_no_query_cache_by_default(Captain):
+    assert Captain.__query_cache__ is None
+    assert Captain.query_cache_info() is None
+
+
+def test_query_results_cached_by_canonical_query(QueryCachedCaptain):
+    first = QueryCachedCaptain.query(
+        (QueryCachedCaptain.name == "James T. Kirk")
+        & (QueryCachedCaptain.ships.contains("Enterprise"))
+    )
+    first[0].ships.append("Reliant")
+    second = QueryCachedCaptain.query(
+        (QueryCachedCaptain.ships.contains("Enterprise"))
+        & (QueryCachedCaptain.name == "James T. Kirk")
+    )
+    names = QueryCachedCaptain.query(
+        (QueryCachedCaptain.name == "James T. Kirk")
+        & (QueryCachedCaptain.ships.contains("Enterprise")),
+        fields=["name"],
+    )
+
+    QueryCachedCaptain._db.fetch.assert_called_once()
+    assert second[0].ships == ["Enterprise", "Enterprise-A"]
+    assert [name.dict() for name in names] == [
+        {"key": "key1", "name": "James T. Kirk"},
+        {"key": "key2", "name": "Benjamin Sisko"},
+    ]
+    info = QueryCachedCaptain.query_cache_info()
+    assert (info.hits, info.misses, info.size) == (2, 1, 1)
+
+
+def test_query_cache_keyed_on_limit(QueryCachedCaptain):
+    QueryCachedCaptain.query(QueryCachedCaptain.name.prefix("B"))
+    limited = QueryCachedCaptain.query(QueryCachedCaptain.name.prefix("B"), limit=1)
+
+    assert QueryCachedCaptain._db.fetch.call_count == 2
+    assert len(limited) == 1
+
+
+def test_query_cache_invalidated_by_writes(QueryCachedCaptain):
+    QueryCachedCaptain._db.put.side_effect = lambda data: data
+    generation = QueryCachedCaptain.__write_generation__
+
+    kirk = QueryCachedCaptain.query(QueryCachedCaptain.name.prefix("J"))[0]
+    kirk.save()
+    QueryCachedCaptain.query(QueryCachedCaptain.name.prefix("J"))
+    QueryCachedCaptain.delete_key("key2")
+    QueryCachedCaptain.query(QueryCachedCaptain.name.prefix("J"))
+    QueryCachedCaptain.query(QueryCachedCaptain.name.prefix("J"))
+
+    assert QueryCachedCaptain.__write_generation__ == generation + 2
+    assert QueryCachedCaptain._db.fetch.call_count == 3
+
+
+@pytest.fixture
+def put_many_with_keys():
+    """Mimic Deta's put_many, which gives new items a key"""
+    new_keys = (f"new{i}" for i in range(1000))
+
+    def _put_many(records):
+        return {
+            "processed": {
+                "items": [
+                    {**record, "key": record.get("key") or next(new_keys)}
+                    for record in records
+                ]
+            }
+        }
+
+    return _put_many
+
+
+def test_batch_puts_saves_with_put_many(Captain, put_many_with_keys):
+    Captain._db.put_many.side_effect = put_many_with_keys
+    captains = [
+        Captain(name=f"Captain {i}", joined=datetime.date(2300, 1, 1), ships=[])
+        for i in range(60)
+    ]
+
+    with DetaModel.batching():
+        for captain in captains:
+            captain.save()
+        assert captains[0].key is None
+        Captain._db.put_many.assert_not_called()
+
+    Captain._db.put.assert_not_called()
+    assert [len(call.args[0]) for call in Captain._db.put_many.call_args_list] == [
+        25,
+        25,
+        10,
+    ]
+    assert [captain.key for captain in captains] == [f"new{i}" for i in range(60)]
+
+
+def test_batch_groups_by_model(Captain, Basic, put_many_with_keys):
+    Captain._db.put_many.side_effect = put_many_with_keys
+    Basic._db.put_many.side_effect = put_many_with_keys
+    kirk = Captain(name="James T. Kirk", joined=datetime.date(2252, 1, 1), ships=[])
+    basic = Basic(name="basic")
+
+    with Captain.batching():
+        kirk.save()
+        basic.save()
+        kirk.save()
+
+    Captain._db.put_many.assert_called_once()
+    assert len(Captain._db.put_many.call_args.args[0]) == 1
+    Basic._db.put_many.assert_called_once()
+    assert kirk.key is not None
+    assert basic.key is not None
+
+
+def test_batch_deletes_with_delete_many(Captain, captains):
+    Captain._db.put_many.side_effect = lambda records: {"processed": {"items": records}}
+    Captain._new_db = lambda: Captain._db
+    kirk, sisko = captains[0], captains[1]
+    kirk.key, sisko.key = "key1", "key2"
+
+    with DetaModel.batching():
+        kirk.delete()
+        Captain.delete_key("key3")
+        sisko.save()
+        Captain.delete_key("key2")
+        Captain.delete_key("key4")
+        kirk.key = "key4"
+        kirk.save()
+        Captain._db.delete.assert_not_called()
+
+    Captain._db.put_many.assert_called_once()
+    assert [record["key"] for record in Captain._db.put_many.call_args.args[0]] == [
+        "key4"
+    ]
+    assert sorted(call.args[0] for call in Captain._db.delete.call_args_list) == [
+        "key1",
+        "key2",
+        "key3",
+    ]
+
+
+def test_batch_failed_delete_raises(Captain):
+    Captain._new_db = lambda: Captain._db
+    Captain._db.delete.side_effect = DetaError("failed")
+
+    with pytest.raises(DetaError):
+        with DetaModel.batching():
+            Captain.delete_key("key1")
+
+
+def test_batch_not_sent_when_block_raises(Captain, captains):
+    with pytest.raises(ValueError):
+        with DetaModel.batching():
+            captains[0].save()
+            raise ValueError
+
+    Captain._db.put_many.assert_not_called()
+    Captain._db.put.side_effect = lambda data: {**data, "key": "key1"}
+    captains[0].save()
+    Captain._db.put.assert_called_once()
+
+
+def test_nested_batch_sent_with_outer(Captain, captains, put_many_with_keys):
+    Captain._db.put_many.side_effect = put_many_with_keys
+
+    with DetaModel.batching():
+        with DetaModel.batching():
+            captains[0].save()
+        Captain._db.put_many.assert_not_called()
+        captains[1].save()
+
+    Captain._db.put_many.assert_called_once()
+    assert len(Captain._db.put_many.call_args.args[0]) == 2
+
+
+def test_batch_partial_put_many_raises(Captain, captains):
+    Captain._db.put_many.return_value = {"processed": {"items": []}}
+
+    with pytest.raises(DetaError):
+        with DetaModel.batching():
+            captains[0].save()
+
+
+@pytest.fixture
+def stored_kirk():
+    return {
+        "key": "key1",
+        "name": "James T. Kirk",
+        "joined": 22520101,
+        "ships": ["Enterprise"],
+    }
+
+
+@pytest.mark.parametrize("trusted", [False, True])
+def test_partial_save_sends_changed_fields(Captain, stored_kirk, trusted):
+    Captain._db.get.return_value = stored_kirk
+    kirk = Captain.get("key1", trusted=trusted)
+    assert kirk.changed_fields() == []
+
+    kirk.ships.append("Enterprise-A")
+    kirk.joined = datetime.date(2252, 2, 1)
+    assert kirk.changed_fields() == ["joined", "ships"]
+    kirk.save(partial=True)
+
+    Captain._db.update.assert_called_once_with(
+        {"joined": 22520201, "ships": ["Enterprise", "Enterprise-A"]}, "key1"
+    )
+    Captain._db.put.assert_not_called()
+    assert kirk.changed_fields() == []
+
+
+def test_partial_save_without_changes_sends_nothing(Captain, stored_kirk):
+    Captain._db.get.return_value = stored_kirk
+    kirk = Captain.get("key1")
+
+    kirk.save(partial=True)
+
+    Captain._db.update.assert_not_called()
+    Captain._db.put.assert_not_called()
+
+
+def test_partial_save_of_new_item_puts(Captain):
+    Captain._db.put.side_effect = lambda data: {**data, "key": "key1"}
+    kirk = Captain(name="James T. Kirk", joined=datetime.date(2252, 1, 1), ships=[])
+    assert kirk.changed_fields() == ["name", "joined", "ships"]
+
+    kirk.save(partial=True)
+    kirk.name = "Jim Kirk"
+    kirk.save(partial=True)
+
+    Captain._db.put.assert_called_once()
+    Captain._db.update.assert_called_once_with({"name": "Jim Kirk"}, "key1")
+
+
+def test_full_save_by_default(Captain, stored_kirk):
+    Captain._db.get.return_value = stored_kirk
+    Captain._db.put.side_effect = lambda data: data
+    kirk = Captain.get("key1")
+
+    kirk.name = "Jim Kirk"
+    kirk.save()
+
+    Captain._db.put.assert_called_once()
+    Captain._db.update.assert_not_called()
+
+
+def test_partial_updates_config(monkeypatch, stored_kirk):
+    monkeypatch.setenv("DETA_PROJECT_KEY", "123_123")
+
+    class _Captain(DetaModel):
+        name: str
+        joined: datetime.date
+        ships: List[str]
+
+        class Config:
+            partial_updates = True
+
+    _Captain._db = mock.MagicMock()
+    _Captain._db.get.return_value = stored_kirk
+    _Captain._db.put.side_effect = lambda data: data
+    kirk = _Captain.get("key1")
+    kirk.name = "Jim Kirk"
+
+    kirk.save()
+    kirk.save(partial=False)
+
+    _Captain._db.update.assert_called_once_with({"name": "Jim Kirk"}, "key1")
+    _Captain._db.put.assert_called_once()
+
+
+def test_partial_save_needs_change_tracking(monkeypatch, stored_kirk):
+    monkeypatch.setenv("DETA_PROJECT_KEY", "123_123")
+
+    class _Captain(DetaModel):
+        name: str
+        joined: datetime.date
+        ships: List[str]
+
+    _Captain._db = mock.MagicMock()
+    _Captain._db.get.return_value = stored_kirk
+    kirk = _Captain.get("key1")
+    assert kirk._stored is None
+    kirk.name = "Jim Kirk"
+
+    with pytest.raises(DetaError, match="does not track changes"):
+        kirk.save(partial=True)
+    _Captain._db.put.assert_not_called()
+    _Captain._db.update.assert_not_called()
+    assert _Captain.__track_changes__ is False
+
+
+def test_stored_record_keeps_digests_not_copies(Captain, stored_kirk):
+    Captain._db.get.return_value = stored_kirk
+    kirk = Captain.get("key1")
+
+    assert not isinstance(kirk._stored["ships"], list)
+    assert kirk._stored["ships"] == ["Enterprise"]
+    assert kirk._stored["ships"] != ["Enterprise", "Enterprise-A"]
+
+
+def test_projections_do_not_track_changes(Captain, stored_kirk):
+    Captain._db.fetch.return_value = deta.base.FetchResponse(
+        count=1, last=None, items=[stored_kirk]
+    )
+
+    (kirk,) = Captain.query(Captain.name == "James T. Kirk", fields=["name"])
+
+    assert kirk._stored is None
+
+
+def test_partial_save_nested_model(Starship):
+    Starship._db.get.return_value = {
+        "key": "key1",
+        "name": "Enterprise",
+        "launched": 22450411,
+        "shift_start": 90503000012,
+        "updated": 1627849611.737609,
+        "crew": 430,
+        "decks": ["Bridge"],
+        "flagship": {"name": "Enterprise", "registry": "NCC-1701"},
+        "escorts": [],
+    }
+    ship = Starship.get("key1")
+
+    ship.flagship.registry = "NCC-1701-A"
+    ship.save(partial=True)
+
+    Starship._db.update.assert_called_once_with(
+        {"flagship": {"name": "Enterprise", "registry": "NCC-1701-A"}}, "key1"
+    )
+
+
+@pytest.fixture
+def Officer(monkeypatch):
+    monkeypatch.setenv("DETA_PROJECT_KEY", "123_123")
+
+    class _Officer(DetaModel):
+        name: str
+        commendations: int = 0
+        postings: List[str] = []
+        rank: Optional[str] = None
+
+        class Config:
+            track_changes = True
+
+    _Officer._db = mock.MagicMock()
+    for operation in ("increment", "append", "prepend", "trim"):
+        getattr(_Officer._db.util, operation).side_effect = (
+            lambda *args, operation=operation: (operation, *args)
+        )
+    return _Officer
+
+
+def test_atomic_update_helpers_leave_list_field_names_free():
+    class Checklist(DetaModel):
+        append: List[str]
+        prepend: List[str]
+        trim: Optional[str] = None
+
+    checklist = Checklist(append=["a"], prepend=["b"])
+    assert (checklist.append, checklist.prepend, checklist.trim) == (["a"], ["b"], None)
+
+
+def test_atomic_updates_by_key(Officer):
+    Officer.increment("key1", "commendations")
+    Officer.increment("key1", Officer.commendations, -2)
+    Officer.append_by_key("key1", "postings", "Enterprise")
+    Officer.prepend_by_key("key1", "postings", ["Farragut"])
+    Officer.trim_by_key("key1", "rank")
+
+    assert Officer._db.update.call_args_list == [
+        mock.call({"commendations": ("increment", 1)}, "key1"),
+        mock.call({"commendations": ("increment", -2)}, "key1"),
+        mock.call({"postings": ("append", ["Enterprise"])}, "key1"),
+        mock.call({"postings": ("prepend", ["Farragut"])}, "key1"),
+        mock.call({"rank": ("trim",)}, "key1"),
+    ]
+    Officer._db.get.assert_not_called()
+    Officer._db.put.assert_not_called()
+
+
+def test_atomic_update_invalid(Officer):
+    with pytest.raises(DetaError):
+        Officer.increment("key1", "missing")
+    with pytest.raises(DetaError):
+        Officer.trim_by_key("key1", "key")
+    with pytest.raises(TypeError):
+        Officer.increment("key1", "name")
+    with pytest.raises(TypeError):
+        Officer.append_by_key("key1", "name", "Spock")
+    with pytest.raises(TypeError):
+        Officer.trim_by_key("key1", "name")
+    with pytest.raises(ValueError):
+        Officer.increment("key1", "commendations", 0)
+    Officer._db.update.assert_not_called()
+
+
+def test_atomic_updates_on_instance(Officer):
+    Officer._db.get.return_value = {
+        "key": "key1",
+        "name": "Spock",
+        "commendations": 3,
+        "postings": ["Enterprise"],
+        "rank": "Commander",
+    }
+    spock = Officer.get("key1")
+
+    spock.increment_field("commendations", 2)
+    spock.append_to("postings", ["Enterprise-A"])
+    spock.prepend_to(Officer.postings, "Farragut")
+    spock.trim_field("rank")
+
+    assert spock.commendations == 5
+    assert spock.postings == ["Farragut", "Enterprise", "Enterprise-A"]
+    assert spock.rank is None
+    assert spock.changed_fields() == []
+    assert Officer._db.update.call_count == 4
+
+
+def test_atomic_update_on_instance_without_key(Officer):
+    spock = Officer(name="Spock")
+    with pytest.raises(DetaError):
+        spock.increment_field("commendations")
+    Officer._db.update.assert_not_called()
+
+
+def test_atomic_update_invalidates_cache(monkeypatch):
+    monkeypatch.setenv("DETA_PROJECT_KEY", "123_123")
+
+    class _Counter(DetaModel):
+        visits: int = 0
+
+        class Config:
+            cache_size = 8
+
+    _Counter._db = mock.MagicMock()
+    _Counter._db.get.return_value = {"key": "key1", "visits": 1}
+    _Counter.get("key1")
+
+    _Counter.increment("key1", "visits")
+    _Counter.get("key1")
+
+    assert _Counter._db.get.call_count == 2
+
+
+@pytest.fixture
+def RetryingCaptain(monkeypatch):
+    monkeypatch.setenv("DETA_PROJECT_KEY", "123_123")
+
+    class _Captain(DetaModel):
+        name: str
+        joined: datetime.date
+        ships: List[str]
+
+        class Config:
+            retry = RetryPolicy(base_delay=0)
+
+    _Captain._db = mock.MagicMock()
+    return _Captain
+
+
+def test_query_retries_page_from_last(RetryingCaptain, captains_with_keys_list):
+    pages = {
+        None: deta.base.FetchResponse(
+            count=1, last="key1", items=captains_with_keys_list[:1]
+        ),
+        "key1": deta.base.FetchResponse(
+            count=1, last=None, items=captains_with_keys_list[1:2]
+        ),
+    }
+    failures = [urllib.error.HTTPError("", 429, "", {}, None)]
+
+    def _fetch(*args, limit=None, last=None):
+        if last == "key1" and failures:
+            raise failures.pop()
+        return pages[last]
+
+    RetryingCaptain._db.fetch.side_effect = _fetch
+
+    assert len(RetryingCaptain.get_all()) == 2
+    assert [
+        call.kwargs.get("last") for call in RetryingCaptain._db.fetch.mock_calls
+    ] == [
+        None,
+        "key1",
+        "key1",
+    ]
+
+
+def test_new_item_not_put_twice_after_server_error(RetryingCaptain):
+    RetryingCaptain._db.put.side_effect = urllib.error.HTTPError("", 503, "", {}, None)
+    kirk = RetryingCaptain(
+        name="James T. Kirk", joined=datetime.date(2252, 1, 1), ships=[]
+    )
+
+    with pytest.raises(urllib.error.HTTPError):
+        kirk.save()
+
+    RetryingCaptain._db.put.assert_called_once()
+
+
+def test_rate_limit_config(monkeypatch):
+    monkeypatch.setenv("DETA_PROJECT_KEY", "123_123")
+
+    class _Limited(DetaModel):
+        name: str
+
+        class Config:
+            rate_limit = 1
+            rate_burst = 2
+
+    _Limited._db = mock.MagicMock()
+    _Limited._db.get.return_value = {"key": "key1", "name": "Spock"}
+
+    with mock.patch("time.sleep") as sleep:
+        for _ in range(3):
+            _Limited.get("key1")
+
+    sleep.assert_called_once()
+    assert _Limited._limiter() is retry.bucket("123_123", 100)
@@ -0,0 +1,222 @@
+import datetime
+from typing import List
+from unittest import mock
+
+import pytest
+
+from odetam import DetaModel
+from odetam.memory import matches
+from odetam.optimizer import optimize
+from odetam.query import DetaQuery, DetaQueryList, DetaQueryStatement
+
+
+@pytest.fixture
+def Ship(monkeypatch):
+    monkeypatch.setenv("DETA_PROJECT_KEY", "123_123")
+
+    class _Ship(DetaModel):
+        name: str
+        crew: int
+        length: float
+        launched: datetime.date
+        decks: List[str]
+
+    _Ship._db = mock.MagicMock()
+    return _Ship
+
+
+def _as_query(query):
+    optimized = optimize(query)
+    return None if optimized is None else optimized.as_query()
+
+
+def test_single_condition_unchanged(Ship):
+    query = Ship.crew > 100
+
+    assert _as_query(query) == {"crew?gt": 100}
+    assert optimize(query) is not query
+
+
+def test_tightest_bounds_kept(Ship):
+    assert _as_query((Ship.crew > 100) & (Ship.crew > 5) & (Ship.crew < 500)) == {
+        "crew?gt": 100,
+        "crew?lt": 500,
+    }
+    assert _as_query((Ship.crew >= 100) & (Ship.crew > 100)) == {"crew?gt": 100}
+    assert _as_query((Ship.crew <= 100) & (Ship.crew < 200)) == {"crew?lte": 100}
+
+
+def test_inclusive_bounds_become_range(Ship):
+    assert _as_query((Ship.crew >= 10) & Ship.crew.range(0, 50)) == {"crew?r": [10, 50]}
+    assert _as_query(Ship.crew.range(0, 50) & Ship.crew.range(20, 80)) == {
+        "crew?r": [20, 50]
+    }
+
+
+def test_range_with_exclusive_bound(Ship):
+    assert _as_query(Ship.length.range(1.5, 9.5) & (Ship.length < 5.0)) == {
+        "length?gte": 1.5,
+        "length?lt": 5.0,
+    }
+
+
+def test_range_of_one_value_becomes_equality(Ship):
+    assert _as_query((Ship.crew >= 10) & (Ship.crew <= 10)) == {"crew": 10}
+
+
+def test_dates_merged(Ship):
+    query = (Ship.launched > datetime.date(2245, 1, 1)) & Ship.launched.range(
+        datetime.date(2200, 1, 1), datetime.date(2300, 1, 1)
+    )
+
+    assert _as_query(query) == {"launched?gt": 22450101, "launched?lte": 23000101}
+
+
+@pytest.mark.parametrize(
+    "make_query",
+    [
+        lambda Ship: (Ship.crew == 1) & (Ship.crew == 2),
+        lambda Ship: (Ship.crew > 10) & (Ship.crew < 5),
+        lambda Ship: (Ship.crew > 10) & (Ship.crew <= 10),
+        lambda Ship: Ship.crew.range(0, 5) & Ship.crew.range(6, 10),
+        lambda Ship: (Ship.crew == 20) & Ship.crew.range(0, 10),
+        lambda Ship: (Ship.crew == 20) & (Ship.crew != 20),
+        lambda Ship: Ship.name.prefix("Ent") & Ship.name.prefix("Def"),
+        lambda Ship: Ship.name.prefix("Ent") & (Ship.name == "Defiant"),
+        lambda Ship: ((Ship.crew == 1) & (Ship.crew == 2))
+        | ((Ship.crew > 3) & (Ship.crew < 2)),
+    ],
+)
+def test_impossible_queries(Ship, make_query):
+    assert optimize(make_query(Ship)) is None
+
+
+@pytest.mark.parametrize(
+    "query,expected",
+    [
+        (DetaQuery("crew", True) & DetaQuery("crew?ne", 1), {"crew": True}),
+        (DetaQuery("crew", 1) & DetaQuery("crew?ne", True), {"crew": 1}),
+        (DetaQuery("crew", False) & DetaQuery("crew?ne", 0), {"crew": False}),
+        (DetaQuery("crew", 0) & DetaQuery("crew?ne", False), {"crew": 0}),
+        (
+            DetaQuery("crew", True) & DetaQuery("crew?r", [0, 5]),
+            {"crew": True, "crew?r": [0, 5]},
+        ),
+    ],
+)
+def test_booleans_are_not_numbers(query, expected):
+    # as in Deta, True is not 1 and False is not 0
+    optimized = optimize(query)
+    assert (optimized and optimized.as_query()) == expected
+    for value in (True, 1, False, 0):
+        record = {"crew": value}
+        assert matches(record, query.as_query()) == (
+            optimized is not None and matches(record, optimized.as_query())
+        )
+
+
+def test_equality_makes_other_conditions_redundant(Ship):
+    query = (
+        (Ship.crew == 20)
+        & Ship.crew.range(0, 50)
+        & (Ship.crew != 30)
+        & Ship.name.prefix("Ent")
+        & Ship.name.prefix("Enter")
+        & (Ship.name == "Enterprise")
+    )
+
+    assert _as_query(query) == {"crew": 20, "name": "Enterprise"}
+
+
+def test_longest_prefix_kept(Ship):
+    assert _as_query(Ship.name.prefix("Ent") & Ship.name.prefix("E")) == {
+        "name?pfx": "Ent"
+    }
+
+
+def test_other_conditions_passed_through(Ship):
+    query = Ship.decks.contains("Bridge") & (Ship.crew > 5) & (Ship.name != "Defiant")
+
+    assert _as_query(query) == {
+        "decks?contains": "Bridge",
+        "crew?gt": 5,
+        "name?ne": "Defiant",
+    }
+
+
+def test_duplicate_or_branches_dropped(Ship):
+    query = (
+        (Ship.name == "Enterprise")
+        | (Ship.name == "Defiant")
+        | (Ship.name == "Enterprise")
+        | ((Ship.crew > 5) & (Ship.name == "Defiant"))
+    )
+
+    assert _as_query(query) == [{"name": "Enterprise"}, {"name": "Defiant"}]
+
+
+def test_statements_equal_up_to_order_dropped(Ship):
+    query = ((Ship.crew > 5) & (Ship.name == "Defiant")) | (
+        (Ship.name == "Defiant") & (Ship.crew > 5)
+    )
+
+    assert _as_query(query) == {"crew?gt": 5, "name": "Defiant"}
+
+
+def test_impossible_or_branches_dropped(Ship):
+    query = ((Ship.crew == 1) & (Ship.crew == 2)) | (Ship.name == "Defiant")
+
+    assert isinstance(optimize(query), DetaQuery)
+    assert _as_query(query) == {"name": "Defiant"}
+
+
+def test_nested_lists_flattened():
+    query = DetaQueryList(
+        conditions=[
+            DetaQueryList(conditions=[DetaQuery("a", 1), DetaQuery("a", 2)]),
+            DetaQueryStatement(conditions=[DetaQuery("a", 3), DetaQuery("b?gt", 1)]),
+        ]
+    )
+
+    assert _as_query(query) == [{"a": 1}, {"a": 2}, {"a": 3, "b?gt": 1}]
+
+
+def test_original_query_not_changed(Ship):
+    query = (Ship.crew > 100) & (Ship.crew > 5)
+    optimize(query)
+
+    assert len(query.conditions) == 2
+
+
+def test_model_does_not_fetch_impossible_queries(Ship):
+    impossible = (Ship.crew == 1) & (Ship.crew == 2)
+
+    assert Ship.query(impossible) == []
+    assert list(Ship.iter_query(impossible)) == []
+    assert Ship.query_first(impossible) is None
+    assert Ship.query_exists(impossible) is False
+    assert Ship.query_count(impossible) == 0
+    assert Ship.delete_where(impossible) == (0, [])
+
+    Ship._db.fetch.assert_not_called()
+
+
+def test_model_sends_optimized_query(Ship):
+    Ship._db.fetch.return_value = mock.MagicMock(count=0, last=None, items=[])
+
+    Ship.query((Ship.crew > 100) & (Ship.crew > 5))
+
+    Ship._db.fetch.assert_called_once_with({"crew?gt": 100})
+
+
+def test_optimizer_can_be_turned_off(Ship):
+    class Config:
+        optimize_queries = False
+
+    Ship.Config = Config
+    Ship._db.fetch.return_value = mock.MagicMock(count=0, last=None, items=[])
+
+    Ship.query((Ship.crew > 100) & (Ship.crew > 5))
+
+    # as the query is sent, the last condition on crew?gt wins
+    Ship._db.fetch.assert_called_once_with({"crew?gt": 5})
@@ -0,0 +1,163 @@
+import asyncio
+import threading
+from unittest import mock
+
+import pytest
+
+from odetam import DetaModel, registry
+from odetam.async_model import AsyncDetaModel
+
+
+@pytest.fixture
+def factory():
+    return mock.MagicMock(side_effect=lambda name: mock.MagicMock(name=name))
+
+
+def test_get_base_shared(monkeypatch, factory):
+    monkeypatch.setenv("DETA_PROJECT_KEY", "123_123")
+
+    first = registry.get_base(None, "captains", False, factory)
+    second = registry.get_base("123_123", "captains", False, factory)
+
+    assert first is second
+    factory.assert_called_once_with("captains")
+
+
+def test_get_base_by_project_name_and_async(monkeypatch, factory):
+    monkeypatch.setenv("DETA_PROJECT_KEY", "123_123")
+
+    bases = {
+        registry.get_base(None, "captains", False, factory),
+        registry.get_base(None, "captains", True, factory),
+        registry.get_base("456_456", "captains", False, factory),
+        registry.get_base(None, "ships", False, factory),
+    }
+
+    assert len(bases) == 4
+
+
+def test_get_base_without_project_key_not_registered(monkeypatch, factory):
+    monkeypatch.setenv("DETA_PROJECT_KEY", "")
+
+    registry.get_base(None, "captains", False, factory)
+    registry.get_base(None, "captains", False, factory)
+
+    assert factory.call_count == 2
+
+
+def test_get_base_from_many_threads(monkeypatch):
+    monkeypatch.setenv("DETA_PROJECT_KEY", "123_123")
+    start = threading.Barrier(8)
+    created = []
+
+    def _factory(name):
+        created.append(name)
+        return mock.MagicMock()
+
+    def _get(results):
+        start.wait()
+        results.append(registry.get_base(None, "captains", False, _factory))
+
+    results = []
+    threads = [threading.Thread(target=_get, args=(results,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert created == ["captains"]
+    assert len({id(base) for base in results}) == 1
+
+
+def test_get_deta_shared():
+    assert registry.get_deta("123_123") is registry.get_deta("123_123")
+    assert registry.get_deta("123_123") is not registry.get_deta("456_456")
+
+
+def test_models_share_base(monkeypatch):
+    monkeypatch.setenv("DETA_PROJECT_KEY", "123_123")
+    base_mock = mock.MagicMock()
+    monkeypatch.setattr("odetam.model.Base", base_mock)
+
+    class Captain(DetaModel):
+        name: str
+
+        class Config:
+            table_name = "crew"
+
+    class Officer(DetaModel):
+        name: str
+
+        class Config:
+            table_name = "crew"
+
+    assert Captain.__db__ is Officer.__db__
+    base_mock.assert_called_once_with("crew")
+
+
+def test_models_with_deta_key_share_client(monkeypatch):
+    deta_mock = mock.MagicMock()
+    monkeypatch.setattr("odetam.registry.Deta", deta_mock)
+
+    class Captain(DetaModel):
+        name: str
+
+        class Config:
+            deta_key = "456_456"
+
+    class Ship(DetaModel):
+        name: str
+
+        class Config:
+            deta_key = "456_456"
+
+    Captain.__db__
+    Ship.__db__
+    Captain.__db__
+
+    deta_mock.assert_called_once_with("456_456")
+    assert deta_mock.return_value.Base.call_args_list == [
+        mock.call("captain"),
+        mock.call("ship"),
+    ]
+
+
+def test_close_all_closes_and_unbinds(monkeypatch):
+    monkeypatch.setenv("DETA_PROJECT_KEY", "123_123")
+    base_mock = mock.MagicMock(side_effect=lambda name: mock.MagicMock())
+    monkeypatch.setattr("odetam.model.Base", base_mock)
+
+    class Captain(DetaModel):
+        name: str
+
+    db = Captain.__db__
+    registry.close_all()
+
+    db.close.assert_called_once_with()
+    assert Captain._db is None
+    assert Captain.__db__ is not db
+
+
+@pytest.mark.asyncio
+async def test_aclose_all_closes_async_and_sync(monkeypatch):
+    monkeypatch.setenv("DETA_PROJECT_KEY", "123_123")
+    async_db = mock.MagicMock()
+    async_db.close.return_value = asyncio.sleep(0)
+    monkeypatch.setattr("odetam.async_model.AsyncBase", lambda name: async_db)
+    monkeypatch.setattr("odetam.model.Base", lambda name: mock.MagicMock())
+
+    class Captain(AsyncDetaModel):
+        name: str
+
+    class Ship(DetaModel):
+        name: str
+
+    Captain.__db__
+    sync_db = Ship.__db__
+
+    await registry.aclose_all()
+
+    async_db.close.assert_called_once_with()
+    sync_db.close.assert_called_once_with()
+    assert Captain._db is None
+    assert Ship._db is None
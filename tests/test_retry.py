@@ -0,0 +1,124 @@
+import urllib.error
+from unittest import mock
+
+import pytest
+
+from odetam import retry
+from odetam.retry import RetryPolicy, TokenBucket
+
+
+def http_error(status, retry_after=None):
+    headers = {} if retry_after is None else {"Retry-After": str(retry_after)}
+    return urllib.error.HTTPError("https://database.deta.sh", status, "", headers, None)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_retryable_errors():
+    policy = RetryPolicy()
+    assert policy.should_retry(http_error(429), 0)
+    assert policy.should_retry(http_error(503), 0)
+    assert policy.should_retry(ConnectionResetError(), 0)
+    assert not policy.should_retry(http_error(400), 0)
+    assert not policy.should_retry(ValueError(), 0)
+
+
+def test_non_idempotent_only_retried_when_rate_limited():
+    policy = RetryPolicy()
+    assert policy.should_retry(http_error(429), 0, idempotent=False)
+    assert not policy.should_retry(http_error(503), 0, idempotent=False)
+    assert not policy.should_retry(ConnectionResetError(), 0, idempotent=False)
+
+
+def test_attempts_limit():
+    policy = RetryPolicy(attempts=3)
+    assert policy.should_retry(http_error(429), 1)
+    assert not policy.should_retry(http_error(429), 2)
+
+
+def test_delay_backs_off_with_jitter():
+    policy = RetryPolicy(base_delay=0.5, max_delay=3, random=lambda: 0.5)
+    assert [policy.delay(attempt) for attempt in range(5)] == [
+        0.25,
+        0.5,
+        1.0,
+        1.5,
+        1.5,
+    ]
+    assert RetryPolicy(base_delay=0.5, jitter=False).delay(2) == 2.0
+
+
+def test_delay_honours_retry_after():
+    policy = RetryPolicy(base_delay=0.1, max_delay=5, jitter=False)
+    assert policy.delay(0, http_error(429, retry_after=2)) == 2.0
+    assert policy.delay(0, http_error(429, retry_after=60)) == 5.0
+    assert policy.delay(0, http_error(429, retry_after="soon")) == 0.1
+
+
+def test_token_bucket():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, burst=2, clock=clock)
+
+    assert [bucket.reserve() for _ in range(4)] == [0.0, 0.0, 0.5, 1.0]
+    clock.now = 1.5
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == 0.5
+
+
+def test_bucket_shared_by_project_key():
+    assert retry.bucket("key_a", 5) is retry.bucket("key_a", 10)
+    assert retry.bucket("key_a", 5) is not retry.bucket("key_b", 5)
+    assert retry.bucket("key_a", 10).rate == 5
+
+
+def test_call_retries_then_succeeds():
+    func = mock.Mock(side_effect=[http_error(503), ConnectionResetError(), "ok"])
+    limiter = mock.Mock()
+
+    with mock.patch("time.sleep") as sleep:
+        result = retry.call(
+            func, "arg", policy=RetryPolicy(), limiter=limiter, last="key1"
+        )
+
+    assert result == "ok"
+    assert func.call_args_list == [mock.call("arg", last="key1")] * 3
+    assert limiter.acquire.call_count == 3
+    assert sleep.call_count == 2
+
+
+def test_call_raises_when_exhausted():
+    func = mock.Mock(side_effect=http_error(429))
+
+    with mock.patch("time.sleep"):
+        with pytest.raises(urllib.error.HTTPError):
+            retry.call(func, policy=RetryPolicy(attempts=2))
+
+    assert func.call_count == 2
+
+
+def test_call_without_policy_does_not_retry():
+    func = mock.Mock(side_effect=http_error(503))
+    with pytest.raises(urllib.error.HTTPError):
+        retry.call(func)
+    func.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_call_async_retries():
+    attempts = []
+
+    async def _func(value):
+        attempts.append(value)
+        if len(attempts) < 3:
+            raise http_error(500)
+        return value
+
+    policy = RetryPolicy(base_delay=0)
+    assert await retry.call_async(_func, "ok", policy=policy) == "ok"
+    assert attempts == ["ok"] * 3
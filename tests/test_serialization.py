@@ -0,0 +1,150 @@
+import datetime
+import ipaddress
+import random
+from typing import Any, Dict, List, Optional
+
+import pytest
+import ujson
+from pydantic import EmailStr
+
+from odetam import DetaModel
+from odetam.serialization import (
+    DETA_TYPES,
+    deserialize_date,
+    deserialize_json,
+    deserialize_time,
+    serialize_date,
+    serialize_time,
+)
+
+
+# noinspection PyPep8Naming
+@pytest.fixture
+def Crewman(monkeypatch):
+    monkeypatch.setenv("DETA_PROJECT_KEY", "123_123")
+
+    class _Crewman(DetaModel):
+        name: str
+        email: EmailStr
+        joined: datetime.date
+        birthday: Optional[datetime.date]
+        shift_start: datetime.time
+        updated: datetime.datetime
+        ships: List[str]
+        extra: Dict[str, Any]
+        ips: List[ipaddress.IPv4Address]
+
+    return _Crewman
+
+
+def legacy_decode(cls, data: Dict[str, Any]) -> Dict[str, Any]:
+    """BaseDetaModel._deserialize as it was before deserialize plans, minus the
+    final parse_obj"""
+    as_dict: Dict[str, Any] = {}
+    for field_name, field in cls.__fields__.items():
+        if field_name not in data:
+            continue
+        elif data.get(field_name) is None:
+            as_dict[field_name] = None
+        elif field.type_ in DETA_TYPES:
+            as_dict[field_name] = data[field_name]
+        elif field.type_ == datetime.datetime:
+            as_dict[field_name] = datetime.datetime.fromtimestamp(data[field_name])
+        elif field.type_ == datetime.date:
+            as_dict[field_name] = datetime.datetime.strptime(
+                str(data[field_name]), "%Y%m%d"
+            ).date()
+        elif field.type_ == datetime.time:
+            as_dict[field_name] = datetime.datetime.strptime(
+                str(data[field_name]), "%H%M%S%f"
+            ).time()
+        else:
+            value = data.get(field_name)
+            try:
+                as_dict[field_name] = ujson.loads(value)
+            except (TypeError, ValueError):
+                as_dict[field_name] = value
+    return as_dict
+
+
+def random_record(rng: random.Random, i: int) -> Dict[str, Any]:
+    return {
+        "key": f"key{i}",
+        "name": f"Crewman {i}",
+        "email": f"crewman{i}@example.com",
+        "joined": serialize_date(
+            datetime.date(
+                rng.randint(1000, 9999), rng.randint(1, 12), rng.randint(1, 28)
+            )
+        ),
+        "birthday": None if i % 3 == 0 else 22500101 + i % 28,
+        # the old strptime decoding only round trips two digit hours
+        "shift_start": serialize_time(
+            datetime.time(
+                rng.randint(10, 23),
+                rng.randint(0, 59),
+                rng.randint(0, 59),
+                rng.randint(0, 999999),
+            )
+        ),
+        "updated": 1627849611.737609 + i,
+        "ships": ["Enterprise", f"Runabout {i}"],
+        "extra": {"level": i, "notes": "{}"},
+        "ips": [f"10.0.0.{i % 250 + 1}"],
+    }
+
+
+def test_decode_identical_to_legacy(Crewman):
+    rng = random.Random(1701)
+    for i in range(2000):
+        record = random_record(rng, i)
+        assert Crewman._decode(record) == legacy_decode(Crewman, record)
+
+
+def test_decode_skips_missing_fields(Crewman):
+    assert Crewman._decode({"name": "Data"}) == {"name": "Data"}
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        datetime.time(0, 0, 0),
+        datetime.time(0, 0, 0, 500000),
+        datetime.time(1, 5, 3),
+        datetime.time(2, 15, 0, 12),
+        datetime.time(9, 59, 59, 999999),
+        datetime.time(23, 59, 59, 999999),
+    ],
+)
+def test_time_round_trips_single_digit_hours(value):
+    assert deserialize_time(serialize_time(value)) == value
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        datetime.date(1, 1, 1),
+        datetime.date(999, 12, 31),
+        datetime.date(2252, 1, 1),
+        datetime.date(9999, 12, 31),
+    ],
+)
+def test_date_round_trips(value):
+    assert deserialize_date(serialize_date(value)) == value
+
+
+def test_date_and_time_fall_back_to_strptime_for_non_ints():
+    assert deserialize_date("22520101") == datetime.date(2252, 1, 1)
+    assert deserialize_time("121101000012") == datetime.time(12, 11, 1, 12)
+
+
+def test_invalid_date_raises():
+    with pytest.raises(ValueError):
+        deserialize_date(22521301)
+
+
+def test_deserialize_json_only_loads_strings():
+    assert deserialize_json('{"a": 1}') == {"a": 1}
+    assert deserialize_json("not json") == "not json"
+    assert deserialize_json(["10.0.0.1"]) == ["10.0.0.1"]
+    assert deserialize_json(12) == 12
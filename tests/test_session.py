@@ -0,0 +1,132 @@
+import contextlib
+import json
+from unittest import mock
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from odetam import registry, session
+from odetam.async_model import AsyncDetaModel
+from odetam.exceptions import DetaError
+from odetam.session import AsyncSessionPool
+
+
+class FakeAsyncBase:
+    """Stands in for deta's AsyncBase, which holds its own session"""
+
+    def __init__(self, name, url=None, project_key="123_123"):
+        self.name = name
+        self.url = url
+        self._session = aiohttp.ClientSession(
+            headers={"Content-type": "application/json", "X-API-Key": project_key},
+            json_serialize=json.dumps,
+            raise_for_status=True,
+        )
+
+    async def get(self, key):
+        async with self._session.get(f"{self.url}/items/{key}") as response:
+            return await response.json()
+
+    async def close(self):
+        await self._session.close()
+
+
+@contextlib.asynccontextmanager
+async def serve_items():
+    async def _get_item(request):
+        return web.json_response(
+            {"key": request.match_info["key"], "api_key": request.headers["X-API-Key"]}
+        )
+
+    app = web.Application()
+    app.router.add_get("/items/{key}", _get_item)
+    async with TestServer(app) as test_server:
+        yield str(test_server.make_url(""))
+
+
+def make_captain(monkeypatch, server):
+    monkeypatch.setenv("DETA_PROJECT_KEY", "123_123")
+    monkeypatch.setattr(
+        "odetam.async_model.AsyncBase", lambda name: FakeAsyncBase(name, server)
+    )
+
+    class _Captain(AsyncDetaModel):
+        name: str
+
+    return _Captain
+
+
+@pytest.mark.asyncio
+async def test_pool_binds_existing_and_new_handles(monkeypatch):
+    async with serve_items() as server:
+        await _check_binding(make_captain(monkeypatch, server), server)
+
+
+async def _check_binding(Captain, server):
+    before = Captain.__db__
+    own_session = before._session
+
+    async with AsyncSessionPool(limit=10, keepalive_timeout=60) as pool:
+        assert session.current_pool() is pool
+        assert before._session.connector is pool._connector
+
+        other = session.attach(FakeAsyncBase("ships", server))
+        assert other._session is before._session
+
+        different_project = session.attach(
+            FakeAsyncBase("ships", server, project_key="456_456")
+        )
+        assert different_project._session is not before._session
+        assert await different_project.get("key1") == {
+            "key": "key1",
+            "api_key": "456_456",
+        }
+
+    assert own_session.closed
+    assert before._session.closed
+    assert session.current_pool() is None
+    assert Captain._db is None
+    assert registry.bases(asynchronous=True) == []
+
+
+@pytest.mark.asyncio
+async def test_pool_reuses_connections(monkeypatch):
+    async with serve_items() as server:
+        stats = await _get_keys(make_captain(monkeypatch, server))
+
+    assert stats.limit == 10
+    assert stats.sessions == 1
+    assert stats.requests == 3
+    assert stats.connections_created == 1
+    assert stats.connections_reused == 2
+    assert stats.in_use == 0
+    assert stats.idle == 1
+
+
+async def _get_keys(Captain):
+    async with AsyncSessionPool(limit=10) as pool:
+        for key in ("key1", "key2", "key3"):
+            assert await Captain.__db__.get(key) == {"key": key, "api_key": "123_123"}
+
+        return pool.stats()
+
+
+@pytest.mark.asyncio
+async def test_only_one_pool_open():
+    async with AsyncSessionPool():
+        with pytest.raises(DetaError):
+            await AsyncSessionPool().open()
+
+
+@pytest.mark.asyncio
+async def test_bind_requires_open_pool():
+    with pytest.raises(DetaError):
+        AsyncSessionPool().bind(mock.MagicMock())
+
+
+def test_attach_without_pool_leaves_handle():
+    base = mock.MagicMock()
+
+    assert session.attach(base) is base
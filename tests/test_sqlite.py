@@ -0,0 +1,248 @@
+import datetime
+from typing import List
+
+import pytest
+
+from odetam import DetaModel
+from odetam.async_model import AsyncDetaModel
+from odetam.exceptions import ItemExists, ItemNotFound, KeyNotFound
+from odetam.sqlite import SQLiteBackend, translate
+
+
+@pytest.fixture
+def backend(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "odetam.sqlite3"))
+    yield backend
+    backend.close()
+
+
+@pytest.fixture(params=[False, True], ids=["json", "indexed"])
+def base(request, backend):
+    base = backend.Base("crew")
+    if request.param:
+        base.create_indexes(["name", "rank", "address.city"])
+    return base
+
+
+@pytest.fixture
+def crew(base):
+    items = [
+        {"key": "a", "name": "Kirk", "rank": 4, "ships": ["Enterprise"]},
+        {"key": "b", "name": "Spock", "rank": 3, "ships": ["Enterprise"]},
+        {"key": "c", "name": "Sisko", "rank": 4, "ships": ["Defiant", "DS9"]},
+        {"key": "d", "name": "Sulu", "rank": 2.5, "address": {"city": "SF"}},
+        {"key": "e", "name": "Scotty", "rank": True},
+    ]
+    base.put_many(items)
+    return items
+
+
+def keys(response):
+    return [item["key"] for item in response.items]
+
+
+def query_plan(base, query):
+    table = base._table
+    where, params = translate(query, table.columns)
+    rows = table.backend.connection.execute(
+        f"EXPLAIN QUERY PLAN SELECT key FROM {table.table} WHERE {where}", params
+    ).fetchall()
+    return " ".join(row[-1] for row in rows)
+
+
+@pytest.mark.parametrize(
+    "query,expected",
+    [
+        (None, ["a", "b", "c", "d", "e"]),
+        ({"rank": 4}, ["a", "c"]),
+        ({"rank": True}, ["e"]),
+        ({"rank?ne": 4}, ["b", "d", "e"]),
+        ({"rank?lt": 4}, ["b", "d"]),
+        ({"rank?gt": 3}, ["a", "c"]),
+        ({"rank?lte": 3}, ["b", "d"]),
+        ({"rank?gte": 3}, ["a", "b", "c"]),
+        ({"rank?r": [2, 3]}, ["b", "d"]),
+        ({"rank?gt": "3"}, []),
+        ({"name?pfx": "S"}, ["b", "c", "d", "e"]),
+        ({"name?pfx": "Sc"}, ["e"]),
+        ({"name?contains": "ul"}, ["d"]),
+        ({"ships?contains": "Defiant"}, ["c"]),
+        ({"ships?not_contains": "Enterprise"}, ["c", "d", "e"]),
+        ({"ships": ["Defiant", "DS9"]}, ["c"]),
+        ({"address.city": "SF"}, ["d"]),
+        ({"address.city?ne": "SF"}, ["a", "b", "c", "e"]),
+        ({"key?pfx": "c"}, ["c"]),
+        ({"name?pfx": "S", "rank": 4}, ["c"]),
+        ([{"name": "Kirk"}, {"rank?lt": 3}, {"name": "Kirk"}], ["a", "d"]),
+        ([{"name": "Kirk"}, {"name?pfx": "Sp"}], ["a", "b"]),
+    ],
+)
+def test_operators(base, crew, query, expected):
+    assert keys(base.fetch(query)) == expected
+
+
+def test_indexed_queries_use_the_index(backend):
+    base = backend.Base("crew")
+    assert "USING INDEX" not in query_plan(base, {"name": "Kirk"})
+
+    base.create_indexes(["name", "joined"])
+    assert "crew__idx_name" in query_plan(base, {"name": "Kirk"})
+    assert "crew__idx_name" in query_plan(base, {"name?pfx": "Ki"})
+    assert "crew__idx_joined" in query_plan(base, {"joined?lt": "2255-01-01"})
+    # creating them again is a no-op, even from a fresh connection
+    base.create_indexes(["name"])
+    other = SQLiteBackend(backend.path)
+    other.Base("crew").create_indexes(["name", "joined"])
+    other.close()
+
+
+def test_prefix_before_surrogates(base):
+    base.put_many(
+        [
+            {"key": "a", "name": "x\ud7ff"},
+            {"key": "b", "name": "x\ud7ffy"},
+            {"key": "c", "name": "x\ue000"},
+        ]
+    )
+
+    assert keys(base.fetch({"name?pfx": "x\ud7ff"})) == ["a", "b"]
+
+
+def test_put_get_and_insert(base):
+    item = base.put({"name": "Kirk", "ships": ["Enterprise"]})
+    assert isinstance(item["key"], str) and item["key"]
+    assert base.get(item["key"]) == item
+    assert base.get("missing") is None
+    assert base.put("plain", "k1") == {"key": "k1", "value": "plain"}
+
+    with pytest.raises(ItemExists, match="already exists"):
+        base.insert({"name": "Kirk"}, item["key"])
+    with pytest.raises(AssertionError):
+        base.put_many([{"n": i} for i in range(26)])
+
+
+def test_fetch_pages_with_last(base):
+    base.put_many([{"key": f"k{i:02d}", "n": i} for i in range(20)])
+    base.put_many([{"key": f"k{i:02d}", "n": i} for i in range(20, 30)])
+
+    first = base.fetch({"n?gte": 5}, limit=10)
+    assert keys(first) == [f"k{i:02d}" for i in range(5, 15)]
+    assert first.last == "k14"
+    second = base.fetch({"n?gte": 5}, limit=10, last=first.last)
+    third = base.fetch({"n?gte": 5}, limit=10, last=second.last)
+    assert keys(third) == [f"k{i:02d}" for i in range(25, 30)]
+    assert third.last is None
+
+
+def test_update_utilities(base, crew):
+    base.update(
+        {
+            "rank": base.util.increment(2),
+            "ships": base.util.append("Enterprise-A"),
+            "missions": base.util.prepend(["Khan"]),
+            "name": base.util.trim(),
+            "address.city": "Iowa",
+        },
+        "a",
+    )
+
+    assert base.get("a") == {
+        "key": "a",
+        "rank": 6,
+        "ships": ["Enterprise", "Enterprise-A"],
+        "missions": ["Khan"],
+        "address": {"city": "Iowa"},
+    }
+    assert keys(base.fetch({"address.city": "Iowa"})) == ["a"]
+    with pytest.raises(KeyNotFound, match="not found"):
+        base.update({"rank": 1}, "missing")
+
+
+def test_expiry(base):
+    base.put({"name": "Kirk"}, "a", expire_at=datetime.datetime(2000, 1, 1))
+    base.put({"name": "Spock"}, "b", expire_in=300)
+
+    assert base.get("a") is None
+    assert keys(base.fetch()) == ["b"]
+    base.insert({"name": "Kirk"}, "a")
+
+
+def test_items_persist(backend):
+    backend.Base("crew").put({"name": "Kirk"}, "a")
+    backend.close()
+
+    reopened = SQLiteBackend(backend.path)
+    assert reopened.Base("crew").get("a") == {"key": "a", "name": "Kirk"}
+    reopened.clear()
+    assert reopened.Base("crew").get("a") is None
+    reopened.close()
+
+
+@pytest.fixture
+def Captain(tmp_path, monkeypatch):
+    monkeypatch.setenv("ODETAM_SQLITE_PATH", str(tmp_path / "captains.sqlite3"))
+
+    class _Captain(DetaModel):
+        name: str
+        joined: datetime.date
+        ships: List[str]
+        rank: int = 0
+
+        class Config:
+            backend = "sqlite"
+            indexes = ["name", "joined"]
+
+    return _Captain
+
+
+def test_sqlite_model(Captain):
+    kirk = Captain(name="Kirk", joined=datetime.date(2252, 1, 1), ships=["Enterprise"])
+    kirk.save()
+    Captain.put_many(
+        [
+            Captain(name=f"Ensign {i}", joined=datetime.date(2260, 1, 1), ships=[])
+            for i in range(60)
+        ]
+    )
+
+    assert Captain.get(kirk.key) == kirk
+    assert Captain.query(Captain.name == "Kirk") == [kirk]
+    assert Captain.query(Captain.joined < datetime.date(2255, 1, 1)) == [kirk]
+    assert Captain.query((Captain.name == "Kirk") | (Captain.rank > 0)) == [kirk]
+    assert Captain.query_count(Captain.name.prefix("Ensign")) == 60
+    assert len(Captain.get_all()) == 61
+    assert "idx_joined" in query_plan(
+        Captain.__db__, (Captain.joined < datetime.date(2255, 1, 1)).as_query()
+    )
+
+    Captain.append_by_key(kirk.key, "ships", "Enterprise-A")
+    Captain.increment(kirk.key, "rank", 4)
+    kirk = Captain.get(kirk.key)
+    assert (kirk.ships, kirk.rank) == (["Enterprise", "Enterprise-A"], 4)
+
+    kirk.delete()
+    with pytest.raises(ItemNotFound):
+        Captain.get("missing")
+    assert Captain.query(Captain.name == "Kirk") == []
+
+
+@pytest.mark.asyncio
+async def test_async_sqlite_model(backend):
+    class _Captain(AsyncDetaModel):
+        name: str
+        rank: int
+
+        class Config:
+            table_name = "captain"
+            indexes = ["rank"]
+
+    _Captain.Config.backend = backend
+    await _Captain.put_many([_Captain(name=f"Crew {i}", rank=i) for i in range(30)])
+    kirk = _Captain(name="Kirk", rank=99)
+    await kirk.save()
+
+    assert await _Captain.get(kirk.key) == kirk
+    assert len(await _Captain.query(_Captain.rank >= 20)) == 11
+    assert [
+        item["name"] for item in backend.Base("captain").fetch({"rank": 99}).items
+    ] == ["Kirk"]